@@ -1 +1,5 @@
 # Backend app package
+# Load .env once, before any module reads its settings from the environment
+from dotenv import load_dotenv
+
+load_dotenv()
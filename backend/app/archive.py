@@ -0,0 +1,103 @@
+"""
+Compressed cold archive for old receipts and invoices
+"""
+import json
+import zlib
+from datetime import date, datetime
+from typing import Optional
+from fastapi import Response
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.orm import Session
+from app import dashboard, models
+
+# document type -> (model, number column, challenge foreign key)
+ARCHIVABLE = {
+    models.DocumentType.RECEIPT.value: (models.Receipt, "receipt_number", models.Challenge.receipt_id),
+    models.DocumentType.INVOICE.value: (models.Invoice, "invoice_number", models.Challenge.invoice_id),
+}
+
+# Set on list responses when some of the user's documents are archived
+HORIZON_HEADER = "X-Archived-Until"
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+def pack(document) -> bytes:
+    """Compress every column of a document row"""
+    row = {c.name: getattr(document, c.name) for c in document.__table__.columns}
+    return zlib.compress(json.dumps(row, default=_encode).encode("utf-8"))
+
+def unpack(payload: bytes) -> dict:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+def archive_batch(db: Session, document_type: str, cutoff: datetime, batch_size: int) -> int:
+    """Move up to batch_size documents created before cutoff into the archive"""
+    model, number_column, challenge_fk = ARCHIVABLE[document_type]
+    # Challenged documents stay hot: challenges reference them by id
+    documents = db.query(model).filter(
+        model.created_at < cutoff,
+        ~exists().where(challenge_fk == model.id)
+    ).order_by(model.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not documents:
+        return 0
+    
+    db.execute(insert(models.ArchivedDocument), [
+        {
+            "document_type": document_type,
+            "document_id": document.id,
+            "user_id": document.user_id,
+            "business_id": document.business_id,
+            "number": getattr(document, number_column),
+            "total": document.total,
+            "status": getattr(document, "status", None) or ("voided" if getattr(document, "voided_at", None) else None),
+            "payload": pack(document),
+            "business_logo_url": document.business_logo_url,
+            "created_at": document.created_at,
+        }
+        for document in documents
+    ])
+    db.execute(
+        delete(model).where(model.id.in_([document.id for document in documents])),
+        execution_options={"synchronize_session": False}
+    )
+    # Archived documents leave the lists, so their owners' versions move
+    for user_id in {document.user_id for document in documents}:
+        dashboard.add(db, user_id)
+    db.commit()
+    return len(documents)
+
+def load_document(db: Session, document_type: str, document_id: int, user_id: Optional[int]) -> Optional[dict]:
+    """Return an archived document in response shape, or None if it isn't archived"""
+    query = db.query(models.ArchivedDocument).filter(
+        models.ArchivedDocument.document_type == document_type,
+        models.ArchivedDocument.document_id == document_id
+    )
+    if user_id is not None:
+        # None is only passed for share links, whose signature already proves access
+        query = query.filter(models.ArchivedDocument.user_id == user_id)
+    archived = query.first()
+    if archived is None:
+        return None
+    row = unpack(archived.payload)
+    row["items"] = json.loads(row.pop("items_json"))
+    return row
+
+def horizon(db: Session, user_id: int, *document_types: str) -> Optional[datetime]:
+    """Creation time of the user's newest archived document of these types, or None
+
+    Lists, history, the timeline and change sync only return documents that
+    are still live, so documents created up to this moment may be missing
+    from them (challenged ones are never archived). They can still be fetched
+    by id, one at a time.
+    """
+    Archived = models.ArchivedDocument
+    return db.scalar(
+        select(func.max(Archived.created_at))
+        .where(Archived.user_id == user_id, Archived.document_type.in_(document_types))
+    )
+
+def set_horizon(response: Response, moment: Optional[datetime]) -> None:
+    if moment is not None:
+        response.headers[HORIZON_HEADER] = moment.isoformat()
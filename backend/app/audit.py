@@ -0,0 +1,205 @@
+"""
+Append-only audit log, written in batches by a background thread
+
+Handlers call record() inside their transaction. Events are queued when the
+transaction commits and dropped on rollback; the writer inserts them with
+one multi-row INSERT per batch, so requests never wait on the audit table.
+Jobs that produce more events than the queue holds use insert_now() to write
+them in their own transaction instead.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import event, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+# Events beyond this are dropped (and counted) rather than slowing requests down
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+WRITE_ATTEMPTS = 3
+RETRY_SECONDS = 2.0
+
+_queue: queue.Queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+stats = Counter()
+_stats_lock = threading.Lock()
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        stats[name] += amount
+
+def changes(document, updates: dict) -> dict:
+    """{field: {"from": old, "to": new}} for the updates that change the document"""
+    diff = {}
+    for field, new in updates.items():
+        old = getattr(document, field, None)
+        if old != new:
+            diff[field] = {"from": old, "to": new}
+    return diff
+
+def record(
+    db: Session,
+    business_id: int,
+    actor_id: Optional[int],
+    action: str,
+    document_type: Optional[str] = None,
+    document_id: Optional[int] = None,
+    changes: Optional[dict] = None
+) -> None:
+    """Queue an audit event, written only if the transaction commits"""
+    db.info.setdefault("audit_events", []).append(
+        entry(business_id, actor_id, action, document_type, document_id, changes)
+    )
+
+def entry(
+    business_id: int,
+    actor_id: Optional[int],
+    action: str,
+    document_type: Optional[str] = None,
+    document_id: Optional[int] = None,
+    changes: Optional[dict] = None
+) -> dict:
+    return {
+        "business_id": business_id,
+        "actor_id": actor_id,
+        "action": action,
+        "document_type": document_type,
+        "document_id": document_id,
+        "changes_json": json.dumps(changes, default=str) if changes else None,
+    }
+
+def insert_now(db: Session, entries: list) -> None:
+    """Insert entry() rows in the caller's transaction with one executemany; nothing is dropped"""
+    if not entries:
+        return
+    created_at = datetime.now(timezone.utc)
+    db.execute(insert(models.AuditEvent), [{**row, "created_at": created_at} for row in entries])
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed(session):
+    pending = session.info.pop("audit_events", None)
+    if not pending:
+        return
+    committed_at = datetime.now(timezone.utc)
+    _ensure_started()
+    for entry in pending:
+        entry["created_at"] = committed_at
+        try:
+            _queue.put_nowait(entry)
+        except queue.Full:
+            _count("dropped")
+            logger.warning("Audit queue full, dropped %s", entry["action"])
+    _count("queued", len(pending))
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_audit_events(session, previous_transaction):
+    session.info.pop("audit_events", None)
+
+def write_batch(batch: list) -> None:
+    """Insert a batch, retrying transient failures
+
+    A row the database rejects (a missing business_id, a foreign key to a
+    deleted business) fails the whole INSERT every time, so the batch is
+    split in halves until only that row is left and dropped.
+    """
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            with SessionLocal() as db:
+                db.execute(insert(models.AuditEvent), batch)
+                db.commit()
+            _count("written", len(batch))
+            _count("batches")
+            return
+        except (IntegrityError, DataError):
+            if len(batch) == 1:
+                logger.exception("Audit event %s rejected, dropped", batch[0]["action"])
+                _count("failed")
+                return
+            middle = len(batch) // 2
+            write_batch(batch[:middle])
+            write_batch(batch[middle:])
+            return
+        except Exception:
+            logger.exception("Audit batch of %d failed (attempt %d)", len(batch), attempt)
+            if attempt < WRITE_ATTEMPTS:
+                time.sleep(RETRY_SECONDS * attempt)
+    _count("failed", len(batch))
+
+class AuditWriter(threading.Thread):
+    """Flushes queued events every AUDIT_BATCH_SIZE events or AUDIT_FLUSH_SECONDS"""
+
+    def __init__(self):
+        super().__init__(name="audit-writer", daemon=True)
+        self._stopping = threading.Event()
+
+    def run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                write_batch(batch)
+            elif self._stopping.is_set():
+                return
+
+    def _collect(self) -> list:
+        batch = []
+        deadline = None
+        while len(batch) < AUDIT_BATCH_SIZE:
+            if deadline is None:
+                timeout = AUDIT_FLUSH_SECONDS
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            if self._stopping.is_set():
+                timeout = 0
+            try:
+                batch.append(_queue.get(timeout=timeout) if timeout > 0 else _queue.get_nowait())
+            except queue.Empty:
+                break
+            if deadline is None:
+                # The first event waits at most AUDIT_FLUSH_SECONDS for company
+                deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+        return batch
+
+    def stop(self):
+        self._stopping.set()
+
+_writer: Optional[AuditWriter] = None
+_writer_lock = threading.Lock()
+
+def _ensure_started() -> None:
+    if _writer is None or not _writer.is_alive():
+        start()
+
+def start() -> None:
+    """Start this process's writer; also started by the first committed event"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.is_alive():
+            return
+        _writer = AuditWriter()
+        _writer.start()
+
+def stop(timeout: float = 10.0) -> None:
+    """Flush what is queued and stop the writer"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+        writer.join(timeout)
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return {"queue": _queue.qsize(), **stats}
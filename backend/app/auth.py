@@ -3,17 +3,13 @@ Authentication utilities
 """
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db, pin_key, replica_enabled, SessionLocal
 from app import models
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Security settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -40,19 +36,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    # python-jose loads its crypto backends on import, so defer it off the startup path
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    """Get current authenticated user from JWT token"""
+def token_subject(token: str) -> str:
+    """Return the email a JWT was issued for, or raise 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -60,10 +56,16 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.email == email).first()
+    return email
+
+def ensure_active(user: Optional[models.User]) -> models.User:
+    """Reject unknown or inactive users"""
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     if not user.is_active:
         raise HTTPException(
@@ -72,3 +74,27 @@ def get_current_user(
         )
     
     return user
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Get current authenticated user from JWT token"""
+    email = token_subject(token)
+    user = ensure_active(db.query(models.User).filter(models.User.email == email).first())
+    # Writes committed on this session pin the client to the primary (see get_read_db)
+    db.info["pin_key"] = pin_key(token)
+    return user
+
+def get_current_reader(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_read_db)
+):
+    """Get current user for read-only routes, looked up on the read replica"""
+    email = token_subject(token)
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None and replica_enabled():
+        # A freshly registered account may not have reached the replica yet
+        with SessionLocal() as primary:
+            user = primary.query(models.User).filter(models.User.email == email).first()
+    return ensure_active(user)
@@ -0,0 +1,60 @@
+"""
+Helpers for set-based bulk updates
+"""
+import os
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from app import audit, cache, events, models
+
+MAX_BULK_IDS = int(os.getenv("MAX_BULK_IDS", "1000"))
+# Keeps each event under PostgreSQL's NOTIFY payload limit
+EVENT_IDS_PER_MESSAGE = 500
+
+def check_ids(ids: List[int]) -> None:
+    if not ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must not be empty"
+        )
+    if len(ids) > MAX_BULK_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BULK_IDS} ids can be updated at once"
+        )
+
+def outcomes(db: Session, model, user_id: int, requested: Optional[List[int]], updated: List[int]) -> list:
+    """Per-id results: updated, unchanged (owned but already in that state) or not_found"""
+    updated_set = set(updated)
+    if requested is None:
+        return [{"id": document_id, "outcome": "updated"} for document_id in sorted(updated_set)]
+    remaining = [document_id for document_id in dict.fromkeys(requested) if document_id not in updated_set]
+    owned = set()
+    if remaining:
+        owned = {
+            row.id for row in db.query(model.id).filter(model.user_id == user_id, model.id.in_(remaining))
+        }
+    results = []
+    for document_id in dict.fromkeys(requested):
+        if document_id in updated_set:
+            outcome = "updated"
+        elif document_id in owned:
+            outcome = "unchanged"
+        else:
+            outcome = "not_found"
+        results.append({"id": document_id, "outcome": outcome})
+    return results
+
+def publish(db: Session, user_id: int, document_type: str, event_type: str, ids: List[int], data: dict) -> None:
+    """Invalidate cached renderings and notify the owner once the transaction commits"""
+    events.invalidate_cache(db, [cache.document_tag(document_type, document_id) for document_id in ids])
+    for start in range(0, len(ids), EVENT_IDS_PER_MESSAGE):
+        events.emit(db, user_id, event_type, {"ids": ids[start:start + EVENT_IDS_PER_MESSAGE], **data})
+
+def audit_updates(db: Session, user_id: int, document_type: str, action: str, ids: List[int], changes: Optional[dict] = None) -> None:
+    """One audit event per updated document; the previous values are not known"""
+    if not ids:
+        return
+    business_id = db.query(models.Business.id).filter(models.Business.user_id == user_id).scalar()
+    for document_id in ids:
+        audit.record(db, business_id, user_id, action, document_type, document_id, changes)
@@ -0,0 +1,142 @@
+"""
+In-process LRU caches with tag-based invalidation
+"""
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Iterable, Optional
+
+# Invalidated tags remembered per cache; older ones fall back to a conservative floor
+TAG_CLOCK_ENTRIES = 10000
+
+class LRUCache:
+    """Bounded cache whose entries can be dropped by any of their tags"""
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, tags)
+        self._tagged = defaultdict(set)  # tag -> keys
+        self._lock = threading.Lock()
+        # Logical clock of invalidations, and the clock value at which each tag
+        # was last invalidated, so a value computed before an invalidation of
+        # one of its own tags can be discarded
+        self._clock = 0
+        self._tag_clocks: OrderedDict = OrderedDict()
+        self._clock_floor = 0  # latest clock value forgotten from _tag_clocks
+        self.counters = Counter()
+        _caches.append(self)
+
+    def get(self, key) -> Optional[object]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def peek(self, key) -> Optional[object]:
+        """get() without counting a hit or refreshing the entry's recency"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def begin(self) -> int:
+        """Call before computing a value; pass the result to set() as its generation"""
+        with self._lock:
+            return self._clock
+
+    def set(self, key, value, tags: Iterable[str] = (), generation: Optional[int] = None) -> bool:
+        """Store a value; pass the generation from begin() to skip storing stale data
+
+        The value is stale, and not stored, if any of its tags was invalidated
+        after that generation. Returns whether it was stored.
+        """
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and any(self._invalidated_at(tag) > generation for tag in tags):
+                self.counters["stale"] += 1
+                return False
+            self._remove(key)
+            self._entries[key] = (value, tags)
+            for tag in tags:
+                self._tagged[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+            return True
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        if not tags:
+            return
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._tag_clocks[tag] = self._clock
+                self._tag_clocks.move_to_end(tag)
+                for key in self._tagged.pop(tag, ()):
+                    self._remove(key)
+                    self.counters["invalidations"] += 1
+            while len(self._tag_clocks) > TAG_CLOCK_ENTRIES:
+                _, forgotten = self._tag_clocks.popitem(last=False)
+                self._clock_floor = max(self._clock_floor, forgotten)
+
+    def _invalidated_at(self, tag) -> int:
+        return self._tag_clocks.get(tag, self._clock_floor)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), **self.counters}
+
+_caches = []
+# Stores shared between processes; only the process that commits invalidates them
+_shared_stores = []
+
+def invalidate(tags: Iterable[str]) -> None:
+    """Drop entries with any of these tags from every cache in this process"""
+    tags = list(tags)
+    if not tags:
+        return
+    for cache in _caches:
+        cache.invalidate(tags)
+
+def register_shared(store) -> None:
+    _shared_stores.append(store)
+
+def invalidate_shared(tags: Iterable[str]) -> None:
+    """Drop entries with any of these tags from the shared stores"""
+    tags = list(tags)
+    if not tags:
+        return
+    for store in _shared_stores:
+        store.invalidate(tags)
+
+def stats() -> dict:
+    return {cache.name: cache.stats() for cache in _caches}
+
+def document_tag(document_type: str, document_id: int) -> str:
+    return f"{document_type}:{document_id}"
+
+def business_tag(business_id: int) -> str:
+    return f"business:{business_id}"
+
+def catalog_tag(business_id: int) -> str:
+    return f"catalog:{business_id}"
@@ -0,0 +1,259 @@
+"""
+Per-business product catalog derived from the line items of receipts and invoices
+"""
+import os
+import heapq
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import cache, events, models
+from app.database import SessionLocal
+
+CATALOG_CACHE_BUSINESSES = int(os.getenv("CATALOG_CACHE_BUSINESSES", "500"))
+# Larger catalog changes drop the cached index instead of patching it
+PATCH_MAX_KEYS = 100
+# Keeps each patch NOTIFY under PostgreSQL's 8000-byte payload limit
+PATCH_MAX_BYTES = 7000
+PATCH_MESSAGE = "catalog.patch"
+
+# Copied from the newest line item that has them
+ITEM_FIELDS = ("name", "description", "last_unit_price")
+
+indexes = cache.LRUCache("catalog_indexes", CATALOG_CACHE_BUSINESSES)
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+def from_items(items: Iterable[dict], used_at: Optional[datetime]) -> List[dict]:
+    """Catalog rows for a document's line items"""
+    rows = []
+    for item in items:
+        name = _clean(item.get("name"))
+        if name is None:
+            continue
+        rows.append({
+            "key": name.lower(),
+            "name": name,
+            "description": _clean(item.get("description")),
+            "last_unit_price": item.get("unit_price"),
+            "usage_count": 1,
+            "last_used_at": used_at,
+        })
+    return rows
+
+def _newer(row: dict, than: dict) -> bool:
+    if than["last_used_at"] is None:
+        return True
+    return row["last_used_at"] is not None and row["last_used_at"] >= than["last_used_at"]
+
+def merge(rows: Iterable[dict]) -> List[dict]:
+    """Combine rows with the same key; one INSERT cannot update a row twice"""
+    merged = {}
+    for row in rows:
+        current = merged.get(row["key"])
+        if current is None:
+            merged[row["key"]] = dict(row)
+            continue
+        newer, older = (row, current) if _newer(row, current) else (current, row)
+        combined = {field: newer[field] if newer[field] is not None else older[field] for field in ITEM_FIELDS}
+        combined.update(
+            key=row["key"],
+            usage_count=current["usage_count"] + row["usage_count"],
+            last_used_at=newer["last_used_at"],
+        )
+        merged[row["key"]] = combined
+    return list(merged.values())
+
+def upsert(db: Session, business_id: int, rows: Iterable[dict], replace_counts: bool = False) -> None:
+    """Insert or update catalog entries and refresh the business's search index on commit
+
+    Counts are added to the stored ones, or replace them when rebuilding from
+    every document (replace_counts). Details from the newer document win.
+    """
+    upsert_many(db, {business_id: rows}, replace_counts)
+
+def upsert_many(db: Session, rows_by_business: Dict[int, Iterable[dict]], replace_counts: bool = False) -> None:
+    """upsert() for many businesses' catalogs in one statement"""
+    rows, keys_by_business = [], {}
+    for business_id, business_rows in rows_by_business.items():
+        merged = merge(business_rows)
+        for row in merged:
+            row["business_id"] = business_id
+        rows.extend(merged)
+        if merged:
+            keys_by_business[business_id] = [row["key"] for row in merged]
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(models.Product)
+    statement = statement.on_conflict_do_update(
+        index_elements=["business_id", "key"],
+        set_=_update_values(statement.excluded, replace_counts)
+    )
+    db.execute(statement, rows)
+    if replace_counts:
+        events.invalidate_cache(db, [cache.catalog_tag(business_id) for business_id in keys_by_business])
+        return
+    rebuild = []
+    for business_id, keys in keys_by_business.items():
+        message = {"type": PATCH_MESSAGE, "business_id": business_id, "keys": keys}
+        if len(keys) > PATCH_MAX_KEYS or len(json.dumps(message)) > PATCH_MAX_BYTES:
+            rebuild.append(cache.catalog_tag(business_id))
+        else:
+            events.broadcast(db, message)
+    events.invalidate_cache(db, rebuild)
+
+def _update_values(excluded, replace_counts: bool) -> dict:
+    Product = models.Product
+
+    newer = or_(Product.last_used_at.is_(None), excluded.last_used_at >= Product.last_used_at)
+    values = {
+        field: case(
+            (and_(newer, getattr(excluded, field).is_not(None)), getattr(excluded, field)),
+            else_=func.coalesce(getattr(Product, field), getattr(excluded, field))
+        )
+        for field in ITEM_FIELDS
+    }
+    values["usage_count"] = (
+        excluded.usage_count if replace_counts else Product.usage_count + excluded.usage_count
+    )
+    values["last_used_at"] = case((newer, excluded.last_used_at), else_=Product.last_used_at)
+    values["updated_at"] = func.now()
+    return values
+
+def search_terms(key: str) -> List[str]:
+    """The name and each of its word suffixes, so "widget" also finds "Blue Widget" """
+    words = key.split()
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+def _rank(product: dict) -> tuple:
+    """Most used first, then most recently used"""
+    return (
+        -product["usage_count"],
+        -(product["last_used_at"].timestamp() if product["last_used_at"] else float("-inf")),
+        product["name"]
+    )
+
+class ProductIndex:
+    """Sorted search terms of one business's catalog, searched by bisection
+
+    Products changed by later documents are marked stale and re-read on the
+    next search, so writes never force a rebuild of the whole index.
+    """
+
+    def __init__(self, products: List[dict]):
+        self.products = {product["key"]: product for product in products}
+        self.entries = sorted(
+            (term, product["key"]) for product in products for term in search_terms(product["key"])
+        )
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        entries = self.entries
+        start = bisect_left(entries, (prefix,))
+        end = bisect_right(entries, (prefix + "\U0010ffff",), lo=start)
+        keys = {key for _, key in entries[start:end]}
+        return heapq.nsmallest(limit, (self.products[key] for key in keys), key=_rank)
+
+    def mark_stale(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._stale.update(keys)
+
+    def take_stale(self) -> set:
+        with self._lock:
+            keys, self._stale = self._stale, set()
+        return keys
+
+    def apply(self, products: List[dict]) -> None:
+        """Replace products with fresher copies read from the catalog"""
+        with self._lock:
+            # Searches run concurrently, so new terms go into a copy that replaces the list
+            entries = None
+            for product in products:
+                current = self.products.get(product["key"])
+                if current is not None and _is_older(product, current):
+                    continue
+                self.products[product["key"]] = product
+                if current is None:
+                    entries = entries or list(self.entries)
+                    for term in search_terms(product["key"]):
+                        insort(entries, (term, product["key"]))
+            if entries is not None:
+                self.entries = entries
+
+def _is_older(product: dict, than: dict) -> bool:
+    # A concurrent refresh may already have applied a later copy
+    return product["updated_at"] is not None and than["updated_at"] is not None and product["updated_at"] < than["updated_at"]
+
+def _load_products(business_id: int, keys: Optional[Iterable[str]] = None) -> List[dict]:
+    # The primary, not the replica: a lagging replica could re-cache a catalog
+    # that a write has just changed
+    with SessionLocal() as db:
+        query = db.query(*models.Product.__table__.columns).filter(models.Product.business_id == business_id)
+        if keys is not None:
+            query = query.filter(models.Product.key.in_(list(keys)))
+        return [row._asdict() for row in query]
+
+_building_lock = threading.Lock()
+# business_id -> sets collecting the keys patched while an index is being built
+_building = defaultdict(list)
+
+def _patched(message: dict) -> None:
+    """Mark products changed in another transaction as stale in the cached index"""
+    business_id, keys = message["business_id"], message["keys"]
+    with _building_lock:
+        for collected in _building.get(business_id, ()):
+            collected.update(keys)
+    index = indexes.peek(business_id)
+    if index is not None:
+        index.mark_stale(keys)
+
+events.register(PATCH_MESSAGE, _patched)
+
+def get_index(business_id: int) -> ProductIndex:
+    """The business's search index, built from the catalog on first use"""
+    index = indexes.get(business_id)
+    if index is not None:
+        stale = index.take_stale()
+        if stale:
+            try:
+                index.apply(_load_products(business_id, stale))
+            except Exception:
+                index.mark_stale(stale)
+                raise
+        return index
+
+    collected = set()
+    with _building_lock:
+        _building[business_id].append(collected)
+    try:
+        generation = indexes.begin()
+        index = ProductIndex(_load_products(business_id))
+        indexes.set(business_id, index, tags=(cache.catalog_tag(business_id),), generation=generation)
+        with _building_lock:
+            # Products patched after the read are re-read on the next search
+            index.mark_stale(collected)
+    finally:
+        with _building_lock:
+            _building[business_id].remove(collected)
+            if not _building[business_id]:
+                del _building[business_id]
+    return index
+
+def suggest(business_id: int, query: str, limit: int) -> List[dict]:
+    prefix = " ".join(query.lower().split())
+    if not prefix:
+        return []
+    return get_index(business_id).search(prefix, limit)
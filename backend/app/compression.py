@@ -0,0 +1,34 @@
+"""
+Gzip for JSON and HTML responses above a size threshold
+"""
+import os
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+# Level 5 compresses JSON nearly as well as 9 at a fraction of the CPU
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+COMPRESSIBLE_TYPES = {"application/json", "text/html", "text/plain", "text/csv"}
+
+class _SelectiveResponder(GZipResponder):
+    async def send_with_gzip(self, message: Message) -> None:
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            # Event streams would sit in the compressor's buffer; ZIPs, PDFs and
+            # byte ranges are sent as they are
+            media_type = Headers(raw=message["headers"]).get("content-type", "").split(";")[0].strip()
+            if media_type not in COMPRESSIBLE_TYPES or message.get("status") == 206:
+                self.content_encoding_set = True
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size: int = GZIP_MINIMUM_SIZE, compresslevel: int = GZIP_LEVEL):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+            responder = _SelectiveResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
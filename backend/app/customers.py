@@ -0,0 +1,112 @@
+"""
+Customer directory derived from the customer fields of receipts and invoices
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import models
+
+# Copied from the newest document that has them
+CONTACT_FIELDS = ("name", "email", "phone", "address", "tax_id", "search_name")
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def from_document(document: dict, used_at: Optional[datetime]) -> Optional[dict]:
+    """Directory row for a document's customer, or None if it names no customer"""
+    name = _clean(document.get("customer_name"))
+    email = _clean(document.get("customer_email"))
+    email = email.lower() if email else None
+    key = email or (name.lower() if name else None)
+    if key is None:
+        return None
+    return {
+        "key": key,
+        "name": name,
+        "email": email,
+        "phone": _clean(document.get("customer_phone")),
+        "address": _clean(document.get("customer_address")),
+        "tax_id": _clean(document.get("customer_tax_id")),
+        "search_name": name.lower() if name else None,
+        "document_count": 1,
+        "last_used_at": used_at,
+    }
+
+def _newer(row: dict, than: dict) -> bool:
+    if than["last_used_at"] is None:
+        return True
+    return row["last_used_at"] is not None and row["last_used_at"] >= than["last_used_at"]
+
+def merge(rows: Iterable[Optional[dict]]) -> List[dict]:
+    """Combine rows with the same key; one INSERT cannot update a row twice"""
+    merged = {}
+    for row in rows:
+        if row is None:
+            continue
+        current = merged.get(row["key"])
+        if current is None:
+            merged[row["key"]] = dict(row)
+            continue
+        newer, older = (row, current) if _newer(row, current) else (current, row)
+        combined = {field: newer[field] if newer[field] is not None else older[field] for field in CONTACT_FIELDS}
+        combined.update(
+            key=row["key"],
+            document_count=current["document_count"] + row["document_count"],
+            last_used_at=newer["last_used_at"],
+        )
+        merged[row["key"]] = combined
+    return list(merged.values())
+
+def upsert(db: Session, user_id: int, rows: Iterable[Optional[dict]], replace_counts: bool = False) -> None:
+    """Insert or update directory entries with multi-row upserts
+
+    Counts are added to the stored ones, or replace them when rebuilding from
+    every document (replace_counts). Contact details from the newer document win.
+    """
+    upsert_many(db, {user_id: rows}, replace_counts)
+
+def upsert_many(db: Session, rows_by_user: Dict[int, Iterable[Optional[dict]]], replace_counts: bool = False) -> None:
+    """upsert() for many users' directories in one statement"""
+    rows = []
+    for user_id, user_rows in rows_by_user.items():
+        for row in merge(user_rows):
+            row["user_id"] = user_id
+            rows.append(row)
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(models.Customer)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "key"],
+        set_=_update_values(statement.excluded, replace_counts)
+    )
+    # executemany: compiled once, and sent as batched multi-row VALUES where the driver allows
+    db.execute(statement, rows)
+
+def _update_values(excluded, replace_counts: bool) -> dict:
+    Customer = models.Customer
+
+    newer = or_(Customer.last_used_at.is_(None), excluded.last_used_at >= Customer.last_used_at)
+    values = {
+        field: case(
+            (and_(newer, getattr(excluded, field).is_not(None)), getattr(excluded, field)),
+            else_=func.coalesce(getattr(Customer, field), getattr(excluded, field))
+        )
+        for field in CONTACT_FIELDS
+    }
+    values["document_count"] = (
+        excluded.document_count if replace_counts else Customer.document_count + excluded.document_count
+    )
+    values["last_used_at"] = case((newer, excluded.last_used_at), else_=Customer.last_used_at)
+    values["updated_at"] = func.now()
+    return values
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,151 @@
+"""
+Per-user dashboard counters, kept current by the routes that change documents
+
+Routes call add() with the change they make inside their transaction. The
+changes are summed per user and written by one upsert just before the
+transaction commits, so each counter row is locked only briefly. Archived
+documents stay counted; voided receipts do not.
+
+The same upsert bumps the user's version (see etags.user_version), so every
+transaction that changes a user's documents calls add(), with no counter
+changes if need be.
+"""
+from typing import Iterable, Optional
+from sqlalchemy import case, event, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import models
+
+COUNTERS = (
+    "receipt_count", "receipt_total",
+    "invoice_count", "invoice_total",
+    "pending_invoice_count", "pending_invoice_total",
+    "open_challenge_count",
+)
+PENDING = "pending"
+# ArchivedDocument.status of receipts that were voided when archived
+VOIDED = "voided"
+
+def add(db: Session, user_id: Optional[int], **deltas) -> None:
+    """Add to a user's counters when the transaction commits"""
+    if user_id is None:
+        return
+    pending = db.info.setdefault("dashboard_deltas", {})
+    counters = pending.setdefault(user_id, dict.fromkeys(COUNTERS, 0))
+    for name, amount in deltas.items():
+        counters[name] += amount
+
+def invoice_deltas(status: Optional[str], total: float, sign: int = 1) -> dict:
+    """Counter changes for adding (sign=1) or removing (sign=-1) an invoice"""
+    pending = sign if status == PENDING else 0
+    return {
+        "invoice_count": sign,
+        "invoice_total": sign * total,
+        "pending_invoice_count": pending,
+        "pending_invoice_total": pending * total,
+    }
+
+def status_deltas(old_status: Optional[str], new_status: Optional[str], total: float) -> dict:
+    """Counter changes for an invoice moving between statuses"""
+    moved = (new_status == PENDING) - (old_status == PENDING)
+    return {"pending_invoice_count": moved, "pending_invoice_total": moved * total}
+
+def add_invoices(db: Session, user_id: int, invoices: Iterable[dict]) -> None:
+    """add() for many new invoices (dicts with status and total)"""
+    for invoice in invoices:
+        add(db, user_id, **invoice_deltas(invoice.get("status"), invoice["total"]))
+
+def _insert(db: Session):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+def upsert(db: Session, rows: list, replace: bool = False) -> None:
+    """Add rows of counter changes to the stored counters and bump the version, or replace the counters"""
+    Stats = models.DashboardStats
+    statement = _insert(db)(Stats)
+    values = {
+        name: getattr(statement.excluded, name) if replace else getattr(Stats, name) + getattr(statement.excluded, name)
+        for name in COUNTERS
+    }
+    if not replace:
+        # Rows are inserted with version 1, so a user's first change moves it off the missing-row 0 too
+        rows = [{**row, "version": 1} for row in rows]
+        values["version"] = Stats.version + 1
+    values["updated_at"] = func.now()
+    db.execute(statement.on_conflict_do_update(index_elements=["user_id"], set_=values), rows)
+
+@event.listens_for(Session, "before_commit")
+def _write_deltas(session):
+    pending = session.info.pop("dashboard_deltas", None)
+    if not pending:
+        return
+    # Always lock rows in the same order, so concurrent writers cannot deadlock
+    upsert(session, [{"user_id": user_id, **counters} for user_id, counters in sorted(pending.items())])
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_deltas(session, previous_transaction):
+    session.info.pop("dashboard_deltas", None)
+
+def recompute(db: Session, user_ids: list) -> None:
+    """Rebuild users' counters from the documents and challenges
+
+    The counter rows are created if missing and locked first. Writers commit
+    their own changes after ours and then add to the rebuilt values, so
+    nothing is lost or counted twice while routes keep running.
+    """
+    db.execute(_insert(db)(models.DashboardStats).on_conflict_do_nothing(), [{"user_id": user_id} for user_id in user_ids])
+    db.execute(
+        select(models.DashboardStats.user_id)
+        .where(models.DashboardStats.user_id.in_(user_ids))
+        .order_by(models.DashboardStats.user_id)
+        .with_for_update()
+    ).all()
+
+    rows = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    Receipt, Invoice = models.Receipt, models.Invoice
+    for user_id, count, total in db.execute(
+        select(Receipt.user_id, func.count(), func.sum(Receipt.total))
+        .where(Receipt.user_id.in_(user_ids), Receipt.voided_at.is_(None))
+        .group_by(Receipt.user_id)
+    ):
+        rows[user_id].update(receipt_count=count, receipt_total=total or 0)
+
+    is_pending = Invoice.status == PENDING
+    for user_id, count, total, pending_count, pending_total in db.execute(
+        select(
+            Invoice.user_id, func.count(), func.sum(Invoice.total),
+            func.sum(case((is_pending, 1), else_=0)), func.sum(case((is_pending, Invoice.total), else_=0))
+        )
+        .where(Invoice.user_id.in_(user_ids))
+        .group_by(Invoice.user_id)
+    ):
+        rows[user_id].update(
+            invoice_count=count, invoice_total=total or 0,
+            pending_invoice_count=pending_count or 0, pending_invoice_total=pending_total or 0
+        )
+
+    Archived = models.ArchivedDocument
+    for user_id, document_type, status, count, total in db.execute(
+        select(Archived.user_id, Archived.document_type, Archived.status, func.count(), func.sum(Archived.total))
+        .where(Archived.user_id.in_(user_ids), or_(Archived.status.is_(None), Archived.status != VOIDED))
+        .group_by(Archived.user_id, Archived.document_type, Archived.status)
+    ):
+        counters = rows[user_id]
+        if document_type == models.DocumentType.RECEIPT.value:
+            counters["receipt_count"] += count
+            counters["receipt_total"] += total or 0
+        else:
+            counters["invoice_count"] += count
+            counters["invoice_total"] += total or 0
+            if status == PENDING:
+                counters["pending_invoice_count"] += count
+                counters["pending_invoice_total"] += total or 0
+
+    Challenge = models.Challenge
+    for user_id, count in db.execute(
+        select(Challenge.user_id, func.count())
+        .where(Challenge.user_id.in_(user_ids), Challenge.status == models.ChallengeStatus.PENDING)
+        .group_by(Challenge.user_id)
+    ):
+        rows[user_id]["open_challenge_count"] = count
+
+    upsert(db, [{"user_id": user_id, **counters} for user_id, counters in rows.items()], replace=True)
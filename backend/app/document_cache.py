@@ -0,0 +1,201 @@
+"""
+Serialized single-document responses, cached in process or in Redis
+
+Entries are keyed by document and carry their owner, which every lookup
+checks. Reads fill the cache only when no newer copy can be there; create
+and update routes overwrite it with the committed document (write-through),
+unless a concurrent update has already stored a later version.
+"""
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Iterable, NamedTuple, Optional
+from fastapi import Response
+from app import cache, etags
+
+logger = logging.getLogger(__name__)
+
+# redis://host:6379/0 (or any Redis-compatible server); unset keeps the cache in process
+DOCUMENT_CACHE_URL = os.getenv("DOCUMENT_CACHE_URL")
+DOCUMENT_CACHE_ENTRIES = int(os.getenv("DOCUMENT_CACHE_ENTRIES", "5000"))
+# Redis only; bounds how long a copy filled from a lagging read can outlive an update
+DOCUMENT_CACHE_TTL = int(os.getenv("DOCUMENT_CACHE_TTL", "300"))
+DOCUMENT_CACHE_PREFIX = "doc:"
+
+class CachedDocument(NamedTuple):
+    owner_id: int
+    etag: str
+    body: bytes  # the JSON response
+    version: float = 0.0  # updated_at (or created_at) as a timestamp
+
+    def encode(self) -> bytes:
+        return b"%d\n%s\n%r\n%s" % (self.owner_id, self.etag.encode("ascii"), self.version, self.body)
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CachedDocument":
+        parts = value.split(b"\n", 3)
+        if len(parts) == 3:
+            # Written before entries carried a version
+            owner_id, etag, body = parts
+            return cls(int(owner_id), etag.decode("ascii"), body)
+        owner_id, etag, version, body = parts
+        return cls(int(owner_id), etag.decode("ascii"), body, float(version))
+
+def replaces(current: Optional[CachedDocument], document: CachedDocument) -> Optional[bool]:
+    """Whether a written-through document may replace the cached one; None when
+    both claim the same version with different content, so neither can be trusted"""
+    if current is None or current.version < document.version:
+        return True
+    if current.version == document.version and current.body != document.body:
+        return None
+    return False
+
+class LocalBackend:
+    """Per-process LRU; invalidated with the other in-process caches"""
+    name = "local"
+
+    def __init__(self, max_entries: int):
+        self.entries = cache.LRUCache("documents", max_entries)
+        self._store_lock = threading.Lock()
+
+    def begin(self) -> int:
+        return self.entries.begin()
+
+    def get(self, key: str) -> Optional[CachedDocument]:
+        return self.entries.get(key)
+
+    def fill(self, key: str, document: CachedDocument, token: int) -> None:
+        self.entries.set(key, document, tags=(key,), generation=token)
+
+    def store(self, key: str, document: CachedDocument) -> None:
+        with self._store_lock:
+            replace = replaces(self.entries.peek(key), document)
+            if replace:
+                self.entries.set(key, document, tags=(key,))
+            elif replace is None:
+                self.entries.invalidate((key,))
+
+    def stats(self) -> dict:
+        return {"entries": self.entries.stats()["entries"]}
+
+# replaces() as one atomic step: KEYS[1] = key, ARGV = encoded document, its version, TTL
+STORE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local version = tonumber(string.match(current, '^[^\\n]*\\n[^\\n]*\\n([^\\n]*)\\n') or '0') or 0
+    local incoming = tonumber(ARGV[2])
+    if version > incoming then
+        return 0
+    end
+    if version == incoming and current ~= ARGV[1] then
+        redis.call('DEL', KEYS[1])
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+class RedisBackend:
+    """Shared by every worker; entries expire after DOCUMENT_CACHE_TTL seconds"""
+    name = "redis"
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Install redis to use DOCUMENT_CACHE_URL")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = ttl
+        self._store = self.client.register_script(STORE_SCRIPT)
+        self.errors = (redis.RedisError,)
+        cache.register_shared(self)
+
+    def begin(self) -> None:
+        return None
+
+    def get(self, key: str) -> Optional[CachedDocument]:
+        value = self.client.get(DOCUMENT_CACHE_PREFIX + key)
+        return CachedDocument.decode(value) if value is not None else None
+
+    def fill(self, key: str, document: CachedDocument, token: None) -> None:
+        # NX: never replace a copy written through by an update
+        self.client.set(DOCUMENT_CACHE_PREFIX + key, document.encode(), ex=self.ttl, nx=True)
+
+    def store(self, key: str, document: CachedDocument) -> None:
+        self._store(keys=[DOCUMENT_CACHE_PREFIX + key], args=[document.encode(), repr(document.version), self.ttl])
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        keys = [DOCUMENT_CACHE_PREFIX + tag for tag in tags]
+        try:
+            self.client.delete(*keys)
+        except self.errors:
+            _count("errors")
+            logger.warning("Could not invalidate %d cached documents", len(keys), exc_info=True)
+
+    def stats(self) -> dict:
+        return {}
+
+def _create_backend():
+    if DOCUMENT_CACHE_URL:
+        return RedisBackend(DOCUMENT_CACHE_URL, DOCUMENT_CACHE_TTL)
+    return LocalBackend(DOCUMENT_CACHE_ENTRIES)
+
+counters = Counter()
+_counters_lock = threading.Lock()
+backend = _create_backend()
+_errors = getattr(backend, "errors", ())
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        counters[name] += 1
+
+def begin():
+    """Call before reading a document from the database; pass the result to fill"""
+    return backend.begin()
+
+def lookup(document_type: str, document_id: int, owner_id: int) -> Optional[CachedDocument]:
+    try:
+        document = backend.get(cache.document_tag(document_type, document_id))
+    except _errors:
+        _count("errors")
+        logger.warning("Document cache lookup failed", exc_info=True)
+        return None
+    if document is None or document.owner_id != owner_id:
+        _count("misses")
+        return None
+    _count("hits")
+    return document
+
+def fill(document_type: str, document_id: int, document: CachedDocument, token) -> None:
+    """Cache a document read from the database, unless it may already be stale"""
+    try:
+        backend.fill(cache.document_tag(document_type, document_id), document, token)
+        _count("fills")
+    except _errors:
+        _count("errors")
+        logger.warning("Document cache fill failed", exc_info=True)
+
+def store(document_type: str, document_id: int, document: CachedDocument) -> None:
+    """Cache a document just committed, replacing any older copy"""
+    try:
+        backend.store(cache.document_tag(document_type, document_id), document)
+        _count("stores")
+    except _errors:
+        _count("errors")
+        logger.warning("Document cache store failed", exc_info=True)
+
+def build(owner_id: int, etag: str, response_object) -> CachedDocument:
+    changed_at = response_object.updated_at or response_object.created_at
+    return CachedDocument(owner_id, etag, response_object.model_dump_json().encode("utf-8"), changed_at.timestamp())
+
+def response(document: CachedDocument) -> Response:
+    reply = Response(content=document.body, media_type="application/json")
+    etags.set_etag(reply, document.etag)
+    return reply
+
+def stats() -> dict:
+    with _counters_lock:
+        counts = dict(counters)
+    return {"backend": backend.name, **backend.stats(), **counts}
@@ -0,0 +1,54 @@
+"""
+ETag and conditional GET helpers
+"""
+import hashlib
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app import models
+
+# Responses are per-user, so only the browser may cache them, and it must
+# revalidate with If-None-Match before reusing a stored copy.
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from the values that identify a representation"""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+def user_version(db: Session, user_id: int) -> int:
+    """The user's change counter, bumped in every transaction that changes their documents
+
+    Read it before the documents it describes: content can then only be newer
+    than the version in its ETag, never older, so a stale copy is never
+    confirmed with a 304. Timestamps cannot do this, since updated_at has
+    second resolution on SQLite and is the transaction start time on PostgreSQL.
+    """
+    return db.scalar(select(models.DashboardStats.version).where(models.DashboardStats.user_id == user_id)) or 0
+
+def document_version(document, version: int) -> tuple:
+    """Return the version parts of a single loaded document, given the user_version() read before it"""
+    return (document.id, version)
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against the current ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes added by proxies still match
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def not_modified_response(etag: str) -> Response:
+    """Build an empty 304 response for an unchanged representation"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+def set_etag(response: Response, etag: str) -> None:
+    """Attach validator headers to a full response"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
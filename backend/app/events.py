@@ -0,0 +1,237 @@
+"""
+Per-user event hub for server-sent event streams, and cross-worker notifications
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from itertools import chain
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app import cache, database, models
+from app.database import engine, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "app_events"
+SUBSCRIBER_QUEUE_SIZE = 100
+LISTEN_POLL_SECONDS = 5.0
+LISTEN_RETRY_SECONDS = 5.0
+# Keeps each invalidation NOTIFY well under PostgreSQL's 8000-byte payload limit
+INVALIDATE_TAGS_PER_NOTIFY = 200
+
+class EventHub:
+    """Fans events out to the stream subscribers connected to this process"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach the event loop that owns the subscriber queues"""
+        self._loop = loop
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def publish(self, message: dict) -> None:
+        """Deliver an event to local subscribers; safe to call from any thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message: dict) -> None:
+        with self._lock:
+            queues = list(self._subscribers.get(message["user_id"], ()))
+        for queue in queues:
+            if queue.full():
+                # A stalled client loses its oldest event instead of holding up the rest
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+hub = EventHub()
+
+def uses_notify(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def emit(db: Session, user_id: int, event_type: str, data: dict) -> None:
+    """Queue an event for the user, delivered only if the transaction commits"""
+    message = {"user_id": user_id, "type": event_type, "data": data}
+    if uses_notify(db):
+        # NOTIFY is transactional: every worker's listener receives it on commit,
+        # and it is discarded on rollback
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": json.dumps(message, default=str)}
+        )
+    else:
+        db.info.setdefault("pending_events", []).append(message)
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    for message in session.info.pop("pending_events", []):
+        hub.publish(message)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_events(session, previous_transaction):
+    session.info.pop("pending_events", None)
+
+def broadcast(db: Session, message: dict) -> None:
+    """Run the handler registered for message["type"] in every worker once the transaction commits"""
+    if uses_notify(db):
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": json.dumps(message)}
+        )
+    else:
+        db.info.setdefault("pending_broadcasts", []).append(message)
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending_broadcasts(session):
+    for message in session.info.pop("pending_broadcasts", []):
+        dispatch(message)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_broadcasts(session, previous_transaction):
+    session.info.pop("pending_broadcasts", None)
+
+def invalidate_cache(db: Session, tags) -> None:
+    """Drop cached entries with any of these tags in every worker once the transaction commits"""
+    tags = sorted(set(tags))
+    if not tags:
+        return
+    db.info.setdefault("cache_tags", set()).update(tags)
+    if uses_notify(db):
+        for start in range(0, len(tags), INVALIDATE_TAGS_PER_NOTIFY):
+            message = {"type": "cache.invalidate", "tags": tags[start:start + INVALIDATE_TAGS_PER_NOTIFY]}
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": NOTIFY_CHANNEL, "payload": json.dumps(message)}
+            )
+
+@event.listens_for(SessionLocal, "after_flush")
+def _invalidate_flushed(session, flush_context):
+    # ORM updates are caught here; bulk UPDATE statements call invalidate_cache themselves
+    tags = set()
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, models.Business):
+            tags.add(cache.business_tag(obj.id))
+        elif isinstance(obj, models.Receipt):
+            tags.add(cache.document_tag(models.DocumentType.RECEIPT.value, obj.id))
+        elif isinstance(obj, models.Invoice):
+            tags.add(cache.document_tag(models.DocumentType.INVOICE.value, obj.id))
+    invalidate_cache(session, tags)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    tags = session.info.pop("cache_tags", ())
+    cache.invalidate(tags)
+    cache.invalidate_shared(tags)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_cache_tags(session, previous_transaction):
+    session.info.pop("cache_tags", None)
+
+@event.listens_for(SessionLocal, "before_commit")
+def _broadcast_primary_pin(session):
+    # Other workers must also route this client to the primary after it writes.
+    # before_commit runs ahead of the final flush, so count pending changes too.
+    wrote = session.info.get("wrote") or session.new or session.dirty or session.deleted
+    if (
+        database.replica_enabled()
+        and wrote
+        and session.info.get("pin_key")
+        and uses_notify(session)
+    ):
+        message = {"type": "primary.pin", "key": session.info["pin_key"]}
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": json.dumps(message)}
+        )
+
+# message type -> handler, for broadcast()
+_handlers = {}
+
+def register(message_type: str, handler) -> None:
+    _handlers[message_type] = handler
+
+def dispatch(message: dict) -> None:
+    """Route a notification received from PostgreSQL"""
+    handler = _handlers.get(message.get("type"))
+    if handler is not None:
+        handler(message)
+    elif message.get("type") == "primary.pin":
+        database.pin_to_primary(message["key"])
+    elif message.get("type") == "cache.invalidate":
+        cache.invalidate(message["tags"])
+    else:
+        hub.publish(message)
+
+class NotificationListener(threading.Thread):
+    """Relays PostgreSQL notifications from every worker into this process"""
+
+    def __init__(self):
+        super().__init__(name="event-listener", daemon=True)
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Event listener connection failed, retrying")
+                self._stopping.wait(LISTEN_RETRY_SECONDS)
+
+    def _listen(self):
+        connection = engine.raw_connection()
+        # Held for the life of the listener, so keep it out of the request pool
+        connection.detach()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            while not self._stopping.is_set():
+                readable, _, _ = select.select([dbapi_connection], [], [], LISTEN_POLL_SECONDS)
+                if not readable:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    dispatch(json.loads(notification.payload))
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopping.set()
+
+_listener = None
+
+def start(loop: asyncio.AbstractEventLoop) -> None:
+    """Bind the hub to the running loop and start cross-worker delivery"""
+    global _listener
+    hub.bind(loop)
+    if engine.dialect.name == "postgresql":
+        _listener = NotificationListener()
+        _listener.start()
+
+def stop() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
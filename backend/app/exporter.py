@@ -0,0 +1,230 @@
+"""
+Bulk PDF export of receipts or invoices into a ZIP file
+
+Documents are read in id order a page at a time, live ones first and then
+archived ones, and rendered by a pool of worker processes. At most MAX_IN_FLIGHT rendered PDFs are held in memory;
+each is written to the ZIP on disk as soon as it is its turn, so memory use
+does not grow with the size of the export. Finished ZIPs are kept for
+EXPORT_RETENTION_HOURS and then deleted by expire_exports().
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app import archive, models, rendering, snapshots
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path("exports")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXPORT_FETCH_SIZE = 200
+MAX_IN_FLIGHT = EXPORT_WORKERS * 4
+EXPORT_RETENTION_HOURS = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+
+# document type -> (model, date column filtered on, number column)
+EXPORTABLE = {
+    models.DocumentType.RECEIPT.value: (models.Receipt, models.Receipt.date, "receipt_number"),
+    models.DocumentType.INVOICE.value: (models.Invoice, models.Invoice.issue_date, "invoice_number"),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared render pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server process can copy held locks
+            _pool = ProcessPoolExecutor(EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+def archive_path(job: models.ExportJob) -> Path:
+    return EXPORT_DIR / f"{job.id}.zip"
+
+def is_expired(job: models.ExportJob) -> bool:
+    if job.status == "expired":
+        return True
+    return job.expires_at is not None and _utc(job.expires_at) <= datetime.now(timezone.utc)
+
+def expire_exports(db: Session, limit: int = 100) -> int:
+    """Delete up to limit ZIPs past their expiry and mark their jobs expired; returns how many"""
+    jobs = db.query(models.ExportJob).filter(
+        models.ExportJob.status == "completed",
+        models.ExportJob.expires_at <= datetime.utcnow()
+    ).order_by(models.ExportJob.expires_at).limit(limit).all()
+    for job in jobs:
+        archive_path(job).unlink(missing_ok=True)
+        job.status = "expired"
+    db.commit()
+    return len(jobs)
+
+def _filtered(db: Session, job: models.ExportJob):
+    model, date_column, _ = EXPORTABLE[job.document_type]
+    query = db.query(model).filter(
+        model.user_id == job.user_id,
+        date_column >= job.start_date,
+        date_column < job.end_date
+    )
+    if model is models.Receipt:
+        query = query.filter(models.Receipt.voided_at.is_(None))
+    return query
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes, archived payloads may carry an offset
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _archived_rows(db: Session, job: models.ExportJob):
+    query = db.query(models.ArchivedDocument).filter(
+        models.ArchivedDocument.user_id == job.user_id,
+        models.ArchivedDocument.document_type == job.document_type
+    )
+    if job.document_type == models.DocumentType.RECEIPT.value:
+        query = query.filter(models.ArchivedDocument.status.is_distinct_from("voided"))
+    return query
+
+def archived_ids(db: Session, job: models.ExportJob) -> List[int]:
+    """Ids of the archived documents in the export's range
+
+    The date filtered on is only stored inside the compressed payload, so
+    every archived document of the user and type is unpacked once, a page
+    at a time.
+    """
+    date_name = EXPORTABLE[job.document_type][1].key
+    start, end = _utc(job.start_date), _utc(job.end_date)
+    ids, last_id = [], 0
+    Archived = models.ArchivedDocument
+    while True:
+        page = _archived_rows(db, job).with_entities(Archived.id, Archived.payload).filter(
+            Archived.id > last_id
+        ).order_by(Archived.id).limit(EXPORT_FETCH_SIZE).all()
+        if not page:
+            return ids
+        last_id = page[-1].id
+        for archived_id, payload in page:
+            value = archive.unpack(payload).get(date_name)
+            if value and start <= _utc(datetime.fromisoformat(value)) < end:
+                ids.append(archived_id)
+
+def iter_documents(db: Session, job: models.ExportJob, archived: List[int]) -> Iterator[dict]:
+    """Yield matching live documents in id order, then the given archived ones, one page per query"""
+    model = EXPORTABLE[job.document_type][0]
+    last_id = 0
+    while True:
+        page = _filtered(db, job).filter(model.id > last_id).order_by(model.id).limit(EXPORT_FETCH_SIZE).all()
+        if not page:
+            break
+        last_id = page[-1].id
+        # Copy the page out first: progress commits expire loaded rows
+        yield from [
+            {
+                **{c.name: getattr(row, c.name) for c in row.__table__.columns},
+                "items": json.loads(row.items_json)
+            }
+            for row in page
+        ]
+    for start in range(0, len(archived), EXPORT_FETCH_SIZE):
+        payloads = db.scalars(
+            select(models.ArchivedDocument.payload)
+            .where(models.ArchivedDocument.id.in_(archived[start:start + EXPORT_FETCH_SIZE]))
+            .order_by(models.ArchivedDocument.id)
+        ).all()
+        for payload in payloads:
+            # The same shape the live rows take above
+            row = archive.unpack(payload)
+            row["items"] = json.loads(row.pop("items_json"))
+            yield row
+
+def business_namespace(db: Session, user_id: int) -> SimpleNamespace:
+    business = db.query(models.Business).filter(models.Business.user_id == user_id).first()
+    # Plain attributes pickle cheaply into the worker processes
+    return SimpleNamespace(**{c.name: getattr(business, c.name) for c in business.__table__.columns})
+
+def run_export(job_id: int) -> None:
+    """Render every matching document into a ZIP of PDFs, tracking progress on the job"""
+    with SessionLocal() as db:
+        job = db.get(models.ExportJob, job_id)
+        job.status = "running"
+        archived = archived_ids(db, job)
+        job.documents_total = _filtered(db, job).count() + len(archived)
+        db.commit()
+
+        path = archive_path(job)
+        partial = path.with_suffix(".part")
+        try:
+            current_business = None
+            number_column = EXPORTABLE[job.document_type][2]
+            pool = get_pool()
+            pending = deque()
+            exported = 0
+
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            # PDFs are already compressed, so store them as they are
+            with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_STORED) as archive:
+                def write_oldest():
+                    nonlocal exported
+                    name, future = pending.popleft()
+                    archive.writestr(name, future.result())
+                    exported += 1
+                    if exported % EXPORT_FETCH_SIZE == 0:
+                        job.documents_exported = exported
+                        job.progress = exported / max(job.documents_total, 1)
+                        db.commit()
+
+                for document in iter_documents(db, job, archived):
+                    name = f"{document[number_column]}.pdf"
+                    business = snapshots.from_document(document)
+                    if business is None:
+                        # Older documents without a snapshot use the current profile
+                        if current_business is None:
+                            current_business = business_namespace(db, job.user_id)
+                        business = current_business
+                    pending.append((name, pool.submit(rendering.render_pdf, job.document_type, document, business)))
+                    if len(pending) >= MAX_IN_FLIGHT:
+                        write_oldest()
+                while pending:
+                    write_oldest()
+
+            partial.replace(path)
+            job.documents_exported = exported
+            job.progress = 1.0
+            job.file_size = path.stat().st_size
+            job.status = "completed"
+            job.expires_at = datetime.utcnow() + timedelta(hours=EXPORT_RETENTION_HOURS)
+        except Exception as exc:
+            logger.exception("Export job %s failed", job_id)
+            if isinstance(exc, BrokenProcessPool):
+                _reset_pool()
+            db.rollback()
+            partial.unlink(missing_ok=True)
+            job.status = "failed"
+            job.error_message = str(exc) or type(exc).__name__
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.commit()
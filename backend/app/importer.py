@@ -0,0 +1,270 @@
+"""
+Streaming CSV/XLSX import of historical receipts and invoices
+
+Each spreadsheet row is one line item. Consecutive rows sharing a
+`reference` make up one document; document-level columns (customer, dates,
+tax, totals) are read from the first row of the group. Blank subtotal,
+tax_amount and total cells are calculated the same way the dashboard does;
+filled-in ones must agree with the items.
+"""
+import csv
+import io
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app import audit, catalog, customers, dashboard, models, snapshots
+from app.database import SessionLocal
+from app.numbering import allocate_numbers
+from app.routers.invoices import INVOICE_STATUSES, generate_invoice_number
+from app.routers.receipts import generate_receipt_number
+
+logger = logging.getLogger(__name__)
+
+IMPORT_DIR = Path("imports")
+CHUNK_DOCUMENTS = int(os.getenv("IMPORT_CHUNK_DOCUMENTS", "1000"))
+ALLOWED_EXTENSIONS = {".csv", ".xlsx"}
+
+# Tolerance for amounts that were rounded to cents in the source file
+AMOUNT_TOLERANCE = 0.01
+
+HEADER_FIELDS = {
+    models.DocumentType.RECEIPT.value: (
+        "customer_name", "customer_email", "customer_phone", "customer_address",
+        "payment_method", "notes",
+    ),
+    models.DocumentType.INVOICE.value: (
+        "customer_name", "customer_email", "customer_phone", "customer_address",
+        "customer_tax_id", "status", "payment_terms", "notes",
+    ),
+}
+
+def source_path(job: models.ImportJob) -> Path:
+    return IMPORT_DIR / f"{job.id}{Path(job.filename).suffix.lower()}"
+
+def error_report_path(job: models.ImportJob) -> Path:
+    return IMPORT_DIR / f"{job.id}-errors.csv"
+
+def _cell(row: dict, name: str):
+    value = row.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in ("", None) else value
+
+def _amount(row: dict, name: str, default=None):
+    value = _cell(row, name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} is not a number: {value!r}")
+
+def _datetime(row: dict, name: str):
+    """An ISO date as UTC; dates without an offset are taken to be UTC already"""
+    value = _cell(row, name)
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"{name} is not an ISO date: {value!r}")
+    # One file can mix both forms, and they cannot be compared with each other
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _close(expected: float, actual: float) -> bool:
+    return abs(expected - actual) <= AMOUNT_TOLERANCE
+
+def iter_csv(path: Path) -> Iterator[Tuple[dict, float]]:
+    """Yield (row, fraction of file read) without loading the file"""
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        for row in csv.DictReader(text):
+            yield row, min(raw.tell() / size, 1.0)
+
+def iter_xlsx(path: Path) -> Iterator[Tuple[dict, float]]:
+    """Yield (row, fraction of sheet read) from the first worksheet"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Install openpyxl to import .xlsx files")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = max((sheet.max_row or 1) - 1, 1)
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        for index, values in enumerate(rows, start=1):
+            if not any(value not in (None, "") for value in values):
+                continue
+            yield dict(zip(header, values)), min(index / total, 1.0)
+    finally:
+        workbook.close()
+
+def iter_documents(rows: Iterator[Tuple[dict, float]]) -> Iterator[Tuple[List[Tuple[int, dict]], float]]:
+    """Group consecutive rows with the same reference into documents"""
+    group, reference, progress = [], None, 0.0
+    # Line 1 is the header row
+    for line, (row, progress) in enumerate(rows, start=2):
+        row_reference = _cell(row, "reference")
+        if group and (row_reference is None or row_reference != reference):
+            yield group, progress
+            group = []
+        group.append((line, row))
+        reference = row_reference
+    if group:
+        yield group, progress
+
+def build_document(document_type: str, lines: List[Tuple[int, dict]]) -> dict:
+    """Validate one document's rows and return its column values (without number)"""
+    first = lines[0][1]
+    items = []
+    for line, row in lines:
+        name = _cell(row, "item_name")
+        if name is None:
+            raise ValueError(f"line {line}: item_name is required")
+        quantity = _amount(row, "item_quantity", 1.0)
+        unit_price = _amount(row, "item_unit_price")
+        if unit_price is None:
+            raise ValueError(f"line {line}: item_unit_price is required")
+        item_total = _amount(row, "item_total", quantity * unit_price)
+        if not _close(quantity * unit_price, item_total):
+            raise ValueError(f"line {line}: item_total does not equal quantity x unit price")
+        items.append({
+            "name": str(name),
+            "description": _cell(row, "item_description"),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total": item_total,
+        })
+
+    subtotal = sum(item["total"] for item in items)
+    tax_rate = _amount(first, "tax_rate", 0.0)
+    discount = _amount(first, "discount", 0.0)
+    tax_amount = (subtotal - discount) * (tax_rate / 100)
+    total = subtotal - discount + tax_amount
+    for name, expected in (("subtotal", subtotal), ("tax_amount", tax_amount), ("total", total)):
+        given = _amount(first, name)
+        if given is not None and not _close(expected, given):
+            raise ValueError(f"{name} {given:.2f} does not match the items ({expected:.2f})")
+
+    document = {
+        "subtotal": subtotal,
+        "tax_rate": tax_rate,
+        "tax_amount": tax_amount,
+        "discount": discount,
+        "total": total,
+        "items_json": json.dumps(items),
+    }
+    for name in HEADER_FIELDS[document_type]:
+        value = _cell(first, name)
+        document[name] = str(value) if value is not None else None
+
+    if document_type == models.DocumentType.INVOICE.value:
+        if not document["customer_name"]:
+            raise ValueError("customer_name is required for invoices")
+        issue_date = _datetime(first, "issue_date") or datetime.now(timezone.utc)
+        document["issue_date"] = issue_date
+        document["due_date"] = _datetime(first, "due_date") or issue_date + timedelta(days=30)
+        document["status"] = document["status"] or "pending"
+        if document["status"] not in INVOICE_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(sorted(INVOICE_STATUSES))}")
+    else:
+        document["date"] = _datetime(first, "date") or datetime.now(timezone.utc)
+    return document
+
+def validate_chunk(document_type: str, chunk: list) -> Tuple[list, list]:
+    """Split a chunk of grouped rows into valid documents and (line, reference, error) rows"""
+    valid, errors = [], []
+    for lines in chunk:
+        try:
+            valid.append(build_document(document_type, lines))
+        except ValueError as exc:
+            errors.append((lines[0][0], _cell(lines[0][1], "reference") or "", str(exc)))
+    return valid, errors
+
+def insert_chunk(db: Session, job: models.ImportJob, documents: list) -> None:
+    """Bulk insert validated documents with freshly allocated numbers"""
+    if job.document_type == models.DocumentType.INVOICE.value:
+        model, number_column, generate = models.Invoice, "invoice_number", generate_invoice_number
+    else:
+        model, number_column, generate = models.Receipt, "receipt_number", generate_receipt_number
+    numbers = allocate_numbers(db, job.document_type, generate, len(documents))
+    snapshot = snapshots.columns(db.get(models.Business, job.business_id))
+    date_column = "issue_date" if model is models.Invoice else "date"
+    for document, number in zip(documents, numbers):
+        document[number_column] = number
+        # Historical documents are archived and partitioned by when they were issued, not imported
+        document["created_at"] = document[date_column]
+        document["user_id"] = job.user_id
+        document["business_id"] = job.business_id
+        document.update(snapshot)
+    ids = db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), documents).all()
+    # A file can hold more documents than the audit queue, so they are audited in this transaction
+    audit.insert_now(db, [
+        audit.entry(
+            job.business_id, job.user_id, f"{job.document_type}.created", job.document_type, document_id,
+            {"import_job_id": {"from": None, "to": job.id}}
+        )
+        for document_id in ids
+    ])
+    if model is models.Invoice:
+        dashboard.add_invoices(db, job.user_id, documents)
+    else:
+        dashboard.add(db, job.user_id, receipt_count=len(documents), receipt_total=sum(document["total"] for document in documents))
+    customers.upsert(db, job.user_id, [customers.from_document(document, document[date_column]) for document in documents])
+    catalog.upsert(db, job.business_id, [
+        row for document in documents
+        for row in catalog.from_items(json.loads(document["items_json"]), document[date_column])
+    ])
+
+def run_import(job_id: int) -> None:
+    """Process an uploaded file in chunks, committing each batch of documents"""
+    with SessionLocal() as db:
+        job = db.get(models.ImportJob, job_id)
+        path = source_path(job)
+        job.status = "running"
+        db.commit()
+
+        try:
+            rows = iter_xlsx(path) if path.suffix == ".xlsx" else iter_csv(path)
+            with open(error_report_path(job), "w", newline="", encoding="utf-8") as report:
+                writer = csv.writer(report)
+                writer.writerow(["line", "reference", "error"])
+                chunk, rows_in_chunk = [], 0
+                for lines, progress in iter_documents(rows):
+                    chunk.append(lines)
+                    rows_in_chunk += len(lines)
+                    if len(chunk) >= CHUNK_DOCUMENTS:
+                        _flush(db, job, chunk, rows_in_chunk, progress, writer)
+                        chunk, rows_in_chunk = [], 0
+                _flush(db, job, chunk, rows_in_chunk, 1.0, writer)
+            job.status = "completed"
+        except Exception as exc:
+            logger.exception("Import job %s failed", job_id)
+            db.rollback()
+            job.status = "failed"
+            job.error_message = str(exc)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            path.unlink(missing_ok=True)
+
+def _flush(db: Session, job: models.ImportJob, chunk: list, rows: int, progress: float, writer) -> None:
+    valid, errors = validate_chunk(job.document_type, chunk)
+    if valid:
+        insert_chunk(db, job, valid)
+    writer.writerows(errors)
+    job.rows_processed += rows
+    job.documents_imported += len(valid)
+    job.documents_failed += len(errors)
+    job.progress = progress
+    db.commit()
@@ -0,0 +1,48 @@
+"""
+Move old receipts and invoices into the compressed archive
+
+    python -m app.jobs.archive --older-than-days 730
+
+Run it regularly (e.g. nightly). Each batch is committed on its own, so the
+job can be stopped and restarted at any point.
+"""
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from app import archive
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "730"))
+
+def run(older_than_days: int, batch_size: int, document_types: list) -> dict:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    moved = {}
+    with SessionLocal() as db:
+        for document_type in document_types:
+            moved[document_type] = 0
+            while True:
+                count = archive.archive_batch(db, document_type, cutoff, batch_size)
+                if not count:
+                    break
+                moved[document_type] += count
+                logger.info("Archived %d %ss so far", moved[document_type], document_type)
+    return moved
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive receipts and invoices older than a horizon")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--type", choices=["receipt", "invoice", "all"], default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    document_types = list(archive.ARCHIVABLE) if args.type == "all" else [args.type]
+    moved = run(args.older_than_days, args.batch_size, document_types)
+    for document_type, count in moved.items():
+        print(f"{document_type}: {count} archived")
+
+if __name__ == "__main__":
+    main()
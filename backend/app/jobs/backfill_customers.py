@@ -0,0 +1,77 @@
+"""
+Build the customer directory from existing receipts and invoices
+
+    python -m app.jobs.backfill_customers --batch-size 100
+
+Users are processed in batches, each committed on its own. Counts are
+recomputed from the documents rather than added, so the job can be rerun at
+any time to repair the directory.
+
+Documents are counted in SQL, grouped by their exact customer fields, so only
+one row per distinct set of contact details reaches Python; those are merged
+into directory entries the same way live documents are.
+"""
+import argparse
+import logging
+from collections import defaultdict
+from sqlalchemy import func, null, select
+from sqlalchemy.orm import Session
+from app import customers, models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def _customer_columns(model):
+    return (
+        model.user_id,
+        model.customer_name,
+        model.customer_email,
+        model.customer_phone,
+        model.customer_address,
+        model.customer_tax_id if hasattr(model, "customer_tax_id") else null().label("customer_tax_id"),
+    )
+
+def backfill_users(db: Session, user_ids: list) -> int:
+    rows = defaultdict(list)
+    for model, date_column in ((models.Receipt, models.Receipt.date), (models.Invoice, models.Invoice.issue_date)):
+        columns = _customer_columns(model)
+        query = select(
+            *columns, func.count().label("document_count"), func.max(date_column).label("used_at")
+        ).where(model.user_id.in_(user_ids)).group_by(*columns)
+        for group in db.execute(query):
+            row = customers.from_document(group._asdict(), group.used_at)
+            if row is not None:
+                row["document_count"] = group.document_count
+                rows[group.user_id].append(row)
+    customers.upsert_many(db, rows, replace_counts=True)
+    db.commit()
+    return len(rows)
+
+def run(batch_size: int) -> int:
+    users = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            user_ids = [
+                row.id for row in db.query(models.User.id)
+                .filter(models.User.id > last_id)
+                .order_by(models.User.id)
+                .limit(batch_size)
+            ]
+            if not user_ids:
+                return users
+            backfill_users(db, user_ids)
+            users += len(user_ids)
+            last_id = user_ids[-1]
+            logger.info("Backfilled customers for %d users", users)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the customer directory from existing documents")
+    parser.add_argument("--batch-size", type=int, default=100, help="users per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"{run(args.batch_size)} users processed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Build the product catalog from the line items of existing receipts and invoices
+
+    python -m app.jobs.backfill_products --batch-size 100
+
+Businesses are processed in batches, each committed on its own. Counts are
+recomputed from the documents rather than added, so the job can be rerun at
+any time to repair the catalog.
+
+Line items are unnested and counted in SQL, grouped by their exact name,
+description and price, so only one row per distinct item reaches Python;
+those are merged into catalog entries the same way live documents are.
+"""
+import argparse
+import logging
+from collections import defaultdict
+from sqlalchemy import JSON, Float, cast, func, literal_column, select, true
+from sqlalchemy.orm import Session
+from app import catalog, models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def _line_items(db: Session, model):
+    """Table of a document's line items, and their (name, description, unit_price)"""
+    if db.get_bind().dialect.name == "postgresql":
+        item = func.json_array_elements(cast(model.items_json, JSON)).table_valued("value").alias("item")
+        # Literal keys: the grouped expressions must match the selected ones exactly
+        field = lambda name: item.c.value.op("->>")(literal_column(f"'{name}'"))
+        return item, (field("name"), field("description"), cast(field("unit_price"), Float))
+    item = func.json_each(model.items_json).table_valued("value").alias("item")
+    field = lambda name: func.json_extract(item.c.value, literal_column(f"'$.{name}'"))
+    return item, (field("name"), field("description"), field("unit_price"))
+
+def backfill_businesses(db: Session, business_ids: list) -> int:
+    rows = defaultdict(list)
+    for model, date_column in ((models.Receipt, models.Receipt.date), (models.Invoice, models.Invoice.issue_date)):
+        item, fields = _line_items(db, model)
+        name, description, unit_price = fields
+        # Table-valued functions may refer to the documents before them, so no join condition is needed
+        query = select(
+            model.business_id, name.label("name"), description.label("description"), unit_price.label("unit_price"),
+            func.count().label("usage_count"), func.max(date_column).label("used_at")
+        ).select_from(model).join(item, true()).where(
+            model.business_id.in_(business_ids)
+        ).group_by(model.business_id, *fields)
+        for group in db.execute(query):
+            for row in catalog.from_items([group._asdict()], group.used_at):
+                row["usage_count"] = group.usage_count
+                rows[group.business_id].append(row)
+    catalog.upsert_many(db, rows, replace_counts=True)
+    db.commit()
+    return len(rows)
+
+def run(batch_size: int) -> int:
+    businesses = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            business_ids = [
+                row.id for row in db.query(models.Business.id)
+                .filter(models.Business.id > last_id)
+                .order_by(models.Business.id)
+                .limit(batch_size)
+            ]
+            if not business_ids:
+                return businesses
+            backfill_businesses(db, business_ids)
+            businesses += len(business_ids)
+            last_id = business_ids[-1]
+            logger.info("Backfilled products for %d businesses", businesses)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the product catalog from existing documents")
+    parser.add_argument("--batch-size", type=int, default=100, help="businesses per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"{run(args.batch_size)} businesses processed")
+
+if __name__ == "__main__":
+    main()
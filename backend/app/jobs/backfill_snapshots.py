@@ -0,0 +1,75 @@
+"""
+Give receipts and invoices created before business snapshots a snapshot
+
+    python -m app.jobs.backfill_snapshots --batch-size 100
+
+Their original business header is not known, so they get the current profile;
+from then on, profile edits no longer change them. Businesses are processed in
+batches with one UPDATE per table, each batch committed on its own, so the job
+can be stopped and rerun at any time.
+"""
+import argparse
+import logging
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from app import models, snapshots
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def backfill_businesses(db: Session, businesses: list) -> None:
+    # Parameter names must differ from the columns they set
+    rows = []
+    for business in businesses:
+        columns = snapshots.columns(business)
+        rows.append({
+            "snapshot_business_id": business.id,
+            "snapshot": columns["business_snapshot"],
+            "snapshot_logo_url": columns["business_logo_url"],
+        })
+    for model in (models.Receipt, models.Invoice):
+        statement = (
+            update(model.__table__)
+            .where(
+                model.business_id == bindparam("snapshot_business_id"),
+                model.business_snapshot.is_(None)
+            )
+            # A backfill is not a change to the document: delta sync should not resend it
+            .values(
+                business_snapshot=bindparam("snapshot"),
+                business_logo_url=bindparam("snapshot_logo_url"),
+                updated_at=model.updated_at
+            )
+        )
+        db.execute(statement, rows)
+    db.commit()
+
+def run(batch_size: int) -> int:
+    done = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            businesses = (
+                db.query(models.Business)
+                .filter(models.Business.id > last_id)
+                .order_by(models.Business.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not businesses:
+                return done
+            last_id = businesses[-1].id
+            backfill_businesses(db, businesses)
+            done += len(businesses)
+            logger.info("Backfilled snapshots for %d businesses", done)
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot the current business profile onto older documents")
+    parser.add_argument("--batch-size", type=int, default=100, help="businesses per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"{run(args.batch_size)} businesses processed")
+
+if __name__ == "__main__":
+    main()
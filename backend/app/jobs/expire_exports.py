@@ -0,0 +1,35 @@
+"""
+Delete export ZIPs older than EXPORT_RETENTION_HOURS
+
+    python -m app.jobs.expire_exports --batch-size 100
+
+Starting an export already clears expired ones, so the job only matters when
+no exports are started for a while. Each batch of jobs is committed on its own.
+"""
+import argparse
+import logging
+from app import exporter
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def run(batch_size: int) -> int:
+    expired = 0
+    with SessionLocal() as db:
+        while True:
+            count = exporter.expire_exports(db, batch_size)
+            expired += count
+            if count < batch_size:
+                return expired
+            logger.info("Expired %d exports so far", expired)
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete export ZIPs past their expiry")
+    parser.add_argument("--batch-size", type=int, default=100, help="exports per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"{run(args.batch_size)} exports expired")
+
+if __name__ == "__main__":
+    main()
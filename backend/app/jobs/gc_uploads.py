@@ -0,0 +1,116 @@
+"""
+Delete uploaded logos that no business or document refers to any more
+
+    python -m app.jobs.gc_uploads --dry-run
+    python -m app.jobs.gc_uploads --grace-hours 24 --batch-size 500
+
+Uploading a logo and saving it on the business profile are separate requests,
+so files younger than the grace period are always kept. Receipts and invoices
+keep the logo they were issued with (see app/snapshots.py), so a logo replaced
+on the profile stays while documents, archived or not, still show it. Each batch
+is checked against the database again just before it is deleted.
+"""
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List, Set, Tuple
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+from app.routers.upload import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+LOGO_URL_PREFIX = "/api/uploads/logos/"
+# Indexed columns that can hold a logo URL
+LOGO_COLUMNS = (
+    models.Business.logo_url,
+    models.Receipt.business_logo_url,
+    models.Invoice.business_logo_url,
+    models.ArchivedDocument.business_logo_url,
+)
+
+def logo_name(url: str):
+    return url[len(LOGO_URL_PREFIX):] if url and url.startswith(LOGO_URL_PREFIX) else None
+
+def referenced_names(db: Session) -> Set[str]:
+    names = set()
+    for (url,) in db.query(models.Business.logo_url).filter(models.Business.logo_url.isnot(None)).yield_per(1000):
+        name = logo_name(url)
+        if name:
+            names.add(name)
+    return names
+
+def unreferenced_files(directory: Path, referenced: Set[str], cutoff: float) -> Iterator[Tuple[str, int]]:
+    """(name, size) of files older than cutoff that are not referenced, streamed from the directory"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False) or entry.name in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime < cutoff:
+                yield entry.name, stat.st_size
+
+def still_unreferenced(db: Session, batch: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    urls = [LOGO_URL_PREFIX + name for name, _ in batch]
+    taken = set()
+    for column in LOGO_COLUMNS:
+        taken.update(logo_name(url) for (url,) in db.query(column).filter(column.in_(urls)).distinct())
+    return [(name, size) for name, size in batch if name not in taken]
+
+def delete_batch(directory: Path, batch: List[Tuple[str, int]]) -> Tuple[int, int]:
+    deleted = reclaimed = 0
+    for name, size in batch:
+        try:
+            (directory / name).unlink()
+        except FileNotFoundError:
+            continue
+        deleted += 1
+        reclaimed += size
+    return deleted, reclaimed
+
+def run(grace_hours: float, batch_size: int, dry_run: bool, directory: Path = UPLOAD_DIR) -> dict:
+    report = {"candidates": 0, "deleted": 0, "bytes": 0}
+    if not directory.exists():
+        return report
+    cutoff = time.time() - grace_hours * 3600
+
+    with SessionLocal() as db:
+        referenced = referenced_names(db)
+        batch = []
+        for candidate in unreferenced_files(directory, referenced, cutoff):
+            batch.append(candidate)
+            if len(batch) >= batch_size:
+                _collect(db, directory, batch, dry_run, report)
+                batch = []
+        if batch:
+            _collect(db, directory, batch, dry_run, report)
+    return report
+
+def _collect(db: Session, directory: Path, batch: list, dry_run: bool, report: dict) -> None:
+    report["candidates"] += len(batch)
+    batch = still_unreferenced(db, batch)
+    if dry_run:
+        deleted, reclaimed = len(batch), sum(size for _, size in batch)
+    else:
+        deleted, reclaimed = delete_batch(directory, batch)
+    report["deleted"] += deleted
+    report["bytes"] += reclaimed
+    logger.info("%s %d files (%d bytes)", "Would delete" if dry_run else "Deleted", deleted, reclaimed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete uploaded logos no business or document refers to")
+    parser.add_argument("--grace-hours", type=float, default=24, help="keep files younger than this")
+    parser.add_argument("--batch-size", type=int, default=500, help="files per database check and delete")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    report = run(args.grace_hours, args.batch_size, args.dry_run)
+    verb = "would be reclaimed" if args.dry_run else "reclaimed"
+    print(f"{report['deleted']} files, {report['bytes'] / 1024 / 1024:.1f} MB {verb}")
+
+if __name__ == "__main__":
+    main()
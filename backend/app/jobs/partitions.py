@@ -0,0 +1,113 @@
+"""
+Maintain monthly partitions of receipts and invoices (PostgreSQL only)
+
+    python -m app.jobs.partitions --months-ahead 3 --drop-empty-before-days 730
+
+Requires sql_partitioning.sql to have been applied. Creates partitions for
+the coming months, then detaches and drops partitions that lie entirely
+before the cutoff and have been emptied by app.jobs.archive.
+
+Run it before each month starts (daily from cron is simplest). Rows for a
+month without a partition land in the DEFAULT partition, and PostgreSQL
+refuses to create a partition whose range has rows there, so each run first
+moves such rows into partitions of their own.
+"""
+import argparse
+import logging
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("receipts", "invoices")
+
+def drain_default(connection, table: str) -> list:
+    """Move rows out of the DEFAULT partition into new monthly partitions
+
+    The default partition is detached, each month's rows are copied into a
+    standalone table that is then attached as that month's partition, and the
+    emptied default is recreated. Copying into tables that are not yet
+    partitions keeps the parent's row triggers (number claims, challenge
+    checks) from firing again for rows that already passed them. The parent
+    stays locked until the transaction commits, so writers wait rather than fail.
+    """
+    default = f"{table}_default"
+    months = connection.execute(text(
+        f'SELECT DISTINCT date_trunc(\'month\', created_at)::date FROM "{default}" ORDER BY 1'
+    )).scalars().all()
+    if not months:
+        return []
+    connection.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+    created = []
+    for month_start in months:
+        name = f"{table}_p{month_start:%Y%m}"
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        bounds = {"start": month_start, "end": month_end}
+        connection.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)'))
+        connection.execute(text(
+            f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE created_at >= :start AND created_at < :end'
+        ), bounds)
+        connection.execute(text(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (\'{month_start}\') TO (\'{month_end}\')'
+        ))
+        created.append(name)
+    connection.execute(text(f'DROP TABLE "{default}"'))
+    connection.execute(text(f'CREATE TABLE "{default}" PARTITION OF "{table}" DEFAULT'))
+    return created
+
+def create_upcoming(connection, table: str, months_ahead: int) -> None:
+    connection.execute(
+        text("SELECT create_monthly_partitions(:table, CURRENT_DATE, :months)"),
+        {"table": table, "months": months_ahead + 1}
+    )
+
+def drop_empty_before(connection, table: str, cutoff: date) -> list:
+    """Drop monthly partitions that end on or before cutoff and hold no rows"""
+    partitions = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table AND child.relname LIKE :pattern
+    """), {"table": table, "pattern": f"{table}\\_p%"}).scalars().all()
+
+    dropped = []
+    for name in sorted(partitions):
+        month_start = datetime.strptime(name.rsplit("_p", 1)[1], "%Y%m").date()
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        if month_end > cutoff:
+            continue
+        if connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{name}")')).scalar():
+            continue
+        connection.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        connection.execute(text(f'DROP TABLE "{name}"'))
+        dropped.append(name)
+    return dropped
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and prune monthly document partitions")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    parser.add_argument(
+        "--drop-empty-before-days", type=int, default=None,
+        help="drop empty partitions older than this many days"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if engine.dialect.name != "postgresql":
+        parser.exit(1, "Partitioning is only supported on PostgreSQL\n")
+
+    with engine.begin() as connection:
+        for table in PARTITIONED_TABLES:
+            for name in drain_default(connection, table):
+                logger.warning("Moved rows from %s_default into new partition %s", table, name)
+            create_upcoming(connection, table, args.months_ahead)
+            logger.info("Ensured %s partitions %d months ahead", table, args.months_ahead)
+            if args.drop_empty_before_days is not None:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=args.drop_empty_before_days)).date()
+                for name in drop_empty_before(connection, table, cutoff):
+                    logger.info("Dropped empty partition %s", name)
+
+if __name__ == "__main__":
+    main()
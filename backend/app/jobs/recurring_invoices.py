@@ -0,0 +1,44 @@
+"""
+Issue the invoices that recurring invoice templates have due
+
+    python -m app.jobs.recurring_invoices --batch-size 1000
+
+Run it regularly (e.g. hourly). Each batch of templates is committed with
+its invoices, so the job can be stopped, rerun or run on several machines at
+once without issuing an invoice twice.
+"""
+import argparse
+import logging
+from datetime import datetime, timezone
+from app import audit, recurring
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def run(batch_size: int) -> int:
+    now = datetime.now(timezone.utc)
+    generated = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            next_id, created = recurring.generate_batch(db, now, last_id, batch_size)
+            if next_id is None:
+                break
+            last_id = next_id
+            generated += created
+            logger.info("Generated %d invoices so far", generated)
+    return generated
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the invoices recurring templates have due")
+    parser.add_argument("--batch-size", type=int, default=1000, help="templates per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    generated = run(args.batch_size)
+    # Write out the queued audit events before exiting
+    audit.stop()
+    print(f"{generated} invoices generated")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Recompute dashboard counters from receipts, invoices, the archive and challenges
+
+    python -m app.jobs.repair_dashboard_stats --batch-size 500
+
+Counters are replaced, not added to, so the job can be rerun at any time and
+while the API is serving writes. Each batch of users is committed on its own.
+"""
+import argparse
+import logging
+from app import dashboard, models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def run(batch_size: int) -> int:
+    users = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            user_ids = [
+                row.id for row in db.query(models.User.id)
+                .filter(models.User.id > last_id)
+                .order_by(models.User.id)
+                .limit(batch_size)
+            ]
+            if not user_ids:
+                return users
+            dashboard.recompute(db, user_ids)
+            db.commit()
+            users += len(user_ids)
+            last_id = user_ids[-1]
+            logger.info("Recomputed dashboard stats for %d users", users)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute dashboard counters from the source tables")
+    parser.add_argument("--batch-size", type=int, default=500, help="users per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"{run(args.batch_size)} users processed")
+
+if __name__ == "__main__":
+    main()
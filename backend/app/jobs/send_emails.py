@@ -0,0 +1,73 @@
+"""
+Send queued receipt and invoice emails outside the API process
+
+    python -m app.jobs.send_emails            # run workers until interrupted
+    python -m app.jobs.send_emails --once     # drain what is due, then exit
+    python -m app.jobs.send_emails --requeue-dead
+
+The API starts its own workers when SMTP_HOST is set; use this instead when
+sending should run on a separate machine, or to flush the outbox by hand. For
+local testing point SMTP_HOST/SMTP_PORT at a stand-in server such as
+`python -m aiosmtpd -n -l localhost:1025` with SMTP_STARTTLS=false.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from app import mailer, models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def drain(batch_size: int) -> int:
+    pool = mailer.SMTPPool(1)
+    claimed = 0
+    try:
+        while True:
+            count = mailer.process_batch(pool, batch_size)
+            if not count:
+                return claimed
+            claimed += count
+    finally:
+        pool.close()
+
+def requeue_dead() -> int:
+    with SessionLocal() as db:
+        count = db.query(models.EmailOutbox).filter(models.EmailOutbox.status == "dead").update(
+            {"status": "pending", "attempts": 0, "next_attempt_at": datetime.now(timezone.utc)},
+            synchronize_session=False
+        )
+        db.commit()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Send queued receipt and invoice emails")
+    parser.add_argument("--once", action="store_true", help="send what is due, then exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="give dead-lettered emails another round of attempts")
+    parser.add_argument("--workers", type=int, default=mailer.EMAIL_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=mailer.EMAIL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not mailer.enabled():
+        parser.error("SMTP_HOST is not set")
+    if args.requeue_dead:
+        print(f"{requeue_dead()} dead emails requeued")
+    if args.once:
+        claimed = drain(args.batch_size)
+        print(f"{claimed} emails processed: {dict(mailer.stats)}")
+        return
+
+    mailer.EMAIL_BATCH_SIZE = args.batch_size
+    mailer.start(args.workers)
+    try:
+        while True:
+            time.sleep(60)
+            logger.info("Email stats: %s", mailer.get_stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mailer.stop()
+
+if __name__ == "__main__":
+    main()
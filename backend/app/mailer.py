@@ -0,0 +1,361 @@
+"""
+Email outbox: durable queue of receipt/invoice emails and the workers that send them
+
+Routes only insert an outbox row in their own transaction. Worker threads
+claim due rows in batches, render them and send them over pooled SMTP
+connections. Failures are retried with exponential backoff; rows that keep
+failing, or fail permanently, are parked as "dead" for inspection.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+from typing import List, Optional
+from sqlalchemy import and_, event, insert, or_, select, update
+from sqlalchemy.orm import Session
+from app import archive, models, rendering, snapshots
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# SMTP server; the workers only start when SMTP_HOST is set
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+EMAIL_FROM = os.getenv("EMAIL_FROM", "no-reply@localhost")
+
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "60"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+
+# A claimed row is handed to another worker if its worker dies mid-batch
+CLAIM_LEASE_SECONDS = 300
+# Servers drop idle sessions; reconnect rather than reuse one this old
+SMTP_IDLE_SECONDS = 60
+
+DOCUMENT_MODELS = {
+    models.DocumentType.RECEIPT.value: models.Receipt,
+    models.DocumentType.INVOICE.value: models.Invoice,
+}
+
+class PermanentFailure(Exception):
+    """The email can never be sent, so retrying is pointless"""
+
+stats = Counter()
+_stats_lock = threading.Lock()
+_wake = threading.Event()
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        stats[name] += amount
+
+def enqueue(db: Session, user_id: int, document_type: str, document_id: int, recipient: str) -> models.EmailOutbox:
+    """Add an email to the outbox; it is only sent if the caller's transaction commits"""
+    entry = models.EmailOutbox(
+        user_id=user_id,
+        document_type=document_type,
+        document_id=document_id,
+        recipient=recipient,
+        next_attempt_at=datetime.now(timezone.utc)
+    )
+    db.add(entry)
+    db.info["email_queued"] = True
+    return entry
+
+def enqueue_many(db: Session, emails: List[dict]) -> None:
+    """Add many emails (user_id, document_type, document_id, recipient) with one multi-row INSERT"""
+    if not emails:
+        return
+    now = datetime.now(timezone.utc)
+    db.execute(insert(models.EmailOutbox), [{**email, "next_attempt_at": now} for email in emails])
+    db.info["email_queued"] = True
+
+def requeue(db: Session, entry: models.EmailOutbox) -> None:
+    """Give a dead-lettered email a fresh round of attempts"""
+    entry.status = "pending"
+    entry.attempts = 0
+    entry.next_attempt_at = datetime.now(timezone.utc)
+    db.info["email_queued"] = True
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("email_queued", False):
+        _wake.set()
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_queued(session, previous_transaction):
+    session.info.pop("email_queued", None)
+
+def claim_batch(db: Session, limit: int) -> list:
+    """Lease up to `limit` due emails to this worker"""
+    now = datetime.now(timezone.utc)
+    Outbox = models.EmailOutbox
+    due = select(Outbox.id).where(
+        or_(
+            and_(Outbox.status == "pending", Outbox.next_attempt_at <= now),
+            # Leases left behind by a worker that died
+            and_(Outbox.status == "sending", Outbox.locked_until < now)
+        )
+    ).order_by(Outbox.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+    # One UPDATE claims the rows, so two workers can never lease the same email
+    claimed = db.execute(
+        update(Outbox)
+        .where(Outbox.id.in_(due.scalar_subquery()))
+        .values(
+            status="sending",
+            attempts=Outbox.attempts + 1,
+            locked_until=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+        )
+        .returning(Outbox.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(Outbox).filter(Outbox.id.in_(claimed)).order_by(Outbox.id).all()
+
+def load_documents(db: Session, entries: list) -> dict:
+    """Fetch the documents for a batch with one query per type"""
+    documents = {}
+    for document_type, model in DOCUMENT_MODELS.items():
+        ids = {entry.document_id for entry in entries if entry.document_type == document_type}
+        if not ids:
+            continue
+        for row in db.query(model).filter(model.id.in_(ids)):
+            documents[document_type, row.id] = {
+                **{c.name: getattr(row, c.name) for c in row.__table__.columns},
+                "items": json.loads(row.items_json)
+            }
+    for entry in entries:
+        key = (entry.document_type, entry.document_id)
+        if key not in documents:
+            archived = archive.load_document(db, entry.document_type, entry.document_id, entry.user_id)
+            if archived is not None:
+                documents[key] = archived
+    return documents
+
+def build_message(entry: models.EmailOutbox, document: dict, business) -> EmailMessage:
+    title = rendering.document_title(entry.document_type, document)
+    message = EmailMessage()
+    message["Subject"] = f"{title} from {business.name}"
+    message["From"] = formataddr((business.name, EMAIL_FROM))
+    message["To"] = entry.recipient
+    if business.email:
+        message["Reply-To"] = business.email
+    message["Message-ID"] = make_msgid(idstring=f"outbox-{entry.id}")
+    message.set_content(rendering.render_text(entry.document_type, document, business))
+    message.add_alternative(rendering.render_html(entry.document_type, document, business), subtype="html")
+    return message
+
+def _connect() -> smtplib.SMTP:
+    if SMTP_USE_SSL:
+        connection = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    else:
+        connection = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            connection.starttls()
+    if SMTP_USERNAME:
+        connection.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+    return connection
+
+class SMTPPool:
+    """Reuses authenticated SMTP sessions across batches and workers"""
+
+    def __init__(self, size: int):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return _connect()
+            if time.monotonic() - last_used < SMTP_IDLE_SECONDS:
+                return connection
+            self._quit(connection)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        connection = None
+        try:
+            connection = self._checkout()
+            yield connection
+        except Exception:
+            # Errors that escape the caller mean the session is broken; don't reuse it
+            if connection is not None:
+                self._quit(connection)
+            connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.put((connection, time.monotonic()))
+            self._slots.release()
+
+    @staticmethod
+    def _quit(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(connection)
+
+def _is_permanent(exc: Exception) -> bool:
+    if isinstance(exc, PermanentFailure):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code >= 500 and not isinstance(exc, smtplib.SMTPAuthenticationError)
+    return False
+
+def retry_delay(attempts: int) -> float:
+    delay = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+    # Jitter so a burst of failures doesn't retry in lockstep
+    return delay * random.uniform(0.8, 1.2)
+
+def record_failure(entry: models.EmailOutbox, exc: Exception, transient: bool = False) -> None:
+    entry.last_error = f"{type(exc).__name__}: {exc}"[:1000]
+    entry.locked_until = None
+    if (not transient and _is_permanent(exc)) or entry.attempts >= EMAIL_MAX_ATTEMPTS:
+        entry.status = "dead"
+        _count("dead")
+        logger.warning("Email %s dead-lettered after %d attempts: %s", entry.id, entry.attempts, entry.last_error)
+    else:
+        entry.status = "pending"
+        entry.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay(entry.attempts))
+        _count("retried")
+
+def process_batch(pool: SMTPPool, batch_size: Optional[int] = None) -> int:
+    """Send one batch of due emails; return how many were claimed"""
+    with SessionLocal() as db:
+        entries = claim_batch(db, batch_size or EMAIL_BATCH_SIZE)
+        if not entries:
+            return 0
+
+        documents = load_documents(db, entries)
+        # Only documents from before business snapshots need the profile
+        business_ids = {document["business_id"] for document in documents.values() if not document.get("business_snapshot")}
+        businesses = {}
+        if business_ids:
+            businesses = {
+                business.id: business
+                for business in db.query(models.Business).filter(models.Business.id.in_(business_ids))
+            }
+
+        messages = []
+        for entry in entries:
+            try:
+                document = documents.get((entry.document_type, entry.document_id))
+                business = None
+                if document is not None:
+                    business = snapshots.from_document(document) or businesses.get(document["business_id"])
+                if business is None:
+                    raise PermanentFailure("Document no longer exists")
+                messages.append((entry, build_message(entry, document, business)))
+            except Exception as exc:
+                record_failure(entry, exc)
+
+        if messages:
+            try:
+                with pool.connection() as connection:
+                    for entry, message in messages:
+                        try:
+                            connection.send_message(message)
+                        except smtplib.SMTPServerDisconnected:
+                            raise
+                        except smtplib.SMTPException as exc:
+                            # Rejected by the server; the session itself is still usable
+                            record_failure(entry, exc)
+                        else:
+                            entry.status = "sent"
+                            entry.sent_at = datetime.now(timezone.utc)
+                            entry.locked_until = None
+                            entry.last_error = None
+                            _count("sent")
+            except OSError as exc:  # socket errors and SMTPException alike
+                # Couldn't reach the server: everything not yet sent is retried later
+                for entry, _ in messages:
+                    if entry.status == "sending":
+                        record_failure(entry, exc, transient=True)
+        db.commit()
+        return len(entries)
+
+class EmailWorker(threading.Thread):
+    """Drains the outbox until stopped"""
+
+    def __init__(self, pool: SMTPPool, index: int):
+        super().__init__(name=f"email-worker-{index}", daemon=True)
+        self.pool = pool
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = process_batch(self.pool)
+            except Exception:
+                logger.exception("Email batch failed")
+                claimed = 0
+            if not claimed:
+                _wake.wait(EMAIL_POLL_SECONDS)
+                _wake.clear()
+
+    def stop(self):
+        self._stopping.set()
+        _wake.set()
+
+_pool: Optional[SMTPPool] = None
+_workers = []
+
+def enabled() -> bool:
+    return bool(SMTP_HOST)
+
+def start(workers: int = EMAIL_WORKERS) -> None:
+    """Start the sending workers for this process"""
+    global _pool
+    if not enabled() or _workers:
+        return
+    _pool = SMTPPool(workers)
+    for index in range(workers):
+        worker = EmailWorker(_pool, index)
+        worker.start()
+        _workers.append(worker)
+
+def stop(timeout: float = 10.0) -> None:
+    global _pool
+    for worker in _workers:
+        worker.stop()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return {"workers": len(_workers), **stats}
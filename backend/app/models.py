@@ -1,7 +1,7 @@
 """
 Database models
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import BigInteger, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -86,13 +86,26 @@ class Receipt(Base):
     # Items stored as JSON string (SQLAlchemy Text field)
     items_json = Column(Text, nullable=False)  # JSON array of items
     
+    voided_at = Column(DateTime(timezone=True))  # Soft delete: voided receipts are hidden from lists
+    
+    # Business header at creation time (see app/snapshots.py); None on older documents
+    business_snapshot = Column(Text)
+    business_logo_url = Column(String)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set on insert as well as update so delta sync can filter on it alone
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="receipts")
     business = relationship("Business", back_populates="receipts")
     challenges = relationship("Challenge", back_populates="receipt")
+    
+    __table_args__ = (
+        Index("ix_receipts_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_receipts_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_receipts_business_logo_url", "business_logo_url"),
+    )
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -124,13 +137,23 @@ class Invoice(Base):
     # Items stored as JSON string
     items_json = Column(Text, nullable=False)
     
+    # Business header at creation time (see app/snapshots.py); None on older documents
+    business_snapshot = Column(Text)
+    business_logo_url = Column(String)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="invoices")
     business = relationship("Business", back_populates="invoices")
     challenges = relationship("Challenge", back_populates="invoice")
+    
+    __table_args__ = (
+        Index("ix_invoices_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_invoices_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_invoices_business_logo_url", "business_logo_url"),
+    )
 
 class Challenge(Base):
     __tablename__ = "challenges"
@@ -138,6 +161,9 @@ class Challenge(Base):
     id = Column(Integer, primary_key=True, index=True)
     receipt_id = Column(Integer, ForeignKey("receipts.id"), nullable=True)
     invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=True)
+    # Owner of the challenged document, copied at creation so challenges can be
+    # filtered per user without scanning their receipts and invoices
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     
     # Challenger information
     challenger_name = Column(String, nullable=False)
@@ -150,8 +176,227 @@ class Challenge(Base):
     resolution_notes = Column(Text)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     resolved_at = Column(DateTime(timezone=True))
     
     # Relationships
     receipt = relationship("Receipt", back_populates="challenges")
     invoice = relationship("Invoice", back_populates="challenges")
+    
+    __table_args__ = (
+        Index("ix_challenges_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_challenges_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
+class ArchivedDocument(Base):
+    __tablename__ = "archived_documents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_type = Column(String, nullable=False)  # DocumentType value
+    document_id = Column(Integer, nullable=False)  # id of the row it replaced
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    number = Column(String, nullable=False)  # receipt_number or invoice_number
+    total = Column(Float, nullable=False, default=0.0)
+    status = Column(String)  # invoice status at archival time, or "voided" for voided receipts
+    
+    # zlib-compressed JSON of every column of the original row
+    payload = Column(LargeBinary, nullable=False)
+    business_logo_url = Column(String)  # from the business snapshot, for upload cleanup
+    
+    created_at = Column(DateTime(timezone=True), nullable=False)  # of the original document
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("document_type", "document_id", name="uq_archived_documents_document"),
+        Index("ix_archived_documents_user_id_created_at", "user_id", "created_at"),
+        Index("ix_archived_documents_business_logo_url", "business_logo_url"),
+        Index("ix_archived_documents_document_type_number", "document_type", "number"),
+    )
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    document_type = Column(String, nullable=False)  # DocumentType value
+    filename = Column(String, nullable=False)  # as uploaded
+    
+    status = Column(String, default="pending")  # pending, running, completed, failed
+    progress = Column(Float, default=0.0)  # fraction of the file read, 0 to 1
+    rows_processed = Column(Integer, default=0)
+    documents_imported = Column(Integer, default=0)
+    documents_failed = Column(Integer, default=0)
+    error_message = Column(Text)  # set when the whole job fails
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    document_type = Column(String, nullable=False)  # DocumentType value
+    document_id = Column(Integer, nullable=False)  # receipt or invoice id
+    recipient = Column(String, nullable=False)
+    
+    status = Column(String, default="pending")  # pending, sending, sent, dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_until = Column(DateTime(timezone=True))  # lease held by the sending worker
+    last_error = Column(Text)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    document_type = Column(String, nullable=False)  # DocumentType value
+    start_date = Column(DateTime(timezone=True), nullable=False)
+    end_date = Column(DateTime(timezone=True), nullable=False)  # exclusive
+    
+    status = Column(String, default="pending")  # pending, running, completed, failed, expired
+    progress = Column(Float, default=0.0)  # fraction of documents rendered, 0 to 1
+    documents_total = Column(Integer, default=0)
+    documents_exported = Column(Integer, default=0)
+    file_size = Column(Integer)  # bytes, once completed
+    error_message = Column(Text)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), index=True)  # the ZIP is deleted after this
+
+class Customer(Base):
+    __tablename__ = "customers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Identity within a user's directory: lowercased email, or the name when there is none
+    key = Column(String, nullable=False)
+    
+    name = Column(String)
+    email = Column(String)  # lowercased
+    phone = Column(String)
+    address = Column(Text)
+    tax_id = Column(String)
+    search_name = Column(String)  # lowercased name, for prefix search
+    
+    document_count = Column(Integer, nullable=False, default=0)
+    last_used_at = Column(DateTime(timezone=True))  # date of the newest document
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_customers_user_id_key"),
+        # text_pattern_ops lets PostgreSQL use the index for LIKE 'prefix%' in any collation
+        Index("ix_customers_user_id_search_name", "user_id", "search_name", postgresql_ops={"search_name": "text_pattern_ops"}),
+        Index("ix_customers_user_id_email", "user_id", "email", postgresql_ops={"email": "text_pattern_ops"}),
+    )
+
+class Product(Base):
+    __tablename__ = "products"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    key = Column(String, nullable=False)  # lowercased name
+    
+    name = Column(String, nullable=False)
+    description = Column(Text)
+    last_unit_price = Column(Float)
+    
+    usage_count = Column(Integer, nullable=False, default=0)  # line items naming the product
+    last_used_at = Column(DateTime(timezone=True))  # date of the newest document
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("business_id", "key", name="uq_products_business_id_key"),
+    )
+
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    
+    id = Column(Integer, primary_key=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    actor_id = Column(Integer)  # None for public actions; no foreign key, so events outlive deleted users
+    action = Column(String, nullable=False)  # e.g. invoice.updated
+    document_type = Column(String)  # receipt, invoice, challenge or business
+    document_id = Column(Integer)
+    changes_json = Column(Text)  # {field: {"from": old, "to": new}}
+    created_at = Column(DateTime(timezone=True), nullable=False)  # when the change committed
+    
+    __table_args__ = (
+        Index("ix_audit_events_business_id_id", "business_id", "id"),
+        Index("ix_audit_events_business_id_document", "business_id", "document_type", "document_id", "id"),
+    )
+
+class RecurringInvoice(Base):
+    __tablename__ = "recurring_invoices"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    
+    # Copied onto every generated invoice
+    customer_name = Column(String, nullable=False)
+    customer_email = Column(String)
+    customer_phone = Column(String)
+    customer_address = Column(Text)
+    customer_tax_id = Column(String)
+    subtotal = Column(Float, nullable=False, default=0.0)
+    tax_rate = Column(Float, default=0.0)
+    tax_amount = Column(Float, default=0.0)
+    discount = Column(Float, default=0.0)
+    total = Column(Float, nullable=False, default=0.0)
+    payment_terms = Column(String)
+    notes = Column(Text)
+    items_json = Column(Text, nullable=False)
+    
+    # Schedule
+    frequency = Column(String, nullable=False)  # weekly, monthly, quarterly, yearly
+    start_date = Column(DateTime(timezone=True), nullable=False)  # first issue date; sets the day of the month
+    end_date = Column(DateTime(timezone=True))  # no invoices are issued after it
+    due_days = Column(Integer, nullable=False, default=30)  # due date = issue date + due_days
+    send_email = Column(Boolean, nullable=False, default=False)
+    active = Column(Boolean, nullable=False, default=True)
+    occurrences = Column(Integer, nullable=False, default=0)  # invoices generated so far
+    next_run_at = Column(DateTime(timezone=True), nullable=False)  # issue date of the next invoice
+    last_generated_at = Column(DateTime(timezone=True))
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_recurring_invoices_active_next_run_at", "active", "next_run_at"),
+    )
+
+class DashboardStats(Base):
+    __tablename__ = "dashboard_stats"
+    
+    # One row per user, maintained by app/dashboard.py
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    receipt_count = Column(Integer, nullable=False, default=0)  # voided receipts excluded
+    receipt_total = Column(Float, nullable=False, default=0.0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    invoice_total = Column(Float, nullable=False, default=0.0)
+    pending_invoice_count = Column(Integer, nullable=False, default=0)
+    pending_invoice_total = Column(Float, nullable=False, default=0.0)
+    open_challenge_count = Column(Integer, nullable=False, default=0)  # pending challenges on the user's documents
+    # Bumped by every transaction that changes the user's documents; list and document ETags are built from it
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
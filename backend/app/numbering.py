@@ -0,0 +1,32 @@
+"""
+Document number allocation for bulk writes
+"""
+from typing import Callable, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app import archive, models
+
+def allocate_numbers(db: Session, document_type: str, generate: Callable[[], str], count: int) -> List[str]:
+    """Generate a block of numbers that are unique within the block and unused by live or archived documents
+
+    Random numbers are cheap to generate, but across hundreds of thousands of
+    rows collisions become likely and a single one would abort a whole
+    batch insert. One query per table and block checks them all at once.
+    Archived documents keep their numbers, so those are never handed out again.
+    """
+    model, number_column, _ = archive.ARCHIVABLE[document_type]
+    column = getattr(model, number_column)
+    Archived = models.ArchivedDocument
+    numbers = set()
+    while len(numbers) < count:
+        candidates = set()
+        while len(candidates) < count - len(numbers):
+            number = generate()
+            if number not in numbers:
+                candidates.add(number)
+        taken = set(db.scalars(select(column).where(column.in_(candidates))))
+        taken.update(db.scalars(
+            select(Archived.number).where(Archived.document_type == document_type, Archived.number.in_(candidates))
+        ))
+        numbers |= candidates - taken
+    return list(numbers)
@@ -0,0 +1,405 @@
+"""
+Opt-in request profiling: sampled call trees and SQL timings, saved locally
+
+A request is captured when it carries X-Profile-Token: <PROFILE_TOKEN>, or at
+random with probability PROFILE_SAMPLE_RATE. While captures run, a sampler
+thread reads the stacks of the threads serving them every
+PROFILE_INTERVAL_MS. A threadpool thread belongs to a capture while it runs
+the request's endpoint (see instrument()), and otherwise, as for sync
+dependencies, from its first SQL statement until the application frame that
+issued it returns; the event loop thread belongs to it while the request's
+own coroutine is running. Captures are written to disk off the event loop.
+"""
+import asyncio
+import contextvars
+import functools
+import gzip
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.types import Message, Receive, Scope, Send
+from app.database import engine, read_engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATH_PREFIX = os.getenv("PROFILE_PATH_PREFIX", "/api/")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "200"))
+PROFILE_MAX_AGE_HOURS = float(os.getenv("PROFILE_MAX_AGE_HOURS", "72"))
+# Sampled captures beyond this many at once are skipped; token requests always run
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_HEADER = "x-profile-token"
+
+# Never sampled: the admin routes, which carry the token themselves, and long-lived event streams
+EXCLUDED_PREFIXES = ("/api/profiles", "/api/metrics", "/api/events")
+MAX_STATEMENT_LENGTH = 2000
+MAX_STATEMENTS = 1000
+
+APP_ROOT = Path(__file__).resolve().parent.parent
+SITE_MARKERS = ("site-packages", "dist-packages")
+
+_current = contextvars.ContextVar("profile_capture", default=None)
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+def _is_app_file(filename: str) -> bool:
+    return filename.startswith(str(APP_ROOT)) and not any(marker in filename for marker in SITE_MARKERS)
+
+def _label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(str(APP_ROOT)):
+        filename = filename[len(str(APP_ROOT)) + 1:]
+    else:
+        for marker in SITE_MARKERS:
+            if marker in filename:
+                filename = filename.split(marker, 1)[1].lstrip("/\\")
+                break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+class Capture:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.status_code = None
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.anchors = {}  # thread id -> outermost frame of this request on that thread
+        self.stacks = Counter()
+        self.samples = 0
+        self.statements = []
+        self.statements_dropped = 0
+        self.lock = threading.Lock()
+
+    def attach(self, thread_id: int, anchor) -> None:
+        with self.lock:
+            self.anchors[thread_id] = anchor
+
+    def sample(self, frames: dict) -> None:
+        with self.lock:
+            anchors = list(self.anchors.items())
+        for thread_id, anchor in anchors:
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                if frame is anchor:
+                    break
+                frame = frame.f_back
+            if frame is None:
+                # The anchor has returned: this thread is serving something else now
+                continue
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def add_statement(self, statement: str, duration_ms: float, rows: int, many: bool) -> None:
+        with self.lock:
+            if len(self.statements) >= MAX_STATEMENTS:
+                self.statements_dropped += 1
+                return
+            self.statements.append({
+                "offset_ms": round((time.perf_counter() - self.start) * 1000 - duration_ms, 3),
+                "duration_ms": round(duration_ms, 3),
+                "rows": rows,
+                "executemany": many,
+                "thread": threading.current_thread().name,
+                "statement": statement[:MAX_STATEMENT_LENGTH],
+            })
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+        }
+
+    def to_dict(self) -> dict:
+        sql_ms = sum(statement["duration_ms"] for statement in self.statements)
+        return {
+            **self.summary(),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "tree": _tree(self.stacks),
+            # Folded stacks, for flame graph tools
+            "folded": [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()],
+            "sql": {
+                "count": len(self.statements) + self.statements_dropped,
+                "total_ms": round(sql_ms, 3),
+                "statements": self.statements,
+            },
+        }
+
+def _tree(stacks: Counter) -> List[dict]:
+    root = {"children": {}}
+    for stack, count in stacks.items():
+        node = root
+        for name in stack:
+            node = node["children"].setdefault(name, {"name": name, "samples": 0, "children": {}})
+            node["samples"] += count
+
+    def finish(node) -> List[dict]:
+        children = sorted(node["children"].values(), key=lambda child: -child["samples"])
+        return [{"name": child["name"], "samples": child["samples"], "children": finish(child)} for child in children]
+
+    return finish(root)
+
+class Sampler(threading.Thread):
+    """Samples the stacks of every running capture"""
+
+    def __init__(self):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.captures = set()
+        self.lock = threading.Lock()
+        self._active = threading.Event()
+
+    def add(self, capture: Capture) -> None:
+        with self.lock:
+            self.captures.add(capture)
+            self._active.set()
+
+    def remove(self, capture: Capture) -> None:
+        with self.lock:
+            self.captures.discard(capture)
+            if not self.captures:
+                self._active.clear()
+
+    def running(self) -> int:
+        with self.lock:
+            return len(self.captures)
+
+    def run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            self._active.wait()
+            time.sleep(interval)
+            with self.lock:
+                captures = list(self.captures)
+            if not captures:
+                continue
+            frames = sys._current_frames()
+            for capture in captures:
+                capture.sample(frames)
+            del frames
+
+_sampler: Optional[Sampler] = None
+_sampler_lock = threading.Lock()
+
+def _get_sampler() -> Sampler:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler()
+            _sampler.start()
+        return _sampler
+
+def _outermost_app_frame():
+    anchor = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        if _is_app_file(frame.f_code.co_filename):
+            anchor = frame
+        frame = frame.f_back
+    return anchor
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _current.get()
+    if capture is None:
+        return
+    thread_id = threading.get_ident()
+    anchor = capture.anchors.get(thread_id)
+    if anchor is None or not _on_stack(anchor):
+        found = _outermost_app_frame()
+        if found is not None:
+            capture.attach(thread_id, found)
+    conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _current.get()
+    started = conn.info.get("profile_started")
+    if capture is None or not started:
+        return
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+    capture.add_statement(statement, duration_ms, cursor.rowcount, executemany)
+
+def _on_stack(anchor) -> bool:
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame is anchor:
+            return True
+        frame = frame.f_back
+    return False
+
+if enabled():
+    for _engine in {engine, read_engine}:
+        event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+def _attached(endpoint):
+    """Run a sync endpoint with its threadpool thread attached to the request's capture"""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        capture = _current.get()
+        if capture is not None:
+            capture.attach(threading.get_ident(), sys._getframe())
+        return endpoint(*args, **kwargs)
+    return wrapper
+
+def instrument(app: FastAPI) -> None:
+    """Attach threads from the start of sync endpoints, not their first SQL statement
+
+    Call once every router is included. The request handler looks up the
+    endpoint on the route's dependant for each request, so wrapping it there
+    covers routes already built.
+    """
+    if not enabled():
+        return
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = _attached(route.dependant.call)
+
+def _token_matches(value: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN and value) and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+def _trigger(scope: Scope, sampler_busy: int) -> Optional[str]:
+    path = scope["path"]
+    if path.startswith(EXCLUDED_PREFIXES):
+        return None
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER.encode("latin-1"):
+            return "token" if _token_matches(value.decode("latin-1")) else None
+    if (
+        PROFILE_SAMPLE_RATE > 0
+        and path.startswith(PROFILE_PATH_PREFIX)
+        and sampler_busy < PROFILE_MAX_CONCURRENT
+        and random.random() < PROFILE_SAMPLE_RATE
+    ):
+        return "sample"
+    return None
+
+class ProfilingMiddleware:
+    """Captures matching requests to any router; a pass-through otherwise"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+        sampler = _get_sampler()
+        trigger = _trigger(scope, sampler.running())
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(scope["method"], scope["path"], trigger)
+        # This coroutine's frame is on the event loop thread's stack only while
+        # this request's async code runs
+        capture.attach(threading.get_ident(), sys._getframe())
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                capture.status_code = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", capture.id.encode("ascii")))
+            await send(message)
+
+        token = _current.set(capture)
+        sampler.add(capture)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampler.remove(capture)
+            _current.reset(token)
+            capture.duration_ms = round((time.perf_counter() - capture.start) * 1000, 3)
+            try:
+                # gzip, JSON and the retention scan would block every other request
+                await asyncio.get_running_loop().run_in_executor(None, save, capture)
+            except OSError:
+                logger.exception("Could not save profile %s", capture.id)
+
+def save(capture: Capture) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{capture.id}.json.gz"
+    part = path.with_suffix(".part")
+    with gzip.open(part, "wt", encoding="utf-8") as file:
+        json.dump(capture.to_dict(), file)
+    part.replace(path)
+    enforce_retention()
+
+def enforce_retention() -> None:
+    """Keep at most PROFILE_MAX_CAPTURES files, none older than PROFILE_MAX_AGE_HOURS"""
+    cutoff = time.time() - PROFILE_MAX_AGE_HOURS * 3600
+    files = []
+    with os.scandir(PROFILE_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".json.gz"):
+                files.append((entry.stat().st_mtime, entry.path))
+    files.sort(reverse=True)
+    for index, (mtime, path) in enumerate(files):
+        if index >= PROFILE_MAX_CAPTURES or mtime < cutoff:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def list_captures() -> List[dict]:
+    """Summaries of the stored captures, newest first"""
+    if not PROFILE_DIR.exists():
+        return []
+    captures = []
+    for path in sorted(PROFILE_DIR.glob("*.json.gz"), reverse=True):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        captures.append({
+            **{key: data.get(key) for key in ("id", "method", "path", "status_code", "trigger", "started_at", "duration_ms")},
+            "samples": data.get("samples"),
+            "sql_count": data.get("sql", {}).get("count"),
+            "sql_ms": data.get("sql", {}).get("total_ms"),
+        })
+    return captures
+
+def capture_path(capture_id: str) -> Optional[Path]:
+    # Ids are generated here; anything else (e.g. "../") never names a file
+    if not capture_id.replace("-", "").replace("T", "").isalnum():
+        return None
+    path = PROFILE_DIR / f"{capture_id}.json.gz"
+    return path if path.exists() else None
+
+def require_admin(x_profile_token: Optional[str] = Header(None)) -> None:
+    """Dependency for the capture routes: the profiling token is the admin credential"""
+    if not PROFILE_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is not enabled"
+        )
+    if not _token_matches(x_profile_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid profiling token"
+        )
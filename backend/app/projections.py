@@ -0,0 +1,74 @@
+"""
+Summary views and sparse fieldsets (?fields=) for document lists
+"""
+import enum
+import json
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, TypeAdapter, create_model
+from sqlalchemy.orm import Query
+from app import etags
+
+class ListView(str, enum.Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
+# What the dashboard table shows
+SUMMARY_FIELDS = {
+    "receipt": ("id", "receipt_number", "customer_name", "date", "total", "payment_method", "created_at"),
+    "invoice": ("id", "invoice_number", "customer_name", "issue_date", "due_date", "total", "status", "created_at"),
+}
+
+def parse_fields(fields: Optional[str], *schemas) -> Optional[set]:
+    """Field names from ?fields=a,b; each must belong to one of the schemas"""
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names.difference(*(schema.model_fields for schema in schemas))
+    if not names or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "fields must not be empty"
+        )
+    return names
+
+def projection(schema, document_type: str, view: ListView, requested: Optional[set]) -> Optional[Tuple[str, ...]]:
+    """Fields to return in schema order, or None for the full representation"""
+    if requested is not None:
+        return tuple(name for name in schema.model_fields if name in requested or name == "id")
+    if view is ListView.SUMMARY:
+        return SUMMARY_FIELDS[document_type]
+    return None
+
+def load_rows(query: Query, model, names: Tuple[str, ...]) -> List[dict]:
+    """Select only the projected columns; items_json is read only when items is asked for"""
+    columns = [model.items_json if name == "items" else getattr(model, name) for name in names]
+    rows = []
+    for row in query.with_entities(*columns):
+        row = row._asdict()
+        if "items_json" in row:
+            row["items"] = json.loads(row.pop("items_json"))
+        rows.append(row)
+    return rows
+
+@lru_cache(maxsize=256)
+def _adapter(schema, names: Tuple[str, ...]) -> TypeAdapter:
+    fields = {name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in names}
+    return TypeAdapter(List[create_model(f"{schema.__name__}Fields", __base__=BaseModel, **fields)])
+
+def dump(schema, names: Tuple[str, ...], rows: List[dict]) -> bytes:
+    """Validate and serialize rows against the projected part of the schema"""
+    adapter = _adapter(schema, names)
+    return adapter.dump_json(adapter.validate_python(rows))
+
+def etag_parts(*names: Optional[Tuple[str, ...]]) -> tuple:
+    """ETag parts that tell projections apart; empty for the full representation"""
+    if all(projected is None for projected in names):
+        return ()
+    return tuple(",".join(projected) if projected is not None else "*" for projected in names)
+
+def json_response(body: bytes, etag: str) -> Response:
+    response = Response(content=body, media_type="application/json")
+    etags.set_etag(response, etag)
+    return response
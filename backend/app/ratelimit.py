@@ -0,0 +1,121 @@
+"""
+Token-bucket rate limiting for public routes
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException, Request, status
+
+# Per-route limits as "<requests>/<seconds>"; "off" disables a scope.
+# Scopes are checked in this order, so one noisy client is stopped by its own
+# bucket before it can drain the shared ones.
+ROUTE_LIMITS = {
+    "challenge": {
+        "ip": os.getenv("RATE_LIMIT_CHALLENGE_IP", "5/60"),
+        "document": os.getenv("RATE_LIMIT_CHALLENGE_DOCUMENT", "20/3600"),
+        "global": os.getenv("RATE_LIMIT_CHALLENGE_GLOBAL", "100/60"),
+    },
+}
+
+# Only trust X-Forwarded-For when the API sits behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+class Limit:
+    """Bucket capacity and refill rate"""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Limit"]:
+        """Parse "<requests>/<seconds>", returning None when the scope is disabled"""
+        if spec.strip().lower() in ("", "0", "off"):
+            return None
+        count, _, period = spec.partition("/")
+        return cls(int(count), float(period or 1))
+
+class MemoryStore:
+    """Keeps buckets in process memory, evicting the least recently used"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is available"""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                # An evicted bucket starts full next time, which only errs towards allowing
+                self._buckets.popitem(last=False)
+            return wait
+
+class RateLimiter:
+    """Applies route limits against a pluggable bucket store"""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+        self.rejections = Counter()
+
+    def check(self, route: str, keys: Dict[str, str]) -> float:
+        """Consume a token per scope; return 0 if allowed, else the retry delay"""
+        now = time.monotonic()
+        for scope, spec in ROUTE_LIMITS[route].items():
+            limit = Limit.parse(spec)
+            if limit is None or scope not in keys:
+                continue
+            wait = self.store.take(f"{route}:{scope}:{keys[scope]}", limit, now)
+            if wait:
+                self.rejections[f"{route}:{scope}"] += 1
+                return wait
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"rejections": dict(self.rejections)}
+
+limiter = RateLimiter()
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+class RateLimit:
+    """Route dependency that answers 429 before the handler touches the database"""
+
+    def __init__(self, route: str, document_key: Optional[Callable[[dict], Optional[str]]] = None):
+        self.route = route
+        self.document_key = document_key
+
+    async def __call__(self, request: Request):
+        keys = {"ip": client_ip(request), "global": "all"}
+        if self.document_key is not None:
+            try:
+                # FastAPI has already read the body, so this reuses the cached bytes
+                body = await request.json()
+            except ValueError:
+                body = None
+            document = self.document_key(body) if isinstance(body, dict) else None
+            if document:
+                keys["document"] = document
+        wait = limiter.check(self.route, keys)
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please try again later",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
@@ -0,0 +1,152 @@
+"""
+Recurring invoice templates and the batched generation of due invoices
+
+Each template issues an invoice on start_date and then every period after it;
+monthly schedules keep the start date's day of the month (clamped to short
+months). Generation locks a batch of due templates, inserts all of their
+invoices with one multi-row INSERT and moves the templates on in the same
+transaction, so a crashed or repeated run never issues an invoice twice.
+"""
+import calendar
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app import audit, bulk, catalog, customers, dashboard, mailer, models, snapshots
+from app.numbering import allocate_numbers
+from app.routers.invoices import generate_invoice_number
+
+# frequency -> (months, days) between issue dates
+FREQUENCIES = {
+    "weekly": (0, 7),
+    "monthly": (1, 0),
+    "quarterly": (3, 0),
+    "yearly": (12, 0),
+}
+# Missed periods are caught up at most this many per template and run
+MAX_OCCURRENCES_PER_RUN = 12
+
+INVOICE_FIELDS = (
+    "customer_name", "customer_email", "customer_phone", "customer_address", "customer_tax_id",
+    "subtotal", "tax_rate", "tax_amount", "discount", "total", "payment_terms", "notes", "items_json",
+)
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """SQLite returns naive datetimes; they are stored as UTC"""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+def add_months(moment: datetime, months: int) -> datetime:
+    index = moment.month - 1 + months
+    year, month = moment.year + index // 12, index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+def issue_date(start_date: datetime, frequency: str, occurrence: int) -> datetime:
+    """Issue date of the nth invoice (0 = the first) of a schedule"""
+    months, days = FREQUENCIES[frequency]
+    return add_months(as_utc(start_date), months * occurrence) + timedelta(days=days * occurrence)
+
+def invoice_row(template: models.RecurringInvoice, issued_at: datetime, snapshot: dict) -> dict:
+    row = {field: getattr(template, field) for field in INVOICE_FIELDS}
+    row.update(
+        snapshot,
+        user_id=template.user_id,
+        business_id=template.business_id,
+        issue_date=issued_at,
+        due_date=issued_at + timedelta(days=template.due_days),
+        status="pending",
+    )
+    return row
+
+def _advance(template: models.RecurringInvoice, now: datetime) -> list:
+    """Issue dates due for a template, moving its schedule past them"""
+    end_date = as_utc(template.end_date)
+    due = []
+    while len(due) < MAX_OCCURRENCES_PER_RUN:
+        issued_at = as_utc(template.next_run_at)
+        if issued_at > now:
+            break
+        if end_date is not None and issued_at > end_date:
+            template.active = False
+            break
+        due.append(issued_at)
+        template.occurrences += 1
+        template.next_run_at = issue_date(template.start_date, template.frequency, template.occurrences)
+    if end_date is not None and as_utc(template.next_run_at) > end_date:
+        template.active = False
+    if due:
+        template.last_generated_at = now
+    return due
+
+def skip_missed(template: models.RecurringInvoice, now: datetime) -> None:
+    """Move the schedule to its first issue date from now on"""
+    while as_utc(template.next_run_at) < now:
+        template.occurrences += 1
+        template.next_run_at = issue_date(template.start_date, template.frequency, template.occurrences)
+
+def generate_batch(db: Session, now: datetime, after_id: int, batch_size: int) -> Tuple[Optional[int], int]:
+    """Issue the invoices due for the next batch of templates and commit
+
+    Returns the last template id seen (None when no due templates are left)
+    and the number of invoices created. Templates locked by a concurrent run
+    are skipped.
+    """
+    Template = models.RecurringInvoice
+    templates = db.query(Template).filter(
+        Template.active.is_(True),
+        Template.next_run_at <= now,
+        Template.id > after_id
+    ).order_by(Template.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not templates:
+        return None, 0
+
+    due = [(template, issued_at) for template in templates for issued_at in _advance(template, now)]
+    if due:
+        # The business header as it is when the invoice is issued
+        business_snapshots = {
+            business.id: snapshots.columns(business)
+            for business in db.query(models.Business).filter(
+                models.Business.id.in_({template.business_id for template, _ in due})
+            )
+        }
+        rows = [invoice_row(template, issued_at, business_snapshots[template.business_id]) for template, issued_at in due]
+        numbers = allocate_numbers(db, models.DocumentType.INVOICE.value, generate_invoice_number, len(rows))
+        for row, number in zip(rows, numbers):
+            row["invoice_number"] = number
+        ids = db.scalars(
+            insert(models.Invoice).returning(models.Invoice.id, sort_by_parameter_order=True), rows
+        ).all()
+        _after_insert(db, due, rows, ids)
+    db.commit()
+    return templates[-1].id, len(due)
+
+def _after_insert(db: Session, due: list, rows: list, ids: list) -> None:
+    """Directory, catalog, audit, email and event side effects of the new invoices"""
+    customer_rows, product_rows, ids_by_user = defaultdict(list), defaultdict(list), defaultdict(list)
+    emails, audit_rows = [], []
+    for (template, issued_at), row, invoice_id in zip(due, rows, ids):
+        customer_rows[template.user_id].append(customers.from_document(row, issued_at))
+        product_rows[template.business_id].extend(catalog.from_items(json.loads(row["items_json"]), issued_at))
+        ids_by_user[template.user_id].append(invoice_id)
+        dashboard.add(db, template.user_id, **dashboard.invoice_deltas(row["status"], row["total"]))
+        audit_rows.append(audit.entry(
+            template.business_id, None, "invoice.generated", models.DocumentType.INVOICE.value, invoice_id,
+            {"recurring_invoice_id": {"from": None, "to": template.id}}
+        ))
+        if template.send_email and template.customer_email:
+            emails.append({
+                "user_id": template.user_id,
+                "document_type": models.DocumentType.INVOICE.value,
+                "document_id": invoice_id,
+                "recipient": template.customer_email,
+            })
+    customers.upsert_many(db, customer_rows)
+    catalog.upsert_many(db, product_rows)
+    mailer.enqueue_many(db, emails)
+    # A batch can issue more invoices than the audit queue holds
+    audit.insert_now(db, audit_rows)
+    for user_id, invoice_ids in ids_by_user.items():
+        bulk.publish(db, user_id, models.DocumentType.INVOICE.value, "invoices.created", invoice_ids, {"recurring": True})
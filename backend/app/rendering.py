@@ -0,0 +1,194 @@
+"""
+Plain-text, HTML and PDF renderings of receipts and invoices
+"""
+import io
+from datetime import datetime
+from html import escape
+from app.models import DocumentType
+
+def money(value) -> str:
+    return f"${(value or 0):,.2f}"
+
+def format_date(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        # Archived documents carry ISO strings
+        value = datetime.fromisoformat(value)
+    return value.strftime("%B %d, %Y")
+
+def document_number(document_type: str, document: dict) -> str:
+    if document_type == DocumentType.INVOICE.value:
+        return document["invoice_number"]
+    return document["receipt_number"]
+
+def document_title(document_type: str, document: dict) -> str:
+    label = "Invoice" if document_type == DocumentType.INVOICE.value else "Receipt"
+    return f"{label} {document_number(document_type, document)}"
+
+def _business_lines(business) -> list:
+    locality = " ".join(part for part in (business.city, business.state, business.zip_code) if part)
+    lines = [business.address, locality, business.country, business.phone, business.email, business.website]
+    if business.tax_id:
+        lines.append(f"Tax ID: {business.tax_id}")
+    return [line for line in lines if line]
+
+def _details(document_type: str, document: dict) -> list:
+    """(label, value) pairs shown under the title"""
+    if document_type == DocumentType.INVOICE.value:
+        details = [
+            ("Issue date", format_date(document.get("issue_date"))),
+            ("Due date", format_date(document.get("due_date"))),
+            ("Status", (document.get("status") or "").title()),
+            ("Payment terms", document.get("payment_terms")),
+        ]
+    else:
+        details = [
+            ("Date", format_date(document.get("date"))),
+            ("Payment method", document.get("payment_method")),
+        ]
+    if document.get("voided_at"):
+        details.insert(0, ("Voided", format_date(document["voided_at"])))
+    customer = [document.get("customer_name"), document.get("customer_email"), document.get("customer_phone"), document.get("customer_address")]
+    details.append(("Bill to", ", ".join(part for part in customer if part)))
+    if document.get("customer_tax_id"):
+        details.append(("Customer tax ID", document["customer_tax_id"]))
+    return [(label, value) for label, value in details if value]
+
+def _totals(document: dict) -> list:
+    totals = [("Subtotal", money(document["subtotal"]))]
+    if document.get("discount"):
+        totals.append(("Discount", f"-{money(document['discount'])}"))
+    if document.get("tax_amount"):
+        totals.append((f"Tax ({document.get('tax_rate') or 0:g}%)", money(document["tax_amount"])))
+    totals.append(("Total", money(document["total"])))
+    return totals
+
+def render_text(document_type: str, document: dict, business) -> str:
+    lines = [business.name, *_business_lines(business), "", document_title(document_type, document), ""]
+    lines += [f"{label}: {value}" for label, value in _details(document_type, document)]
+    lines.append("")
+    for item in document["items"]:
+        lines.append(f"{item['name']}  {item['quantity']:g} x {money(item['unit_price'])} = {money(item['total'])}")
+        if item.get("description"):
+            lines.append(f"  {item['description']}")
+    lines.append("")
+    lines += [f"{label}: {value}" for label, value in _totals(document)]
+    if document.get("notes"):
+        lines += ["", document["notes"]]
+    return "\n".join(lines) + "\n"
+
+def render_html(document_type: str, document: dict, business) -> str:
+    business_lines = "".join(f"<div>{escape(line)}</div>" for line in _business_lines(business))
+    logo = f'<img src="{escape(business.logo_url)}" alt="" style="max-height:64px">' if business.logo_url else ""
+    details = "".join(
+        f"<tr><td style=\"color:#666;padding-right:16px\">{escape(label)}</td><td>{escape(str(value))}</td></tr>"
+        for label, value in _details(document_type, document)
+    )
+    items = "".join(
+        "<tr>"
+        f"<td style=\"padding:6px 0\">{escape(item['name'])}"
+        + (f"<div style=\"color:#666;font-size:12px\">{escape(item['description'])}</div>" if item.get("description") else "")
+        + "</td>"
+        f"<td align=\"right\">{item['quantity']:g}</td>"
+        f"<td align=\"right\">{money(item['unit_price'])}</td>"
+        f"<td align=\"right\">{money(item['total'])}</td>"
+        "</tr>"
+        for item in document["items"]
+    )
+    totals = "".join(
+        f"<tr><td colspan=\"3\" align=\"right\">{escape(label)}</td><td align=\"right\">{escape(value)}</td></tr>"
+        for label, value in _totals(document)
+    )
+    notes = f"<p style=\"color:#444\">{escape(document['notes'])}</p>" if document.get("notes") else ""
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        f"<title>{escape(document_title(document_type, document))}</title></head>"
+        "<body style=\"font-family:Helvetica,Arial,sans-serif;color:#222;max-width:640px;margin:0 auto;padding:24px\">"
+        f"{logo}<h2 style=\"margin:8px 0\">{escape(business.name)}</h2>"
+        f"<div style=\"color:#666;font-size:13px\">{business_lines}</div>"
+        f"<h3 style=\"margin-top:24px\">{escape(document_title(document_type, document))}</h3>"
+        f"<table style=\"font-size:14px\">{details}</table>"
+        "<table width=\"100%\" style=\"margin-top:16px;border-collapse:collapse;font-size:14px\">"
+        "<tr style=\"border-bottom:1px solid #ddd\"><th align=\"left\">Item</th><th align=\"right\">Qty</th>"
+        "<th align=\"right\">Price</th><th align=\"right\">Amount</th></tr>"
+        f"{items}{totals}</table>{notes}"
+        "</body></html>"
+    )
+
+def render_pdf(document_type: str, document: dict, business) -> bytes:
+    """Render a one-document PDF; pure function, so it can run in a worker process"""
+    try:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen.canvas import Canvas
+    except ImportError:
+        raise RuntimeError("Install reportlab to render PDFs")
+
+    buffer = io.BytesIO()
+    pdf = Canvas(buffer, pagesize=letter, pageCompression=1, invariant=1)
+    pdf.setTitle(document_title(document_type, document))
+    width, height = letter
+    margin = 54
+    right = width - margin
+    columns = (right - 210, right - 120, right)  # Qty, Price, Amount (right-aligned)
+    y = height - margin
+
+    def line(text, size=10, font="Helvetica", x=margin, step=None):
+        nonlocal y
+        pdf.setFont(font, size)
+        pdf.drawString(x, y, text)
+        y -= step or size + 4
+
+    def ensure_room(needed):
+        nonlocal y
+        if y - needed < margin:
+            pdf.showPage()
+            y = height - margin
+
+    line(business.name, size=16, font="Helvetica-Bold", step=22)
+    for business_line in _business_lines(business):
+        line(business_line, size=9)
+    y -= 14
+    line(document_title(document_type, document), size=13, font="Helvetica-Bold", step=20)
+    for label, value in _details(document_type, document):
+        pdf.setFont("Helvetica", 9)
+        pdf.drawString(margin, y, label)
+        line(str(value)[:90], size=10, x=margin + 100)
+    y -= 12
+
+    pdf.setFont("Helvetica-Bold", 10)
+    pdf.drawString(margin, y, "Item")
+    for x, heading in zip(columns, ("Qty", "Price", "Amount")):
+        pdf.drawRightString(x, y, heading)
+    y -= 6
+    pdf.line(margin, y, right, y)
+    y -= 14
+    for item in document["items"]:
+        ensure_room(30)
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(margin, y, str(item["name"])[:60])
+        pdf.drawRightString(columns[0], y, f"{item['quantity']:g}")
+        pdf.drawRightString(columns[1], y, money(item["unit_price"]))
+        pdf.drawRightString(columns[2], y, money(item["total"]))
+        y -= 14
+        if item.get("description"):
+            line(str(item["description"])[:90], size=8, step=12)
+    y -= 4
+    pdf.line(columns[0] - 40, y + 10, right, y + 10)
+
+    ensure_room(80)
+    for label, value in _totals(document):
+        font = "Helvetica-Bold" if label == "Total" else "Helvetica"
+        pdf.setFont(font, 10)
+        pdf.drawRightString(columns[1], y, label)
+        pdf.drawRightString(columns[2], y, value)
+        y -= 15
+    if document.get("notes"):
+        y -= 10
+        for note_line in document["notes"].splitlines():
+            ensure_room(14)
+            line(note_line[:100], size=9)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
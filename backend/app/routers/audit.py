@@ -0,0 +1,50 @@
+"""
+Audit log routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+from app.database import get_read_db
+from app import models, schemas, auth
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.AuditEventResponse])
+def get_audit_events(
+    document_type: Optional[str] = None,
+    document_id: Optional[int] = None,
+    before: Optional[int] = Query(None, description="Return events older than this event id"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Audit events for the business, or for one of its documents, newest first"""
+    if (document_type is None) != (document_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="document_type and document_id must be given together"
+        )
+    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business profile not found. Please create one first."
+        )
+    
+    query = db.query(models.AuditEvent).filter(models.AuditEvent.business_id == business.id)
+    if document_type is not None:
+        query = query.filter(
+            models.AuditEvent.document_type == document_type,
+            models.AuditEvent.document_id == document_id
+        )
+    if before is not None:
+        query = query.filter(models.AuditEvent.id < before)
+    
+    return [
+        schemas.AuditEventResponse(
+            **{c.name: getattr(event, c.name) for c in event.__table__.columns if c.name != "changes_json"},
+            changes=json.loads(event.changes_json) if event.changes_json else None
+        )
+        for event in query.order_by(models.AuditEvent.id.desc()).limit(limit)
+    ]
@@ -60,6 +60,6 @@ def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UserResponse)
-def get_current_user_info(current_user: models.User = Depends(auth.get_current_user)):
+def get_current_user_info(current_user: models.User = Depends(auth.get_current_reader)):
     """Get current user information"""
     return current_user
@@ -3,8 +3,8 @@ Business profile routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models, schemas, auth
+from app.database import get_db, get_read_db
+from app import models, schemas, auth, audit
 
 router = APIRouter()
 
@@ -47,7 +47,12 @@ def create_business(
     
     if db_business:
         # Update existing business
-        for key, value in business_data.model_dump(exclude_unset=True).items():
+        updates = business_data.model_dump(exclude_unset=True)
+        audit.record(
+            db, db_business.id, current_user.id, "business.updated",
+            "business", db_business.id, audit.changes(db_business, updates)
+        )
+        for key, value in updates.items():
             setattr(db_business, key, value)
         db.commit()
         db.refresh(db_business)
@@ -59,14 +64,16 @@ def create_business(
             **business_data.model_dump()
         )
         db.add(db_business)
+        db.flush()
+        audit.record(db, db_business.id, current_user.id, "business.created", "business", db_business.id)
         db.commit()
         db.refresh(db_business)
         return db_business
 
 @router.get("/", response_model=schemas.BusinessResponse)
 def get_business(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get current user's business profile"""
     db_business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
@@ -95,7 +102,12 @@ def update_business(
         )
     
     # Update fields
-    for key, value in business_data.model_dump(exclude_unset=True).items():
+    updates = business_data.model_dump(exclude_unset=True)
+    audit.record(
+        db, db_business.id, current_user.id, "business.updated",
+        "business", db_business.id, audit.changes(db_business, updates)
+    )
+    for key, value in updates.items():
         # Validate required fields if they're being updated
         if key in ['name', 'address', 'city', 'state', 'zip_code'] and (not value or not value.strip()):
             raise HTTPException(
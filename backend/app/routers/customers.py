@@ -0,0 +1,31 @@
+"""
+Customer directory routes
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from typing import List
+from app.database import get_read_db
+from app import models, schemas, auth, customers
+
+router = APIRouter()
+
+@router.get("/suggest", response_model=List[schemas.CustomerResponse])
+def suggest_customers(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Past customers whose name or email starts with q, most used first"""
+    pattern = customers.escape_like(q.strip().lower()) + "%"
+    return db.query(models.Customer).filter(
+        models.Customer.user_id == current_user.id,
+        or_(
+            models.Customer.search_name.like(pattern, escape="\\"),
+            models.Customer.email.like(pattern, escape="\\")
+        )
+    ).order_by(
+        models.Customer.document_count.desc(),
+        models.Customer.last_used_at.desc()
+    ).limit(limit).all()
@@ -0,0 +1,21 @@
+"""
+Dashboard routes
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.database import get_read_db
+from app import models, schemas, auth, dashboard
+
+router = APIRouter()
+
+@router.get("/summary", response_model=schemas.DashboardSummary)
+def get_summary(
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Document counts and totals, pending invoices and open challenges"""
+    stats = db.get(models.DashboardStats, current_user.id)
+    if stats is None:
+        # Nothing created yet
+        return schemas.DashboardSummary(**dict.fromkeys(dashboard.COUNTERS, 0))
+    return stats
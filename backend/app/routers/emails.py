@@ -0,0 +1,88 @@
+"""
+Email delivery routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.database import get_db
+from app import models, schemas, auth, archive, mailer
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.EmailOutboxResponse])
+def get_emails(
+    email_status: Optional[str] = None,
+    limit: int = 100,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get recent outgoing emails and their delivery status"""
+    query = db.query(models.EmailOutbox).filter(models.EmailOutbox.user_id == current_user.id)
+    if email_status:
+        query = query.filter(models.EmailOutbox.status == email_status)
+    return query.order_by(models.EmailOutbox.created_at.desc()).limit(min(limit, 500)).all()
+
+# Declared before /{document_type}/{document_id}, which would otherwise match it
+@router.post("/{email_id}/retry", response_model=schemas.EmailOutboxResponse)
+def retry_email(
+    email_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Requeue a dead-lettered email"""
+    entry = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.id == email_id,
+        models.EmailOutbox.user_id == current_user.id
+    ).first()
+    if not entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Email not found"
+        )
+    if entry.status != "dead":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only failed emails can be retried"
+        )
+
+    mailer.requeue(db, entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+@router.post("/{document_type}/{document_id}", response_model=schemas.EmailOutboxResponse, status_code=status.HTTP_202_ACCEPTED)
+def send_document(
+    document_type: models.DocumentType,
+    document_id: int,
+    email_data: schemas.EmailRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a receipt or invoice to be emailed"""
+    model = mailer.DOCUMENT_MODELS[document_type.value]
+    document = db.query(model.customer_email).filter(
+        model.id == document_id,
+        model.user_id == current_user.id
+    ).first()
+    if document is not None:
+        customer_email = document.customer_email
+    else:
+        archived = archive.load_document(db, document_type.value, document_id, current_user.id)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{document_type.value.title()} not found"
+            )
+        customer_email = archived.get("customer_email")
+
+    recipient = email_data.recipient or customer_email
+    if not recipient:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No recipient given and the document has no customer_email"
+        )
+
+    entry = mailer.enqueue(db, current_user.id, document_type.value, document_id, recipient)
+    db.commit()
+    db.refresh(entry)
+    return entry
@@ -0,0 +1,154 @@
+"""
+Bulk PDF export routes
+"""
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from pathlib import Path
+from typing import Optional, Tuple
+from app.database import get_db
+from app import models, schemas, auth, exporter
+
+router = APIRouter()
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def get_owned_job(db: Session, job_id: int, user_id: int) -> models.ExportJob:
+    job = db.query(models.ExportJob).filter(
+        models.ExportJob.id == job_id,
+        models.ExportJob.user_id == user_id
+    ).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export job not found"
+        )
+    return job
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the (first, last) byte of a single-range header; None means send the whole file"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the final N bytes
+            length = int(last)
+            if length == 0:
+                raise ValueError("empty suffix range")
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def read_range(path: Path, start: int, end: int):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            chunk = file.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+@router.post("/", response_model=schemas.ExportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def start_export(
+    export_data: schemas.ExportCreate,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Export the receipts or invoices in a date range as a ZIP of PDFs"""
+    # Starting an export also clears out old ones, so disk use stays bounded without the job
+    exporter.expire_exports(db)
+    if export_data.end_date <= export_data.start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_date must be after start_date"
+        )
+
+    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business profile not found. Please create one first."
+        )
+
+    job = models.ExportJob(
+        user_id=current_user.id,
+        document_type=export_data.document_type.value,
+        start_date=export_data.start_date,
+        end_date=export_data.end_date
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    background_tasks.add_task(exporter.run_export, job.id)
+    return job
+
+@router.get("/{job_id}", response_model=schemas.ExportJobResponse)
+def get_export(
+    job_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of an export job"""
+    return get_owned_job(db, job_id, current_user.id)
+
+@router.get("/{job_id}/download")
+def download_export(
+    job_id: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download a finished export; supports Range requests for resuming"""
+    job = get_owned_job(db, job_id, current_user.id)
+    if exporter.is_expired(job):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Export has expired; start a new one"
+        )
+    path = exporter.archive_path(job)
+    if job.status != "completed" or not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export not available yet"
+        )
+
+    size = path.stat().st_size
+    filename = f"{job.document_type}s-{job.start_date:%Y%m%d}-{job.end_date:%Y%m%d}.zip"
+    etag = f'"export-{job.id}-{size}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only resume when the client's partial copy is of this same file
+    byte_range = parse_range(range_header, size) if range_header and (not if_range or if_range == etag) else None
+    if byte_range is None:
+        return FileResponse(path, media_type="application/zip", filename=filename, headers=headers)
+
+    start, end = byte_range
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{size}",
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+    return StreamingResponse(
+        read_range(path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="application/zip",
+        headers=headers
+    )
@@ -1,23 +1,107 @@
 """
 History and challenge routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import func, select, text
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import base64
+import binascii
 import json
-from app.database import get_db
-from app import models, schemas, auth
+from datetime import datetime, timedelta, timezone
+from app.database import get_db, get_read_db
+from app import models, schemas, auth, archive, cache, etags, events, projections, ratelimit, timeline, audit, dashboard
 
 router = APIRouter()
 
+DOCUMENT_TYPES = (models.DocumentType.RECEIPT.value, models.DocumentType.INVOICE.value)
+
+# Rows are stamped with their transaction's start time, so a transaction still
+# running when a token is handed out can later commit changes dated before it.
+# On PostgreSQL tokens are held back to the start of the oldest transaction
+# that has written anything (an import chunk, a recurring batch, a bulk update
+# or an update waiting on a row lock can run for a while), and by at least
+# SYNC_TOKEN_LAG. Changes after the token may be sent twice, but none dated
+# before it can still commit. pg_stat_activity only shows the start of
+# sessions of the same database role (or to pg_read_all_stats), which is what
+# the application writes with. SQLite runs one write transaction at a time and
+# keeps just the margin.
+SYNC_TOKEN_LAG = timedelta(seconds=5)
+SYNC_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+SYNC_WATERMARK = text(
+    "SELECT least(now() - make_interval(secs => :lag), "
+    "(SELECT min(xact_start) FROM pg_stat_activity "
+    "WHERE backend_xid IS NOT NULL AND datname = current_database()))"
+)
+
+def encode_sync_token(moment: datetime) -> str:
+    """Encode a change watermark as an opaque URL-safe token"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return base64.urlsafe_b64encode(moment.isoformat().encode("utf-8")).decode("ascii").rstrip("=")
+
+def sync_watermark(db: Session) -> datetime:
+    """The newest moment no uncommitted change can be dated before"""
+    if db.get_bind().dialect.name == "postgresql":
+        moment = db.scalar(SYNC_WATERMARK, {"lag": SYNC_TOKEN_LAG.total_seconds()})
+    else:
+        moment = db.scalar(select(func.now()))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        moment -= SYNC_TOKEN_LAG
+    return moment
+
+def decode_sync_token(token: str) -> datetime:
+    """Decode a token produced by encode_sync_token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        moment = datetime.fromisoformat(base64.urlsafe_b64decode(padded).decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sync token"
+        )
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
 @router.get("/", response_model=schemas.HistoryResponse)
 def get_history(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    view: projections.ListView = projections.ListView.FULL,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; each list gets the ones it has"),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get all receipts and invoices for current user"""
-    receipts = db.query(models.Receipt).filter(models.Receipt.user_id == current_user.id).order_by(models.Receipt.created_at.desc()).all()
-    invoices = db.query(models.Invoice).filter(models.Invoice.user_id == current_user.id).order_by(models.Invoice.created_at.desc()).all()
+    requested = projections.parse_fields(fields, schemas.ReceiptResponse, schemas.InvoiceResponse)
+    receipt_names = projections.projection(schemas.ReceiptResponse, models.DocumentType.RECEIPT.value, view, requested)
+    invoice_names = projections.projection(schemas.InvoiceResponse, models.DocumentType.INVOICE.value, view, requested)
+    etag = etags.make_etag(
+        "history", current_user.id, *projections.etag_parts(receipt_names, invoice_names),
+        etags.user_version(db, current_user.id)
+    )
+    if etags.is_not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    
+    receipt_query = db.query(models.Receipt).filter(
+        models.Receipt.user_id == current_user.id,
+        models.Receipt.voided_at.is_(None)
+    ).order_by(models.Receipt.created_at.desc())
+    invoice_query = db.query(models.Invoice).filter(models.Invoice.user_id == current_user.id).order_by(models.Invoice.created_at.desc())
+    archived_until = archive.horizon(db, current_user.id, *DOCUMENT_TYPES)
+    if receipt_names is not None:
+        receipt_rows = projections.load_rows(receipt_query, models.Receipt, receipt_names)
+        invoice_rows = projections.load_rows(invoice_query, models.Invoice, invoice_names)
+        body = b'{"receipts":%s,"invoices":%s,"archived_until":%s}' % (
+            projections.dump(schemas.ReceiptResponse, receipt_names, receipt_rows),
+            projections.dump(schemas.InvoiceResponse, invoice_names, invoice_rows),
+            json.dumps(archived_until.isoformat() if archived_until else None).encode("utf-8")
+        )
+        return projections.json_response(body, etag)
+    receipts = receipt_query.all()
+    invoices = invoice_query.all()
     
     receipt_list = []
     for receipt in receipts:
@@ -35,9 +119,81 @@ def get_history(
         }
         invoice_list.append(schemas.InvoiceResponse(**invoice_dict))
     
-    return schemas.HistoryResponse(receipts=receipt_list, invoices=invoice_list)
+    etags.set_etag(response, etag)
+    return schemas.HistoryResponse(receipts=receipt_list, invoices=invoice_list, archived_until=archived_until)
+
+@router.get("/timeline", response_model=schemas.TimelineResponse)
+def get_timeline(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Receipts, invoices and challenges newest first; pass next_cursor to get the next page"""
+    page = timeline.page(db, current_user.id, limit, cursor)
+    page["archived_until"] = archive.horizon(db, current_user.id, *DOCUMENT_TYPES)
+    return page
+
+@router.get("/changes", response_model=schemas.HistoryChangesResponse)
+def get_history_changes(
+    since: Optional[str] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get receipts, invoices and challenges changed since a sync token"""
+    # Stays on the primary: a lagging replica would hand out tokens ahead of its data
+    # Read the watermark before the changes so nothing committed in between is skipped
+    watermark = sync_watermark(db)
+    since_moment = decode_sync_token(since) if since else None
+    
+    receipt_query = db.query(models.Receipt).filter(models.Receipt.user_id == current_user.id)
+    invoice_query = db.query(models.Invoice).filter(models.Invoice.user_id == current_user.id)
+    challenge_query = db.query(models.Challenge).filter(models.Challenge.user_id == current_user.id)
+    if since_moment:
+        receipt_query = receipt_query.filter(models.Receipt.updated_at > since_moment)
+        invoice_query = invoice_query.filter(models.Invoice.updated_at > since_moment)
+        challenge_query = challenge_query.filter(models.Challenge.updated_at > since_moment)
+    
+    receipt_list = []
+    for receipt in receipt_query.order_by(models.Receipt.updated_at).all():
+        receipt_dict = {
+            **{c.name: getattr(receipt, c.name) for c in receipt.__table__.columns},
+            "items": json.loads(receipt.items_json)
+        }
+        receipt_list.append(schemas.ReceiptResponse(**receipt_dict))
+    
+    invoice_list = []
+    for invoice in invoice_query.order_by(models.Invoice.updated_at).all():
+        invoice_dict = {
+            **{c.name: getattr(invoice, c.name) for c in invoice.__table__.columns},
+            "items": json.loads(invoice.items_json)
+        }
+        invoice_list.append(schemas.InvoiceResponse(**invoice_dict))
+    
+    challenges = challenge_query.order_by(models.Challenge.updated_at).all()
+    
+    next_moment = max(watermark, since_moment or SYNC_EPOCH)
+    return schemas.HistoryChangesResponse(
+        receipts=receipt_list,
+        invoices=invoice_list,
+        challenges=challenges,
+        next_token=encode_sync_token(next_moment),
+        archived_until=archive.horizon(db, current_user.id, *DOCUMENT_TYPES)
+    )
+
+def challenged_document(body: dict) -> Optional[str]:
+    """Rate-limit key for the document a challenge targets"""
+    if body.get("receipt_id"):
+        return f"receipt:{body['receipt_id']}"
+    if body.get("invoice_id"):
+        return f"invoice:{body['invoice_id']}"
+    return None
 
-@router.post("/challenge", response_model=schemas.ChallengeResponse)
+@router.post(
+    "/challenge",
+    response_model=schemas.ChallengeResponse,
+    dependencies=[Depends(ratelimit.RateLimit("challenge", document_key=challenged_document))]
+)
 def create_challenge(
     challenge_data: schemas.ChallengeCreate,
     db: Session = Depends(get_db)
@@ -50,27 +206,36 @@ def create_challenge(
             detail="Either receipt_id or invoice_id must be provided"
         )
     
-    # Verify receipt or invoice exists
+    # Verify receipt or invoice exists; the key-share lock keeps the archive job
+    # from moving it away before the challenge commits
+    owner_id = business_id = None
     if challenge_data.receipt_id:
-        receipt = db.query(models.Receipt).filter(models.Receipt.id == challenge_data.receipt_id).first()
+        receipt = db.query(models.Receipt).filter(
+            models.Receipt.id == challenge_data.receipt_id
+        ).with_for_update(read=True, key_share=True).first()
         if not receipt:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Receipt not found"
             )
+        owner_id, business_id = receipt.user_id, receipt.business_id
     
     if challenge_data.invoice_id:
-        invoice = db.query(models.Invoice).filter(models.Invoice.id == challenge_data.invoice_id).first()
+        invoice = db.query(models.Invoice).filter(
+            models.Invoice.id == challenge_data.invoice_id
+        ).with_for_update(read=True, key_share=True).first()
         if not invoice:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Invoice not found"
             )
+        owner_id, business_id = invoice.user_id, invoice.business_id
     
     # Create challenge
     db_challenge = models.Challenge(
         receipt_id=challenge_data.receipt_id,
         invoice_id=challenge_data.invoice_id,
+        user_id=owner_id,
         challenger_name=challenge_data.challenger_name,
         challenger_email=challenge_data.challenger_email,
         challenger_phone=challenge_data.challenger_phone,
@@ -78,6 +243,14 @@ def create_challenge(
     )
     
     db.add(db_challenge)
+    db.flush()
+    audit.record(db, business_id, None, "challenge.created", "challenge", db_challenge.id)
+    dashboard.add(db, owner_id, open_challenge_count=1)
+    events.emit(db, owner_id, "challenge.created", {
+        "id": db_challenge.id,
+        "receipt_id": db_challenge.receipt_id,
+        "invoice_id": db_challenge.invoice_id,
+    })
     db.commit()
     db.refresh(db_challenge)
     
@@ -85,25 +258,14 @@ def create_challenge(
 
 @router.get("/challenges", response_model=List[schemas.ChallengeResponse])
 def get_challenges(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get all challenges for current user's receipts and invoices"""
-    # Get user's business
-    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
-    if not business:
-        return []
-    
-    # Get challenges for receipts
-    receipt_ids = [r.id for r in db.query(models.Receipt).filter(models.Receipt.business_id == business.id).all()]
-    invoice_ids = [i.id for i in db.query(models.Invoice).filter(models.Invoice.business_id == business.id).all()]
-    
-    challenges = db.query(models.Challenge).filter(
-        (models.Challenge.receipt_id.in_(receipt_ids)) | 
-        (models.Challenge.invoice_id.in_(invoice_ids))
-    ).order_by(models.Challenge.created_at.desc()).all()
-    
-    return challenges
+    # user_id is the challenged document's owner, so ix_challenges_user_id_created_at serves this directly
+    return db.query(models.Challenge).filter(
+        models.Challenge.user_id == current_user.id
+    ).order_by(models.Challenge.created_at.desc(), models.Challenge.id.desc()).all()
 
 @router.patch("/challenges/{challenge_id}", response_model=schemas.ChallengeResponse)
 def resolve_challenge(
@@ -114,7 +276,10 @@ def resolve_challenge(
     db: Session = Depends(get_db)
 ):
     """Resolve a challenge (only by the business owner)"""
-    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+    # Locked: the open challenge count moves by the change from the current status
+    challenge = db.query(models.Challenge).filter(
+        models.Challenge.id == challenge_id
+    ).with_for_update().first()
     if not challenge:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -152,12 +317,31 @@ def resolve_challenge(
             )
     
     # Update challenge
+    audit.record(
+        db, business.id, current_user.id, "challenge.resolved", "challenge", challenge.id,
+        audit.changes(challenge, {"status": status, "resolution_notes": resolution_notes})
+    )
+    reopened = (status == models.ChallengeStatus.PENDING) - (challenge.status == models.ChallengeStatus.PENDING)
+    dashboard.add(db, challenge.user_id, open_challenge_count=reopened)
     challenge.status = status
     challenge.resolution_notes = resolution_notes
     if status != models.ChallengeStatus.PENDING:
         from datetime import datetime
         challenge.resolved_at = datetime.utcnow()
     
+    # Refresh cached copies of the challenged document along with the resolution
+    tags = []
+    if challenge.receipt_id:
+        tags.append(cache.document_tag(models.DocumentType.RECEIPT.value, challenge.receipt_id))
+    if challenge.invoice_id:
+        tags.append(cache.document_tag(models.DocumentType.INVOICE.value, challenge.invoice_id))
+    events.invalidate_cache(db, tags)
+    events.emit(db, current_user.id, "challenge.resolved", {
+        "id": challenge.id,
+        "receipt_id": challenge.receipt_id,
+        "invoice_id": challenge.invoice_id,
+        "status": challenge.status,
+    })
     db.commit()
     db.refresh(challenge)
     
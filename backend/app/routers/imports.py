@@ -0,0 +1,107 @@
+"""
+Bulk import routes
+"""
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from pathlib import Path
+import os
+from app.database import get_db
+from app import models, schemas, auth, importer
+
+router = APIRouter()
+
+MAX_IMPORT_SIZE = int(os.getenv("MAX_IMPORT_SIZE_MB", "200")) * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def get_owned_job(db: Session, job_id: int, user_id: int) -> models.ImportJob:
+    job = db.query(models.ImportJob).filter(
+        models.ImportJob.id == job_id,
+        models.ImportJob.user_id == user_id
+    ).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found"
+        )
+    return job
+
+@router.post("/{document_type}", response_model=schemas.ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def start_import(
+    document_type: models.DocumentType,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a CSV or XLSX file of receipts or invoices to import in the background"""
+    if Path(file.filename or "").suffix.lower() not in importer.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file type. Allowed types: {', '.join(sorted(importer.ALLOWED_EXTENSIONS))}"
+        )
+    
+    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business profile not found. Please create one first."
+        )
+    
+    job = models.ImportJob(
+        user_id=current_user.id,
+        business_id=business.id,
+        document_type=document_type.value,
+        filename=file.filename
+    )
+    db.add(job)
+    db.flush()
+    
+    # Copy the upload to disk in chunks, stopping as soon as it is too large;
+    # the import reads it back as a stream
+    importer.IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = importer.source_path(job)
+    size = 0
+    with open(path, "wb") as destination:
+        while chunk := file.file.read(COPY_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_IMPORT_SIZE:
+                break
+            destination.write(chunk)
+    if size > MAX_IMPORT_SIZE:
+        path.unlink()
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File too large. Maximum size is {MAX_IMPORT_SIZE / 1024 / 1024}MB"
+        )
+    
+    db.commit()
+    db.refresh(job)
+    background_tasks.add_task(importer.run_import, job.id)
+    return job
+
+@router.get("/{job_id}", response_model=schemas.ImportJobResponse)
+def get_import(
+    job_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of an import job"""
+    return get_owned_job(db, job_id, current_user.id)
+
+@router.get("/{job_id}/errors")
+def download_import_errors(
+    job_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download the rows that could not be imported, with the reason for each"""
+    job = get_owned_job(db, job_id, current_user.id)
+    path = importer.error_report_path(job)
+    if not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Error report not available yet"
+        )
+    return FileResponse(path, media_type="text/csv", filename=f"import-{job.id}-errors.csv")
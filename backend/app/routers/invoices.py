@@ -1,17 +1,20 @@
 """
 Invoice routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import exists, select, update
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import json
 import uuid
 from datetime import datetime, timedelta
-from app.database import get_db
-from app import models, schemas, auth
+from app.database import get_db, get_read_db
+from app import models, schemas, auth, etags, events, archive, mailer, bulk, customers, catalog, projections, document_cache, audit, dashboard, snapshots
 
 router = APIRouter()
 
+INVOICE_STATUSES = {"pending", "paid", "overdue", "cancelled"}
+
 def generate_invoice_number() -> str:
     """Generate unique invoice number"""
     return f"INV-{uuid.uuid4().hex[:8].upper()}"
@@ -31,6 +34,12 @@ def create_invoice(
             detail="Business profile not found. Please create one first."
         )
     
+    if invoice_data.send_email and not invoice_data.customer_email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="customer_email is required to email the invoice"
+        )
+    
     # Create invoice
     invoice_number = generate_invoice_number()
     items_json = json.dumps([item.model_dump() for item in invoice_data.items])
@@ -58,11 +67,21 @@ def create_invoice(
         status=invoice_data.status or "pending",
         payment_terms=invoice_data.payment_terms,
         notes=invoice_data.notes,
-        items_json=items_json
+        items_json=items_json,
+        **snapshots.columns(business)
     )
     
     db.add(db_invoice)
+    db.flush()
+    customers.upsert(db, current_user.id, [customers.from_document(invoice_data.model_dump(), db_invoice.issue_date)])
+    catalog.upsert(db, business.id, catalog.from_items(invoice_data.model_dump()["items"], db_invoice.issue_date))
+    audit.record(db, business.id, current_user.id, "invoice.created", models.DocumentType.INVOICE.value, db_invoice.id)
+    dashboard.add(db, current_user.id, **dashboard.invoice_deltas(db_invoice.status, db_invoice.total))
+    if invoice_data.send_email:
+        # Sent by the email workers once this transaction commits
+        mailer.enqueue(db, current_user.id, models.DocumentType.INVOICE.value, db_invoice.id, invoice_data.customer_email)
     db.commit()
+    version = etags.user_version(db, current_user.id)
     db.refresh(db_invoice)
     
     # Convert to response schema
@@ -70,15 +89,40 @@ def create_invoice(
         **{c.name: getattr(db_invoice, c.name) for c in db_invoice.__table__.columns},
         "items": json.loads(db_invoice.items_json)
     }
-    return schemas.InvoiceResponse(**invoice_dict)
+    result = schemas.InvoiceResponse(**invoice_dict)
+    etag = etags.make_etag("invoice", *etags.document_version(db_invoice, version))
+    document_cache.store(models.DocumentType.INVOICE.value, db_invoice.id, document_cache.build(current_user.id, etag, result))
+    return result
 
 @router.get("/", response_model=List[schemas.InvoiceResponse])
 def get_invoices(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    view: projections.ListView = projections.ListView.FULL,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get all invoices for current user"""
-    invoices = db.query(models.Invoice).filter(models.Invoice.user_id == current_user.id).order_by(models.Invoice.created_at.desc()).all()
+    names = projections.projection(
+        schemas.InvoiceResponse, models.DocumentType.INVOICE.value, view,
+        projections.parse_fields(fields, schemas.InvoiceResponse)
+    )
+    etag = etags.make_etag(
+        "invoices", current_user.id, *projections.etag_parts(names),
+        etags.user_version(db, current_user.id)
+    )
+    if etags.is_not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    
+    query = db.query(models.Invoice).filter(models.Invoice.user_id == current_user.id).order_by(models.Invoice.created_at.desc())
+    archived_until = archive.horizon(db, current_user.id, models.DocumentType.INVOICE.value)
+    if names is not None:
+        rows = projections.load_rows(query, models.Invoice, names)
+        reply = projections.json_response(projections.dump(schemas.InvoiceResponse, names, rows), etag)
+        archive.set_horizon(reply, archived_until)
+        return reply
+    invoices = query.all()
     
     result = []
     for invoice in invoices:
@@ -88,31 +132,132 @@ def get_invoices(
         }
         result.append(schemas.InvoiceResponse(**invoice_dict))
     
+    etags.set_etag(response, etag)
+    archive.set_horizon(response, archived_until)
     return result
 
 @router.get("/{invoice_id}", response_model=schemas.InvoiceResponse)
 def get_invoice(
     invoice_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific invoice"""
+    cached = document_cache.lookup(models.DocumentType.INVOICE.value, invoice_id, current_user.id)
+    if cached is not None:
+        if etags.is_not_modified(request, cached.etag):
+            return etags.not_modified_response(cached.etag)
+        return document_cache.response(cached)
+    
+    token = document_cache.begin()
+    version = etags.user_version(db, current_user.id)
     invoice = db.query(models.Invoice).filter(
         models.Invoice.id == invoice_id,
         models.Invoice.user_id == current_user.id
     ).first()
     
     if not invoice:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Invoice not found"
-        )
+        # Documents past the retention horizon live in the archive
+        archived = archive.load_document(db, models.DocumentType.INVOICE.value, invoice_id, current_user.id)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invoice not found"
+            )
+        return schemas.InvoiceResponse(**archived)
+    
+    etag = etags.make_etag("invoice", *etags.document_version(invoice, version))
+    if etags.is_not_modified(request, etag):
+        return etags.not_modified_response(etag)
     
     invoice_dict = {
         **{c.name: getattr(invoice, c.name) for c in invoice.__table__.columns},
         "items": json.loads(invoice.items_json)
     }
-    return schemas.InvoiceResponse(**invoice_dict)
+    document = document_cache.build(current_user.id, etag, schemas.InvoiceResponse(**invoice_dict))
+    document_cache.fill(models.DocumentType.INVOICE.value, invoice.id, document, token)
+    return document_cache.response(document)
+
+# Declared before /{invoice_id}, which would otherwise match "bulk"
+@router.patch("/bulk", response_model=schemas.BulkUpdateResponse)
+def bulk_update_invoices(
+    bulk_data: schemas.InvoiceBulkUpdate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Set the status of many invoices, selected by id or by filter, in one statement"""
+    if bulk_data.status not in INVOICE_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status. Allowed: {', '.join(sorted(INVOICE_STATUSES))}"
+        )
+    if (bulk_data.ids is None) == (bulk_data.filter is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either ids or filter"
+        )
+    
+    conditions = [
+        models.Invoice.user_id == current_user.id,
+        models.Invoice.status.is_distinct_from(bulk_data.status)
+    ]
+    if bulk_data.ids is not None:
+        bulk.check_ids(bulk_data.ids)
+        conditions.append(models.Invoice.id.in_(bulk_data.ids))
+    else:
+        criteria = bulk_data.filter
+        if criteria.status is not None:
+            conditions.append(models.Invoice.status == criteria.status)
+        if criteria.issued_from is not None:
+            conditions.append(models.Invoice.issue_date >= criteria.issued_from)
+        if criteria.issued_to is not None:
+            conditions.append(models.Invoice.issue_date < criteria.issued_to)
+        if criteria.due_before is not None:
+            conditions.append(models.Invoice.due_date < criteria.due_before)
+        # At most MAX_BULK_IDS per request; updated invoices stop matching the
+        # filter, so repeating the request continues with the rest
+        batch = db.scalars(
+            select(models.Invoice.id).where(*conditions)
+            .order_by(models.Invoice.id).limit(bulk.MAX_BULK_IDS).with_for_update()
+        ).all()
+        matching = list(conditions)
+        conditions.append(models.Invoice.id.in_(batch))
+    
+    # Ownership is part of the WHERE clause, so other users' ids are never touched
+    def set_status(*extra):
+        return db.execute(
+            update(models.Invoice)
+            .where(*conditions, *extra)
+            .values(status=bulk_data.status)
+            .returning(models.Invoice.id, models.Invoice.total)
+            .execution_options(synchronize_session=False)
+        ).all()
+    
+    # RETURNING only sees new values, so invoices leaving "pending" are updated
+    # first to learn which ones they were; the rest then no longer match
+    if bulk_data.status == dashboard.PENDING:
+        sign, moved = 1, set_status()
+        updated = moved
+    else:
+        sign, moved = -1, set_status(models.Invoice.status == dashboard.PENDING)
+        updated = moved + set_status()
+    updated_ids = [row.id for row in updated]
+    dashboard.add(
+        db, current_user.id, pending_invoice_count=sign * len(moved),
+        pending_invoice_total=sign * sum(row.total for row in moved)
+    )
+    bulk.publish(db, current_user.id, models.DocumentType.INVOICE.value, "invoices.updated", updated_ids, {"status": bulk_data.status})
+    bulk.audit_updates(
+        db, current_user.id, models.DocumentType.INVOICE.value, "invoice.updated", updated_ids,
+        {"status": {"to": bulk_data.status}}
+    )
+    has_more = bulk_data.filter is not None and db.scalar(select(exists().where(*matching)))
+    db.commit()
+    
+    results = bulk.outcomes(db, models.Invoice, current_user.id, bulk_data.ids, updated_ids)
+    return schemas.BulkUpdateResponse(updated=len(updated_ids), results=results, has_more=has_more)
 
 @router.patch("/{invoice_id}", response_model=schemas.InvoiceResponse)
 def update_invoice(
@@ -122,10 +267,11 @@ def update_invoice(
     db: Session = Depends(get_db)
 ):
     """Update an invoice"""
+    # Locked: the dashboard deltas below are computed from the current status and total
     invoice = db.query(models.Invoice).filter(
         models.Invoice.id == invoice_id,
         models.Invoice.user_id == current_user.id
-    ).first()
+    ).with_for_update().first()
     
     if not invoice:
         raise HTTPException(
@@ -134,14 +280,31 @@ def update_invoice(
         )
     
     # Update fields
-    for key, value in invoice_data.model_dump(exclude_unset=True).items():
+    updates = invoice_data.model_dump(exclude_unset=True)
+    audit.record(
+        db, invoice.business_id, current_user.id, "invoice.updated",
+        models.DocumentType.INVOICE.value, invoice.id, audit.changes(invoice, updates)
+    )
+    # Called for every update: it also moves the user's version, which ETags are built from
+    deltas = dashboard.status_deltas(invoice.status, updates["status"], invoice.total) if "status" in updates else {}
+    dashboard.add(db, current_user.id, **deltas)
+    for key, value in updates.items():
         setattr(invoice, key, value)
     
+    events.emit(db, current_user.id, "invoice.updated", {
+        "id": invoice.id,
+        "invoice_number": invoice.invoice_number,
+        "status": invoice.status,
+    })
     db.commit()
+    version = etags.user_version(db, current_user.id)
     db.refresh(invoice)
     
     invoice_dict = {
         **{c.name: getattr(invoice, c.name) for c in invoice.__table__.columns},
         "items": json.loads(invoice.items_json)
     }
-    return schemas.InvoiceResponse(**invoice_dict)
+    result = schemas.InvoiceResponse(**invoice_dict)
+    etag = etags.make_etag("invoice", *etags.document_version(invoice, version))
+    document_cache.store(models.DocumentType.INVOICE.value, invoice.id, document_cache.build(current_user.id, etag, result))
+    return result
@@ -0,0 +1,26 @@
+"""
+Product catalog routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List
+from app.database import get_read_db
+from app import models, schemas, auth, catalog
+
+router = APIRouter()
+
+@router.get("/suggest", response_model=List[schemas.ProductResponse])
+def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Catalog products with a word starting with q, most used first"""
+    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business profile not found. Please create one first."
+        )
+    return catalog.suggest(business.id, q, limit)
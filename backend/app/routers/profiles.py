@@ -0,0 +1,25 @@
+"""
+Profile capture routes (admin only)
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from typing import List
+from app import profiling, schemas
+
+router = APIRouter(dependencies=[Depends(profiling.require_admin)])
+
+@router.get("/", response_model=List[schemas.ProfileCaptureSummary])
+def list_profiles():
+    """Stored captures, newest first"""
+    return profiling.list_captures()
+
+@router.get("/{capture_id}")
+def download_profile(capture_id: str):
+    """Download a capture as gzipped JSON"""
+    path = profiling.capture_path(capture_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, media_type="application/gzip", filename=path.name)
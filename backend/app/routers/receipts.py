@@ -1,14 +1,15 @@
 """
 Receipt routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import json
 import uuid
 from datetime import datetime
-from app.database import get_db
-from app import models, schemas, auth
+from app.database import get_db, get_read_db
+from app import models, schemas, auth, etags, archive, mailer, bulk, customers, catalog, projections, document_cache, audit, dashboard, snapshots
 
 router = APIRouter()
 
@@ -31,6 +32,12 @@ def create_receipt(
             detail="Business profile not found. Please create one first."
         )
     
+    if receipt_data.send_email and not receipt_data.customer_email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="customer_email is required to email the receipt"
+        )
+    
     # Create receipt
     receipt_number = generate_receipt_number()
     items_json = json.dumps([item.model_dump() for item in receipt_data.items])
@@ -51,11 +58,21 @@ def create_receipt(
         total=receipt_data.total,
         payment_method=receipt_data.payment_method,
         notes=receipt_data.notes,
-        items_json=items_json
+        items_json=items_json,
+        **snapshots.columns(business)
     )
     
     db.add(db_receipt)
+    db.flush()
+    customers.upsert(db, current_user.id, [customers.from_document(receipt_data.model_dump(), db_receipt.date)])
+    catalog.upsert(db, business.id, catalog.from_items(receipt_data.model_dump()["items"], db_receipt.date))
+    audit.record(db, business.id, current_user.id, "receipt.created", models.DocumentType.RECEIPT.value, db_receipt.id)
+    dashboard.add(db, current_user.id, receipt_count=1, receipt_total=db_receipt.total)
+    if receipt_data.send_email:
+        # Sent by the email workers once this transaction commits
+        mailer.enqueue(db, current_user.id, models.DocumentType.RECEIPT.value, db_receipt.id, receipt_data.customer_email)
     db.commit()
+    version = etags.user_version(db, current_user.id)
     db.refresh(db_receipt)
     
     # Convert to response schema
@@ -63,15 +80,43 @@ def create_receipt(
         **{c.name: getattr(db_receipt, c.name) for c in db_receipt.__table__.columns},
         "items": json.loads(db_receipt.items_json)
     }
-    return schemas.ReceiptResponse(**receipt_dict)
+    result = schemas.ReceiptResponse(**receipt_dict)
+    etag = etags.make_etag("receipt", *etags.document_version(db_receipt, version))
+    document_cache.store(models.DocumentType.RECEIPT.value, db_receipt.id, document_cache.build(current_user.id, etag, result))
+    return result
 
 @router.get("/", response_model=List[schemas.ReceiptResponse])
 def get_receipts(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    view: projections.ListView = projections.ListView.FULL,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get all receipts for current user"""
-    receipts = db.query(models.Receipt).filter(models.Receipt.user_id == current_user.id).order_by(models.Receipt.created_at.desc()).all()
+    names = projections.projection(
+        schemas.ReceiptResponse, models.DocumentType.RECEIPT.value, view,
+        projections.parse_fields(fields, schemas.ReceiptResponse)
+    )
+    etag = etags.make_etag(
+        "receipts", current_user.id, *projections.etag_parts(names),
+        etags.user_version(db, current_user.id)
+    )
+    if etags.is_not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    
+    query = db.query(models.Receipt).filter(
+        models.Receipt.user_id == current_user.id,
+        models.Receipt.voided_at.is_(None)
+    ).order_by(models.Receipt.created_at.desc())
+    archived_until = archive.horizon(db, current_user.id, models.DocumentType.RECEIPT.value)
+    if names is not None:
+        rows = projections.load_rows(query, models.Receipt, names)
+        reply = projections.json_response(projections.dump(schemas.ReceiptResponse, names, rows), etag)
+        archive.set_horizon(reply, archived_until)
+        return reply
+    receipts = query.all()
     
     result = []
     for receipt in receipts:
@@ -81,28 +126,87 @@ def get_receipts(
         }
         result.append(schemas.ReceiptResponse(**receipt_dict))
     
+    etags.set_etag(response, etag)
+    archive.set_horizon(response, archived_until)
     return result
 
 @router.get("/{receipt_id}", response_model=schemas.ReceiptResponse)
 def get_receipt(
     receipt_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific receipt"""
+    cached = document_cache.lookup(models.DocumentType.RECEIPT.value, receipt_id, current_user.id)
+    if cached is not None:
+        if etags.is_not_modified(request, cached.etag):
+            return etags.not_modified_response(cached.etag)
+        return document_cache.response(cached)
+    
+    token = document_cache.begin()
+    version = etags.user_version(db, current_user.id)
     receipt = db.query(models.Receipt).filter(
         models.Receipt.id == receipt_id,
         models.Receipt.user_id == current_user.id
     ).first()
     
     if not receipt:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Receipt not found"
-        )
+        # Documents past the retention horizon live in the archive
+        archived = archive.load_document(db, models.DocumentType.RECEIPT.value, receipt_id, current_user.id)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Receipt not found"
+            )
+        return schemas.ReceiptResponse(**archived)
+    
+    etag = etags.make_etag("receipt", *etags.document_version(receipt, version))
+    if etags.is_not_modified(request, etag):
+        return etags.not_modified_response(etag)
     
     receipt_dict = {
         **{c.name: getattr(receipt, c.name) for c in receipt.__table__.columns},
         "items": json.loads(receipt.items_json)
     }
-    return schemas.ReceiptResponse(**receipt_dict)
+    document = document_cache.build(current_user.id, etag, schemas.ReceiptResponse(**receipt_dict))
+    document_cache.fill(models.DocumentType.RECEIPT.value, receipt.id, document, token)
+    return document_cache.response(document)
+
+@router.patch("/bulk", response_model=schemas.BulkUpdateResponse)
+def bulk_void_receipts(
+    bulk_data: schemas.ReceiptBulkVoid,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Void (or restore) many receipts in one statement"""
+    bulk.check_ids(bulk_data.ids)
+    if bulk_data.voided:
+        changed, voided_at = models.Receipt.voided_at.is_(None), func.now()
+    else:
+        changed, voided_at = models.Receipt.voided_at.is_not(None), None
+    
+    updated = db.execute(
+        update(models.Receipt)
+        .where(
+            models.Receipt.user_id == current_user.id,
+            models.Receipt.id.in_(bulk_data.ids),
+            changed
+        )
+        .values(voided_at=voided_at)
+        .returning(models.Receipt.id, models.Receipt.total)
+        .execution_options(synchronize_session=False)
+    ).all()
+    updated_ids = [row.id for row in updated]
+    sign = -1 if bulk_data.voided else 1
+    dashboard.add(db, current_user.id, receipt_count=sign * len(updated), receipt_total=sign * sum(row.total for row in updated))
+    bulk.publish(db, current_user.id, models.DocumentType.RECEIPT.value, "receipts.updated", updated_ids, {"voided": bulk_data.voided})
+    bulk.audit_updates(
+        db, current_user.id, models.DocumentType.RECEIPT.value,
+        "receipt.voided" if bulk_data.voided else "receipt.restored", updated_ids
+    )
+    db.commit()
+    
+    results = bulk.outcomes(db, models.Receipt, current_user.id, bulk_data.ids, updated_ids)
+    return schemas.BulkUpdateResponse(updated=len(updated_ids), results=results)
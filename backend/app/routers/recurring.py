@@ -0,0 +1,129 @@
+"""
+Recurring invoice template routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+import json
+from datetime import datetime, timezone
+from app.database import get_db, get_read_db
+from app import models, schemas, auth, recurring
+
+router = APIRouter()
+
+def to_response(template: models.RecurringInvoice) -> schemas.RecurringInvoiceResponse:
+    return schemas.RecurringInvoiceResponse(
+        **{c.name: getattr(template, c.name) for c in template.__table__.columns},
+        items=json.loads(template.items_json)
+    )
+
+def get_owned_template(db: Session, template_id: int, user_id: int) -> models.RecurringInvoice:
+    template = db.query(models.RecurringInvoice).filter(
+        models.RecurringInvoice.id == template_id,
+        models.RecurringInvoice.user_id == user_id
+    ).first()
+    if not template:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recurring invoice not found"
+        )
+    return template
+
+def check_schedule(start_date: datetime, end_date, due_days: int) -> None:
+    if end_date is not None and recurring.as_utc(end_date) < recurring.as_utc(start_date):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_date must not be before start_date"
+        )
+    if due_days < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="due_days must not be negative"
+        )
+
+@router.post("/", response_model=schemas.RecurringInvoiceResponse, status_code=status.HTTP_201_CREATED)
+def create_recurring_invoice(
+    template_data: schemas.RecurringInvoiceCreate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a template; its invoices are issued by the recurring invoices job"""
+    business = db.query(models.Business).filter(models.Business.user_id == current_user.id).first()
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business profile not found. Please create one first."
+        )
+    if template_data.frequency not in recurring.FREQUENCIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid frequency. Allowed: {', '.join(recurring.FREQUENCIES)}"
+        )
+    if template_data.send_email and not template_data.customer_email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="customer_email is required to email the invoices"
+        )
+    start_date = recurring.as_utc(template_data.start_date or datetime.now(timezone.utc))
+    check_schedule(start_date, template_data.end_date, template_data.due_days)
+    
+    template = models.RecurringInvoice(
+        user_id=current_user.id,
+        business_id=business.id,
+        **template_data.model_dump(exclude={"items", "start_date"}),
+        items_json=json.dumps([item.model_dump() for item in template_data.items]),
+        start_date=start_date,
+        next_run_at=start_date,
+        occurrences=0,
+        active=True
+    )
+    db.add(template)
+    db.commit()
+    db.refresh(template)
+    return to_response(template)
+
+@router.get("/", response_model=List[schemas.RecurringInvoiceResponse])
+def get_recurring_invoices(
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Get all recurring invoice templates for current user"""
+    templates = db.query(models.RecurringInvoice).filter(
+        models.RecurringInvoice.user_id == current_user.id
+    ).order_by(models.RecurringInvoice.id).all()
+    return [to_response(template) for template in templates]
+
+@router.get("/{template_id}", response_model=schemas.RecurringInvoiceResponse)
+def get_recurring_invoice(
+    template_id: int,
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Get a specific recurring invoice template"""
+    return to_response(get_owned_template(db, template_id, current_user.id))
+
+@router.patch("/{template_id}", response_model=schemas.RecurringInvoiceResponse)
+def update_recurring_invoice(
+    template_id: int,
+    template_data: schemas.RecurringInvoiceUpdate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Pause, resume or change a template; invoices already issued are not affected"""
+    template = get_owned_template(db, template_id, current_user.id)
+    updates = template_data.model_dump(exclude_unset=True)
+    if updates.get("send_email") and not template.customer_email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="customer_email is required to email the invoices"
+        )
+    check_schedule(template.start_date, updates.get("end_date", template.end_date), updates.get("due_days") or 0)
+    resuming = updates.get("active") and not template.active
+    for key, value in updates.items():
+        setattr(template, key, value)
+    if resuming:
+        # Periods that passed while paused are not billed
+        recurring.skip_missed(template, datetime.now(timezone.utc))
+    db.commit()
+    db.refresh(template)
+    return to_response(template)
@@ -0,0 +1,74 @@
+"""
+Public share link routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+import os
+from app.database import get_db
+from app import models, schemas, auth, archive, etags, sharing
+
+# Authenticated: create links
+router = APIRouter()
+# Public: served at /r/{token} to anyone holding a link
+public_router = APIRouter()
+
+# Public origin for share URLs, e.g. https://api.example.com; defaults to the request's
+SHARE_BASE_URL = os.getenv("SHARE_BASE_URL")
+
+@router.post("/{document_type}/{document_id}", response_model=schemas.ShareLinkResponse)
+def create_share_link(
+    document_type: models.DocumentType,
+    document_id: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a public link to a receipt or invoice"""
+    model = models.Receipt if document_type == models.DocumentType.RECEIPT else models.Invoice
+    owned = db.query(model.id).filter(
+        model.id == document_id,
+        model.user_id == current_user.id
+    ).first()
+    if owned is None and archive.load_document(db, document_type.value, document_id, current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{document_type.value.title()} not found"
+        )
+
+    expires_at = sharing.link_expiry()
+    token = sharing.create_token(document_type.value, document_id, expires_at)
+    base_url = (SHARE_BASE_URL or str(request.base_url)).rstrip("/")
+    return schemas.ShareLinkResponse(
+        token=token,
+        url=f"{base_url}/r/{token}",
+        expires_at=datetime.fromtimestamp(expires_at, tz=timezone.utc)
+    )
+
+@public_router.get("/{token}")
+def view_shared_document(token: str, request: Request):
+    """Show a shared receipt or invoice"""
+    verified = sharing.verify_token(token)
+    page = sharing.get_page(*verified[:2]) if verified else None
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This link is invalid or has expired"
+        )
+
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    etag = page.gzip_etag if gzipped else page.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": sharing.cache_control(verified[2]),
+        "Vary": "Accept-Encoding",
+        # Receipts are private even though the link is public
+        "X-Robots-Tag": "noindex, nofollow",
+        "Referrer-Policy": "no-referrer",
+    }
+    if etags.is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(page.gzipped, media_type="text/html; charset=utf-8", headers=headers)
+    return Response(page.body, media_type="text/html; charset=utf-8", headers=headers)
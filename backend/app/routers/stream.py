@@ -0,0 +1,47 @@
+"""
+Server-sent event stream routes
+"""
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+import asyncio
+import json
+from app.database import get_read_db
+from app import models, auth, events
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = 15
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Stream challenge and invoice events for the current user"""
+    user_id = current_user.id
+    # The stream outlives the request dependencies, so hand the connection back now
+    db.close()
+    queue = events.hub.subscribe(user_id)
+
+    async def event_source():
+        try:
+            yield f"retry: {HEARTBEAT_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+        finally:
+            events.hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -7,25 +7,27 @@ import os
 import uuid
 from pathlib import Path
 import io
+from functools import lru_cache
 from app import auth
 
-# Try to import PIL, but make it optional
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-
 router = APIRouter()
 
-# Create uploads directory if it doesn't exist
+# Created on first upload rather than at import time
 UPLOAD_DIR = Path("uploads/logos")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Allowed image types
 ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
+@lru_cache(maxsize=None)
+def load_pil_image():
+    """Import Pillow on first use; it's optional and slow to load"""
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        return None
+
 def is_allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
     ext = Path(filename).suffix.lower()
@@ -48,6 +50,7 @@ async def upload_logo(
     # Generate unique filename
     file_ext = Path(file.filename).suffix.lower()
     unique_filename = f"{current_user.id}_{uuid.uuid4().hex}{file_ext}"
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     file_path = UPLOAD_DIR / unique_filename
     
     try:
@@ -62,7 +65,8 @@ async def upload_logo(
             )
         
         # Validate and process image (if PIL is available)
-        if PIL_AVAILABLE:
+        Image = load_pil_image()
+        if Image is not None:
             try:
                 image = Image.open(io.BytesIO(contents))
                 # Convert to RGB if necessary (handles RGBA, P, etc.)
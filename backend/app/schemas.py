@@ -95,6 +95,7 @@ class ReceiptCreate(BaseModel):
     payment_method: Optional[str] = None
     notes: Optional[str] = None
     items: List[Item]
+    send_email: bool = False  # Email the receipt to customer_email
 
 class ReceiptResponse(BaseModel):
     id: int
@@ -114,7 +115,9 @@ class ReceiptResponse(BaseModel):
     payment_method: Optional[str]
     notes: Optional[str]
     items: List[Item]
+    voided_at: Optional[datetime] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -137,6 +140,7 @@ class InvoiceCreate(BaseModel):
     payment_terms: Optional[str] = None
     notes: Optional[str] = None
     items: List[Item]
+    send_email: bool = False  # Email the invoice to customer_email
 
 class InvoiceUpdate(BaseModel):
     status: Optional[str] = None
@@ -164,6 +168,7 @@ class InvoiceResponse(BaseModel):
     notes: Optional[str]
     items: List[Item]
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -188,6 +193,7 @@ class ChallengeResponse(BaseModel):
     status: ChallengeStatus
     resolution_notes: Optional[str]
     created_at: datetime
+    updated_at: Optional[datetime] = None
     resolved_at: Optional[datetime]
     
     class Config:
@@ -197,3 +203,240 @@ class ChallengeResponse(BaseModel):
 class HistoryResponse(BaseModel):
     receipts: List[ReceiptResponse]
     invoices: List[InvoiceResponse]
+    archived_until: Optional[datetime] = None  # older documents may be in the archive instead
+
+class HistoryChangesResponse(BaseModel):
+    receipts: List[ReceiptResponse]
+    invoices: List[InvoiceResponse]
+    challenges: List[ChallengeResponse]
+    next_token: str
+    archived_until: Optional[datetime] = None  # older documents may be in the archive instead
+
+# Import schemas
+class ImportJobResponse(BaseModel):
+    id: int
+    document_type: str
+    filename: str
+    status: str
+    progress: float
+    rows_processed: int
+    documents_imported: int
+    documents_failed: int
+    error_message: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# Email schemas
+class EmailRequest(BaseModel):
+    recipient: Optional[EmailStr] = None  # Defaults to the document's customer_email
+
+class EmailOutboxResponse(BaseModel):
+    id: int
+    document_type: str
+    document_id: int
+    recipient: str
+    status: str
+    attempts: int
+    next_attempt_at: datetime
+    last_error: Optional[str]
+    created_at: datetime
+    sent_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# Share link schemas
+class ShareLinkResponse(BaseModel):
+    token: str
+    url: str
+    expires_at: datetime
+
+# Export schemas
+class ExportCreate(BaseModel):
+    document_type: DocumentType
+    start_date: datetime
+    end_date: datetime  # exclusive
+
+class ExportJobResponse(BaseModel):
+    id: int
+    document_type: str
+    start_date: datetime
+    end_date: datetime
+    status: str
+    progress: float
+    documents_total: int
+    documents_exported: int
+    file_size: Optional[int]
+    error_message: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+    expires_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# Bulk update schemas
+class InvoiceBulkFilter(BaseModel):
+    status: Optional[str] = None
+    issued_from: Optional[datetime] = None
+    issued_to: Optional[datetime] = None  # exclusive
+    due_before: Optional[datetime] = None
+
+class InvoiceBulkUpdate(BaseModel):
+    ids: Optional[List[int]] = None  # Either ids or filter
+    filter: Optional[InvoiceBulkFilter] = None
+    status: str
+
+class ReceiptBulkVoid(BaseModel):
+    ids: List[int]
+    voided: bool = True  # False restores voided receipts
+
+class BulkItemResult(BaseModel):
+    id: int
+    outcome: str  # updated, unchanged, not_found
+
+class BulkUpdateResponse(BaseModel):
+    updated: int
+    results: List[BulkItemResult]
+    has_more: bool = False  # filter updates: more invoices match, repeat the request
+
+# Customer schemas
+class CustomerResponse(BaseModel):
+    id: int
+    name: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    address: Optional[str]
+    tax_id: Optional[str]
+    document_count: int
+    last_used_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# Product catalog schemas
+class ProductResponse(BaseModel):
+    id: int
+    name: str
+    description: Optional[str]
+    last_unit_price: Optional[float]
+    usage_count: int
+    last_used_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# Timeline schemas
+class TimelineEntry(BaseModel):
+    type: str  # receipt, invoice or challenge
+    id: int
+    created_at: datetime
+    number: Optional[str]  # receipt or invoice number
+    name: Optional[str]  # customer, or challenger for challenges
+    total: Optional[float]
+    status: Optional[str]  # invoice or challenge status
+    receipt_id: Optional[int]
+    invoice_id: Optional[int]
+
+class TimelineResponse(BaseModel):
+    entries: List[TimelineEntry]
+    next_cursor: Optional[str]
+    archived_until: Optional[datetime] = None  # older documents may be in the archive instead
+
+# Audit schemas
+class AuditEventResponse(BaseModel):
+    id: int
+    actor_id: Optional[int]
+    action: str
+    document_type: Optional[str]
+    document_id: Optional[int]
+    changes: Optional[dict]
+    created_at: datetime
+
+# Profiling schemas
+class ProfileCaptureSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    status_code: Optional[int]
+    trigger: str
+    started_at: datetime
+    duration_ms: Optional[float]
+    samples: Optional[int]
+    sql_count: Optional[int]
+    sql_ms: Optional[float]
+
+# Recurring invoice schemas
+class RecurringInvoiceCreate(BaseModel):
+    customer_name: str
+    customer_email: Optional[str] = None
+    customer_phone: Optional[str] = None
+    customer_address: Optional[str] = None
+    customer_tax_id: Optional[str] = None
+    subtotal: float
+    tax_rate: float = 0.0
+    tax_amount: float = 0.0
+    discount: float = 0.0
+    total: float
+    payment_terms: Optional[str] = None
+    notes: Optional[str] = None
+    items: List[Item]
+    frequency: str  # weekly, monthly, quarterly, yearly
+    start_date: Optional[datetime] = None  # defaults to now
+    end_date: Optional[datetime] = None
+    due_days: int = 30
+    send_email: bool = False  # Email each invoice to customer_email
+
+class RecurringInvoiceUpdate(BaseModel):
+    active: Optional[bool] = None
+    end_date: Optional[datetime] = None
+    due_days: Optional[int] = None
+    send_email: Optional[bool] = None
+    payment_terms: Optional[str] = None
+    notes: Optional[str] = None
+
+class RecurringInvoiceResponse(BaseModel):
+    id: int
+    user_id: int
+    business_id: int
+    customer_name: str
+    customer_email: Optional[str]
+    customer_phone: Optional[str]
+    customer_address: Optional[str]
+    customer_tax_id: Optional[str]
+    subtotal: float
+    tax_rate: float
+    tax_amount: float
+    discount: float
+    total: float
+    payment_terms: Optional[str]
+    notes: Optional[str]
+    items: List[Item]
+    frequency: str
+    start_date: datetime
+    end_date: Optional[datetime]
+    due_days: int
+    send_email: bool
+    active: bool
+    occurrences: int
+    next_run_at: datetime
+    last_generated_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+# Dashboard schemas
+class DashboardSummary(BaseModel):
+    receipt_count: int
+    receipt_total: float
+    invoice_count: int
+    invoice_total: float
+    pending_invoice_count: int
+    pending_invoice_total: float
+    open_challenge_count: int
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
@@ -0,0 +1,124 @@
+"""
+Signed public share links for receipts and invoices
+
+A link carries the document type, id and expiry plus an HMAC of them, so it
+is checked without touching the database. The rendered page is cached per
+document and dropped whenever the document or its business changes.
+"""
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session
+from app import archive, cache, models, rendering, snapshots
+from app.auth import SECRET_KEY
+from app.database import SessionLocal
+
+SHARE_LINK_DAYS = int(os.getenv("SHARE_LINK_DAYS", "90"))
+SHARE_CACHE_ENTRIES = int(os.getenv("SHARE_CACHE_ENTRIES", "1000"))
+# Browsers keep a page for SHARE_MAX_AGE and CDNs for SHARE_CDN_MAX_AGE, so an
+# edit can take up to SHARE_CDN_MAX_AGE to reach visitors behind a CDN
+SHARE_MAX_AGE = int(os.getenv("SHARE_MAX_AGE", "60"))
+SHARE_CDN_MAX_AGE = int(os.getenv("SHARE_CDN_MAX_AGE", "300"))
+
+TYPE_CODES = {
+    models.DocumentType.RECEIPT.value: "r",
+    models.DocumentType.INVOICE.value: "i",
+}
+CODE_TYPES = {code: document_type for document_type, code in TYPE_CODES.items()}
+
+# Separate key from the JWT one, so a share link can never pass as a login token
+_SIGNING_KEY = hashlib.sha256(b"share-link:" + SECRET_KEY.encode("utf-8")).digest()
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+def _signature(message: str) -> str:
+    digest = hmac.new(_SIGNING_KEY, message.encode("ascii"), hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+def create_token(document_type: str, document_id: int, expires_at: int) -> str:
+    message = f"{TYPE_CODES[document_type]}{_base36(document_id)}.{_base36(expires_at)}"
+    return f"{message}.{_signature(message)}"
+
+def verify_token(token: str) -> Optional[Tuple[str, int, int]]:
+    """Return (document type, document id, expiry) for a valid, unexpired token"""
+    message, _, signature = token.rpartition(".")
+    if not message or not hmac.compare_digest(_signature(message), signature):
+        return None
+    document, _, expires = message.partition(".")
+    try:
+        document_id, expires_at = int(document[1:], 36), int(expires, 36)
+    except ValueError:
+        return None
+    document_type = CODE_TYPES.get(document[:1])
+    if document_type is None or expires_at < time.time():
+        return None
+    return document_type, document_id, expires_at
+
+def link_expiry() -> int:
+    return int(time.time()) + SHARE_LINK_DAYS * 86400
+
+class SharedPage:
+    """A rendered page with its gzipped form and validators, ready to serve"""
+
+    __slots__ = ("body", "gzipped", "etag", "gzip_etag")
+
+    def __init__(self, html: str):
+        self.body = html.encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        digest = hashlib.sha1(self.body).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+
+pages = cache.LRUCache("share_pages", SHARE_CACHE_ENTRIES)
+
+def load_document(db: Session, document_type: str, document_id: int) -> Optional[dict]:
+    model = models.Receipt if document_type == models.DocumentType.RECEIPT.value else models.Invoice
+    row = db.get(model, document_id)
+    if row is None:
+        return archive.load_document(db, document_type, document_id, None)
+    return {
+        **{c.name: getattr(row, c.name) for c in row.__table__.columns},
+        "items": json.loads(row.items_json)
+    }
+
+def get_page(document_type: str, document_id: int) -> Optional[SharedPage]:
+    key = (document_type, document_id)
+    page = pages.get(key)
+    if page is not None:
+        return page
+
+    # Only invalidations of this document (or, for older documents, its
+    # business) since here make the render stale
+    generation = pages.begin()
+    # The primary, not the replica: a lagging replica could re-cache a page
+    # that an update has just invalidated
+    with SessionLocal() as db:
+        document = load_document(db, document_type, document_id)
+        if document is None:
+            return None
+        tags = [cache.document_tag(document_type, document_id)]
+        business = snapshots.from_document(document)
+        if business is None:
+            # Older documents show the current profile, so profile edits change them
+            business = db.get(models.Business, document["business_id"])
+            tags.append(cache.business_tag(business.id))
+        page = SharedPage(rendering.render_html(document_type, document, business))
+    pages.set(key, page, tags=tags, generation=generation)
+    return page
+
+def cache_control(expires_at: int) -> str:
+    # Never let a cache serve the page past the link's expiry
+    remaining = max(int(expires_at - time.time()), 0)
+    return f"public, max-age={min(SHARE_MAX_AGE, remaining)}, s-maxage={min(SHARE_CDN_MAX_AGE, remaining)}"
@@ -0,0 +1,33 @@
+"""
+Business header snapshots stored on each receipt and invoice
+
+A document keeps the business name, address, contact details, tax ID and logo
+as they were when it was created, so later profile edits never change an
+issued document and rendering it needs no business row. Documents created
+before snapshots existed fall back to the live profile.
+"""
+import json
+from types import SimpleNamespace
+from typing import Optional
+from app import models
+
+SNAPSHOT_FIELDS = ("name", "address", "city", "state", "zip_code", "country", "phone", "email", "website", "tax_id")
+
+def columns(business: models.Business) -> dict:
+    """Snapshot column values for a new document"""
+    return {
+        "business_snapshot": json.dumps({field: getattr(business, field) for field in SNAPSHOT_FIELDS}),
+        # A column of its own so upload cleanup can find logos still in use
+        "business_logo_url": business.logo_url,
+    }
+
+def from_document(document: dict) -> Optional[SimpleNamespace]:
+    """The business as it was when the document was created, or None for older documents"""
+    snapshot = document.get("business_snapshot")
+    if not snapshot:
+        return None
+    return SimpleNamespace(
+        id=document["business_id"],
+        logo_url=document.get("business_logo_url"),
+        **json.loads(snapshot)
+    )
@@ -0,0 +1,22 @@
+"""
+Startup warm-up
+"""
+import logging
+import os
+import time
+from app import database
+
+logger = logging.getLogger(__name__)
+
+WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", "2"))
+
+def warm_up() -> None:
+    """Open pool connections and load deferred modules before traffic needs them"""
+    started = time.perf_counter()
+    try:
+        database.warm_pool(WARMUP_CONNECTIONS)
+    except Exception:
+        logger.warning("Database warm-up failed, connections will open on demand", exc_info=True)
+    # Imported lazily by app.auth; every authenticated request needs it
+    import jose.jwt  # noqa: F401
+    logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
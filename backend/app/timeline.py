@@ -0,0 +1,108 @@
+"""
+Newest-first feed of a user's receipts, invoices and challenges
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import Float, Integer, String, and_, cast, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import Session
+from app import models
+
+# Entries created in the same instant are ordered by type rank, then id
+TYPE_RANKS = {"receipt": 0, "invoice": 1, "challenge": 2}
+
+def encode_cursor(created_at: datetime, entry_type: str, entry_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{TYPE_RANKS[entry_type]}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        moment, rank, entry_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return datetime.fromisoformat(moment), int(rank), int(entry_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _bind_moment(db: Session, moment: datetime):
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite compares timestamps as text, and CURRENT_TIMESTAMP has no fraction
+        text = moment.strftime("%Y-%m-%d %H:%M:%S")
+        return literal(text + f".{moment.microsecond:06d}" if moment.microsecond else text, String)
+    return moment
+
+def _after_cursor(model, rank: int, cursor: Optional[tuple], moment):
+    """Rows of this branch that come after the cursor in (created_at, rank, id) descending order"""
+    if cursor is None:
+        return True
+    _, cursor_rank, cursor_id = cursor
+    if rank < cursor_rank:
+        return model.created_at <= moment
+    if rank > cursor_rank:
+        return model.created_at < moment
+    return or_(model.created_at < moment, and_(model.created_at == moment, model.id < cursor_id))
+
+def _branch(model, entry_type: str, columns: dict, owner, cursor, moment, limit: int):
+    rank = TYPE_RANKS[entry_type]
+    query = (
+        select(
+            literal(entry_type, String).label("type"),
+            literal(rank, Integer).label("rank"),
+            model.id.label("id"),
+            model.created_at.label("created_at"),
+            columns.get("number", cast(null(), String)).label("number"),
+            columns["name"].label("name"),
+            columns.get("total", cast(null(), Float)).label("total"),
+            columns.get("status", cast(null(), String)).label("status"),
+            columns.get("receipt_id", cast(null(), Integer)).label("receipt_id"),
+            columns.get("invoice_id", cast(null(), Integer)).label("invoice_id"),
+        )
+        .where(owner, _after_cursor(model, rank, cursor, moment))
+        .order_by(model.created_at.desc(), model.id.desc())
+        .limit(limit)
+    )
+    # Each branch reads at most one page from its (user_id, created_at, id) index
+    return select(query.subquery())
+
+def page(db: Session, user_id: int, limit: int, cursor: Optional[str] = None) -> dict:
+    """One page of the timeline and the cursor for the next, if there is one"""
+    position = decode_cursor(cursor) if cursor else None
+    moment = _bind_moment(db, position[0]) if position else None
+    Receipt, Invoice, Challenge = models.Receipt, models.Invoice, models.Challenge
+
+    branches = union_all(
+        _branch(Receipt, "receipt", {
+            "number": Receipt.receipt_number,
+            "name": Receipt.customer_name,
+            "total": Receipt.total,
+        }, and_(Receipt.user_id == user_id, Receipt.voided_at.is_(None)), position, moment, limit + 1),
+        _branch(Invoice, "invoice", {
+            "number": Invoice.invoice_number,
+            "name": Invoice.customer_name,
+            "total": Invoice.total,
+            "status": Invoice.status,
+        }, Invoice.user_id == user_id, position, moment, limit + 1),
+        _branch(Challenge, "challenge", {
+            "name": Challenge.challenger_name,
+            "status": func.lower(cast(Challenge.status, String)),
+            "receipt_id": Challenge.receipt_id,
+            "invoice_id": Challenge.invoice_id,
+        }, Challenge.user_id == user_id, position, moment, limit + 1),
+    ).subquery()
+
+    rows = db.execute(
+        select(branches)
+        .order_by(branches.c.created_at.desc(), branches.c.rank.desc(), branches.c.id.desc())
+        .limit(limit + 1)
+    ).mappings().all()
+
+    entries: List[dict] = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = entries[-1]
+        next_cursor = encode_cursor(last["created_at"], last["type"], last["id"])
+    return {"entries": entries, "next_cursor": next_cursor}
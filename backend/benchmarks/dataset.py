@@ -0,0 +1,340 @@
+"""
+Synthetic dataset generator
+
+Loads users, businesses, receipts, invoices and challenges shaped like real
+traffic: documents per business follow a heavy-tailed (Pareto) distribution,
+customers and products repeat, line item counts and prices vary. Run from the
+backend directory against a scratch database:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.dataset --documents 1000000
+
+PostgreSQL is loaded with COPY, other databases with batched executemany.
+Afterwards the customer directory, product catalog and dashboard counters are
+rebuilt by the maintenance jobs (skip with --skip-derived).
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from app import auth, models, snapshots
+from app.database import SessionLocal
+from app.jobs import backfill_customers, backfill_products, repair_dashboard_stats
+
+logger = logging.getLogger(__name__)
+
+# Every generated user can log in with this password
+PASSWORD = "benchmark"
+
+FIRST_NAMES = (
+    "Ada", "Ben", "Chloe", "Dev", "Elena", "Farah", "Gus", "Hana", "Ivan", "Jade",
+    "Kofi", "Lena", "Mateo", "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sam", "Tariq",
+)
+LAST_NAMES = (
+    "Adams", "Baker", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Jensen",
+    "Khan", "Lopez", "Moreau", "Nguyen", "Okafor", "Patel", "Rossi", "Silva", "Tanaka", "Weber",
+)
+COMPANY_WORDS = (
+    "Acme", "Blue", "Cedar", "Delta", "Evergreen", "Summit", "Harbor", "Iron", "Juniper", "Lumen",
+    "Maple", "North", "Orbit", "Pioneer", "Quartz", "River", "Stone", "Union", "Vista", "West",
+)
+COMPANY_KINDS = ("Bakery", "Consulting", "Design", "Garage", "Hardware", "Studio", "Supply", "Tailors")
+PRODUCT_ADJECTIVES = ("Basic", "Deluxe", "Large", "Monthly", "Premium", "Small", "Standard", "Express")
+PRODUCT_NOUNS = (
+    "Bread", "Cable", "Consultation", "Delivery", "Filter", "Haircut", "Installation", "Lamp",
+    "License", "Repair", "Service", "Shirt", "Subscription", "Tire", "Widget", "Workshop",
+)
+PAYMENT_METHODS = ("card", "card", "card", "cash", "cash", "bank transfer")
+TAX_RATES = (0.0, 5.0, 8.25, 10.0, 20.0)
+# Statuses of invoices that are past due, with their weights
+SETTLED_STATUSES = (("paid", 85), ("overdue", 10), ("cancelled", 5))
+CHALLENGE_STATUSES = (
+    (models.ChallengeStatus.PENDING, 60),
+    (models.ChallengeStatus.RESOLVED, 30),
+    (models.ChallengeStatus.REJECTED, 10),
+)
+VOID_RATE = 0.01
+DUE_DAYS = 30
+
+def documents_per_user(rng: random.Random, users: int, documents: int, alpha: float) -> list:
+    """Split documents over users with Pareto weights; a few users get most of them"""
+    weights = [rng.paretovariate(alpha) for _ in range(users)]
+    scale = documents / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Hand the rounding remainder to the heaviest users
+    for index in sorted(range(users), key=weights.__getitem__, reverse=True)[:documents - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+def skewed_index(rng: random.Random, size: int) -> int:
+    """Index into a pool where the first entries are picked far more often"""
+    return min(int(size * rng.random() ** 3), size - 1)
+
+class Business:
+    """Customers and products one generated business sells to and sells"""
+
+    def __init__(self, rng: random.Random, index: int, documents: int):
+        self.name = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_KINDS)} {index}"
+        self.customers = [self._customer(rng, number) for number in range(max(3, int(documents ** 0.6)))]
+        self.products = [self._product(rng) for _ in range(5 + int(documents ** 0.4))]
+
+    @staticmethod
+    def _customer(rng: random.Random, number: int) -> dict:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            "customer_name": f"{first} {last}",
+            "customer_email": f"{first}.{last}{number}@example.com".lower() if rng.random() < 0.7 else None,
+            "customer_phone": f"+1-555-{rng.randrange(10000):04d}" if rng.random() < 0.4 else None,
+            "customer_address": f"{rng.randrange(1, 999)} {rng.choice(LAST_NAMES)} St" if rng.random() < 0.3 else None,
+        }
+
+    @staticmethod
+    def _product(rng: random.Random) -> tuple:
+        name = f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)}"
+        return name, round(rng.lognormvariate(3, 1), 2)
+
+    def items(self, rng: random.Random) -> list:
+        items = []
+        for _ in range(1 + min(int(rng.expovariate(1 / 2.5)), 49)):
+            name, unit_price = self.products[skewed_index(rng, len(self.products))]
+            quantity = 1 + min(int(rng.expovariate(1)), 19)
+            items.append({
+                "name": name,
+                "description": None,
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "total": round(quantity * unit_price, 2),
+            })
+        return items
+
+def document_row(rng: random.Random, business: Business, user_id: int, business_id: int, snapshot: dict, created_at: datetime) -> dict:
+    """Columns shared by receipts and invoices"""
+    items = business.items(rng)
+    subtotal = round(sum(item["total"] for item in items), 2)
+    tax_rate = rng.choice(TAX_RATES)
+    discount = round(subtotal * 0.05, 2) if rng.random() < 0.1 else 0.0
+    tax_amount = round((subtotal - discount) * tax_rate / 100, 2)
+    return {
+        "user_id": user_id,
+        "business_id": business_id,
+        **business.customers[skewed_index(rng, len(business.customers))],
+        "subtotal": subtotal,
+        "tax_rate": tax_rate,
+        "tax_amount": tax_amount,
+        "discount": discount,
+        "total": round(subtotal - discount + tax_amount, 2),
+        "notes": "Thank you for your business" if rng.random() < 0.2 else None,
+        "items_json": json.dumps(items),
+        **snapshot,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+class Loader:
+    """Buffers rows per table and writes them with COPY on PostgreSQL, executemany elsewhere"""
+
+    def __init__(self, db: Session, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.copy = db.get_bind().dialect.name == "postgresql"
+        self.pending = {}
+        self.written = 0
+
+    def add(self, table, row: dict) -> None:
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for table, rows in self.pending.items():
+            if rows:
+                self._copy(table, rows) if self.copy else self.db.execute(insert(table), rows)
+                self.written += len(rows)
+        self.pending = {}
+        self.db.commit()
+        logger.info("Loaded %d rows", self.written)
+
+    def _copy(self, table, rows: list) -> None:
+        names = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # An unquoted empty field is NULL in CSV COPY; generated text is never empty
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else value for value in (row[name] for name in names)
+            ])
+        buffer.seek(0)
+        cursor = self.db.connection().connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+def create_accounts(db: Session, rng: random.Random, prefix: str, counts: list, batch_size: int) -> list:
+    """Insert users and their businesses; returns (user_id, business_id, Business, snapshot) per user"""
+    hashed_password = auth.get_password_hash(PASSWORD)
+    accounts = []
+    for start in range(0, len(counts), batch_size):
+        chunk = range(start, min(start + batch_size, len(counts)))
+        user_ids = db.scalars(
+            insert(models.User).returning(models.User.id, sort_by_parameter_order=True),
+            [{"email": f"{prefix}-{index}@example.com", "hashed_password": hashed_password, "is_active": True} for index in chunk]
+        ).all()
+        generated = [Business(rng, index, counts[index]) for index in chunk]
+        profiles = [
+            {
+                "user_id": user_id,
+                "name": business.name,
+                "address": f"{rng.randrange(1, 999)} Main St",
+                "city": "Springfield",
+                "state": "IL",
+                "zip_code": f"{rng.randrange(60000, 63000)}",
+                "country": "USA",
+                "phone": f"+1-555-{rng.randrange(10000):04d}",
+                "email": f"{prefix}-{index}@example.com",
+                "website": None,
+                "tax_id": f"{rng.randrange(10, 99)}-{rng.randrange(1000000, 9999999)}",
+                "logo_url": None,
+            }
+            for index, user_id, business in zip(chunk, user_ids, generated)
+        ]
+        business_ids = db.scalars(
+            insert(models.Business).returning(models.Business.id, sort_by_parameter_order=True), profiles
+        ).all()
+        for user_id, business_id, business, profile in zip(user_ids, business_ids, generated, profiles):
+            accounts.append((user_id, business_id, business, snapshots.columns(SimpleNamespace(**profile))))
+        db.commit()
+    return accounts
+
+def load_documents(loader: Loader, rng: random.Random, prefix: str, accounts: list, counts: list, args) -> list:
+    """Insert every user's receipts and invoices; returns the documents picked for challenges"""
+    now = datetime.now(timezone.utc)
+    span = timedelta(days=365 * args.years).total_seconds()
+    challenged = []
+    number = 0
+    for (user_id, business_id, business, snapshot), count in zip(accounts, counts):
+        for _ in range(count):
+            number += 1
+            # Skewed towards recent dates, like a growing business
+            created_at = now - timedelta(seconds=span * rng.random() ** 1.5)
+            row = document_row(rng, business, user_id, business_id, snapshot, created_at)
+            if rng.random() < args.invoice_share:
+                document_type, table = models.DocumentType.INVOICE, models.Invoice.__table__
+                due_date = created_at + timedelta(days=DUE_DAYS)
+                status = "pending" if due_date > now else rng.choices(
+                    [name for name, _ in SETTLED_STATUSES], [weight for _, weight in SETTLED_STATUSES]
+                )[0]
+                row.update(
+                    invoice_number=f"INV-{prefix}-{number:09d}",
+                    customer_tax_id=None,
+                    issue_date=created_at,
+                    due_date=due_date,
+                    status=status,
+                    payment_terms=f"Net {DUE_DAYS}",
+                )
+            else:
+                document_type, table = models.DocumentType.RECEIPT, models.Receipt.__table__
+                voided = rng.random() < VOID_RATE
+                row.update(
+                    receipt_number=f"RCP-{prefix}-{number:09d}",
+                    date=created_at,
+                    payment_method=rng.choice(PAYMENT_METHODS),
+                    voided_at=created_at + timedelta(days=1) if voided else None,
+                )
+            loader.add(table, row)
+            if rng.random() < args.challenge_rate:
+                challenged.append((document_type, row.get("receipt_number") or row["invoice_number"], user_id, created_at))
+    loader.flush()
+    return challenged
+
+def load_challenges(db: Session, rng: random.Random, challenged: list, batch_size: int) -> int:
+    """Insert challenges against documents picked while loading them"""
+    now = datetime.now(timezone.utc)
+    created = 0
+    for start in range(0, len(challenged), batch_size):
+        chunk = challenged[start:start + batch_size]
+        ids = {}
+        for model, number_column, id_column, document_type in (
+            (models.Receipt, models.Receipt.receipt_number, "receipt_id", models.DocumentType.RECEIPT),
+            (models.Invoice, models.Invoice.invoice_number, "invoice_id", models.DocumentType.INVOICE),
+        ):
+            numbers = [number for kind, number, _, _ in chunk if kind == document_type]
+            if numbers:
+                ids.update({
+                    number: (id_column, document_id)
+                    for document_id, number in db.execute(select(model.id, number_column).where(number_column.in_(numbers)))
+                })
+        rows = []
+        for _, number, user_id, document_created_at in chunk:
+            id_column, document_id = ids[number]
+            created_at = min(document_created_at + timedelta(days=rng.uniform(1, 60)), now)
+            status = rng.choices([name for name, _ in CHALLENGE_STATUSES], [weight for _, weight in CHALLENGE_STATUSES])[0]
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            rows.append({
+                "receipt_id": None,
+                "invoice_id": None,
+                id_column: document_id,
+                "user_id": user_id,
+                "challenger_name": f"{first} {last}",
+                "challenger_email": f"{first}.{last}@example.com".lower(),
+                "reason": "The amount does not match what I was charged",
+                "status": status,
+                "resolution_notes": None if status == models.ChallengeStatus.PENDING else "Checked with the customer",
+                "created_at": created_at,
+                "updated_at": created_at,
+                "resolved_at": None if status == models.ChallengeStatus.PENDING else created_at,
+            })
+        db.execute(insert(models.Challenge), rows)
+        db.commit()
+        created += len(rows)
+    return created
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    prefix = f"bench{args.seed}"
+    users = args.users or max(1, args.documents // 500)
+    counts = documents_per_user(rng, users, args.documents, args.tail_alpha)
+    report = {"users": users, "documents": args.documents, "heaviest_user_documents": max(counts)}
+    with SessionLocal() as db:
+        if db.scalar(select(models.User.id).where(models.User.email == f"{prefix}-0@example.com")) is not None:
+            raise SystemExit(f"A dataset with seed {args.seed} is already loaded; pass another --seed")
+        started = time.perf_counter()
+        accounts = create_accounts(db, rng, prefix, counts, args.batch_size)
+        challenged = load_documents(Loader(db, args.batch_size), rng, prefix, accounts, counts, args)
+        report["challenges"] = load_challenges(db, rng, challenged, args.batch_size)
+        report["load_seconds"] = round(time.perf_counter() - started, 1)
+    if not args.skip_derived:
+        started = time.perf_counter()
+        backfill_customers.run(100)
+        backfill_products.run(100)
+        repair_dashboard_stats.run(500)
+        report["derived_seconds"] = round(time.perf_counter() - started, 1)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100_000, help="receipts and invoices in total")
+    parser.add_argument("--users", type=int, help="users, each with one business (default: documents / 500)")
+    parser.add_argument("--invoice-share", type=float, default=0.4, help="fraction of documents that are invoices")
+    parser.add_argument("--challenge-rate", type=float, default=0.001, help="fraction of documents that get challenged")
+    parser.add_argument("--years", type=float, default=3, help="documents are dated over this many past years")
+    parser.add_argument("--tail-alpha", type=float, default=1.16, help="Pareto shape of documents per user; lower is more skewed")
+    parser.add_argument("--seed", type=int, default=1, help="random seed; also names the generated users")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="rows per COPY or executemany")
+    parser.add_argument("--skip-derived", action="store_true", help="do not rebuild customers, products and dashboard counters")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    report = run(args)
+    print(", ".join(f"{name}: {value}" for name, value in report.items()))
+    print(f"Log in as bench{args.seed}-<n>@example.com with password {PASSWORD!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Read route benchmark
+
+Times the list, history, timeline, sync, search and dashboard routes in-process
+against whatever is in DATABASE_URL (load data with benchmarks.dataset first)
+for the heaviest, a median and a light user. Run from the backend directory:
+
+    python -m benchmarks.queries --runs 5
+"""
+import argparse
+import math
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, select
+from fastapi.testclient import TestClient
+from app import auth, models
+from app.database import ReadSessionLocal, engine, read_engine
+from app.routers.history import encode_sync_token
+from main import app
+
+# (name, path); placeholders come from the user's context, and scenarios whose
+# placeholders are missing for a user (no receipts yet, say) are skipped
+SCENARIOS = (
+    ("dashboard", "/api/dashboard/summary"),
+    ("receipts", "/api/receipts/"),
+    ("receipts summary", "/api/receipts/?view=summary"),
+    ("receipt", "/api/receipts/{receipt_id}"),
+    ("invoices", "/api/invoices/"),
+    ("invoices summary", "/api/invoices/?view=summary"),
+    ("invoice", "/api/invoices/{invoice_id}"),
+    ("history summary", "/api/history/?view=summary"),
+    ("timeline", "/api/history/timeline?limit=50"),
+    ("timeline page 10", "/api/history/timeline?limit=50&cursor={timeline_cursor}"),
+    ("changes full sync", "/api/history/changes"),
+    ("changes last day", "/api/history/changes?since={day_token}"),
+    ("challenges", "/api/history/challenges"),
+    ("customer suggest", "/api/customers/suggest?q={customer_prefix}"),
+    ("product suggest", "/api/products/suggest?q={product_prefix}"),
+)
+
+class QueryCounter:
+    """Counts SQL statements sent on the primary and replica engines"""
+
+    def __init__(self):
+        self.count = 0
+        for bound in {engine, read_engine}:
+            event.listen(bound, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def pick_users(selected: list) -> list:
+    """(label, user) pairs: the given emails, or the heaviest, median and 10th percentile users"""
+    Stats = models.DashboardStats
+    with ReadSessionLocal() as db:
+        if selected:
+            users = db.scalars(select(models.User).where(models.User.email.in_(selected))).all()
+            return [(user.email, user) for user in users]
+        documents = Stats.receipt_count + Stats.invoice_count
+        ranked = db.execute(select(Stats.user_id, documents).where(documents > 0).order_by(documents.desc())).all()
+        if not ranked:
+            raise SystemExit("No dashboard counters found; load data with benchmarks.dataset or run app.jobs.repair_dashboard_stats")
+        picks = {"heaviest": ranked[0], "median": ranked[len(ranked) // 2], "p10": ranked[len(ranked) * 9 // 10]}
+        return [
+            (f"{label} ({count} documents)", db.get(models.User, user_id))
+            for label, (user_id, count) in picks.items()
+        ]
+
+def user_context(client: TestClient, headers: dict, user: models.User) -> dict:
+    """Ids, search prefixes, a deep timeline cursor and a sync token for the scenarios"""
+    with ReadSessionLocal() as db:
+        context = {
+            "receipt_id": db.scalar(
+                select(models.Receipt.id).where(models.Receipt.user_id == user.id).order_by(models.Receipt.id.desc()).limit(1)
+            ),
+            "invoice_id": db.scalar(
+                select(models.Invoice.id).where(models.Invoice.user_id == user.id).order_by(models.Invoice.id.desc()).limit(1)
+            ),
+            "customer_prefix": db.scalar(
+                select(models.Customer.search_name).where(models.Customer.user_id == user.id, models.Customer.search_name.is_not(None))
+                .order_by(models.Customer.document_count.desc()).limit(1)
+            ),
+            "product_prefix": db.scalar(
+                select(models.Product.key).join(models.Business, models.Business.id == models.Product.business_id)
+                .where(models.Business.user_id == user.id).order_by(models.Product.usage_count.desc()).limit(1)
+            ),
+        }
+    for name in ("customer_prefix", "product_prefix"):
+        if context[name]:
+            context[name] = context[name][:2]
+    cursor = None
+    for _ in range(9):
+        cursor = client.get(
+            "/api/history/timeline?limit=50" + (f"&cursor={cursor}" if cursor else ""), headers=headers
+        ).json().get("next_cursor")
+        if cursor is None:
+            break
+    context["timeline_cursor"] = cursor
+    context["day_token"] = encode_sync_token(datetime.now(timezone.utc) - timedelta(days=1))
+    return context
+
+def measure(client: TestClient, counter: QueryCounter, path: str, headers: dict, runs: int) -> dict:
+    client.get(path, headers=headers)
+    samples = []
+    for _ in range(runs):
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+    samples.sort()
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[math.ceil(0.95 * len(samples)) - 1],
+        "max": samples[-1],
+        "queries": counter.count,
+        "size": len(response.content),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="timed requests per scenario, after one warm-up")
+    parser.add_argument("--user", action="append", default=[], help="email of a user to benchmark (repeatable)")
+    parser.add_argument("--scenario", action="append", default=[], help="only run this scenario (repeatable)")
+    args = parser.parse_args()
+
+    client = TestClient(app)
+    counter = QueryCounter()
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario[0] in args.scenario]
+    for label, user in pick_users(args.user):
+        headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': user.email})}"}
+        context = user_context(client, headers, user)
+        print(f"\n{label}: {user.email}")
+        print(f"{'scenario':<20} {'median ms':>10} {'p95 ms':>10} {'max ms':>10} {'queries':>8} {'KB':>10}")
+        for name, template in scenarios:
+            if any(value is None and "{" + key + "}" in template for key, value in context.items()):
+                continue
+            result = measure(client, counter, template.format(**context), headers, args.runs)
+            print(
+                f"{name:<20} {result['median'] * 1000:10.1f} {result['p95'] * 1000:10.1f} {result['max'] * 1000:10.1f}"
+                f" {result['queries']:8d} {result['size'] / 1024:10.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold start benchmark
+
+Measures how long `import main` takes and how long a fresh server process
+needs to answer its first request. Run from the backend directory:
+
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started)"
+)
+
+def measure_import() -> float:
+    """Seconds spent importing the app in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_first_request(path: str, headers: dict, timeout: float) -> float:
+    """Seconds from spawning uvicorn until `path` first answers 2xx/3xx"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers)
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    if response.status < 400:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"{path} did not succeed within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def summarize(label: str, samples: list) -> None:
+    print(
+        f"{label:<16} median {statistics.median(samples) * 1000:8.1f} ms"
+        f"   min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/api/health", help="endpoint used as the first request")
+    parser.add_argument("--token", help="bearer token for authenticated paths")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    summarize("import", [measure_import() for _ in range(args.runs)])
+    summarize("first request", [
+        measure_first_request(args.path, headers, args.timeout) for _ in range(args.runs)
+    ])
+
+if __name__ == "__main__":
+    main()
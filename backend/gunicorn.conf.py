@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for running the API in production
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Each worker is a uvicorn event loop in its own process. `kill -HUP <master>`
+restarts workers gracefully; for a code upgrade without dropped connections
+send USR2 (starts a new master) and then QUIT to the old master.
+"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# The settings below (WEB_CONCURRENCY, DB_MAX_CONNECTIONS, ...) are read before
+# the app, which loads .env itself, is imported
+load_dotenv()
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Async workers each use a whole core, so one per core is enough
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Drain in-flight requests for this long on restart or shutdown; open event
+# streams are closed at the deadline and their clients reconnect
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Recycle each worker after a number of requests to bound memory growth;
+# jitter keeps workers from restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+# Split the database connection budget across workers. The event listener
+# holds one extra connection per worker outside the pool.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+if DB_MAX_CONNECTIONS:
+    per_worker = max(1, DB_MAX_CONNECTIONS // workers - 1)
+    os.environ.setdefault("DB_POOL_SIZE", str(per_worker))
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+
+def post_fork(server, worker):
+    # Connections opened by the preloaded app in the master must not be shared
+    from app.database import engine, read_engine
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
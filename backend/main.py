@@ -1,15 +1,16 @@
 """
 FastAPI Backend for Receipt and Invoice Generator
 """
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-import os
+import asyncio
 
 from app.database import engine, Base
-from app.routers import auth, business, receipts, invoices, history, upload
+from app import audit, cache, compression, document_cache, events, exporter, mailer, profiling, ratelimit, startup
+from app.routers import auth, business, receipts, invoices, history, upload, stream, imports, emails, share, exports, customers, products, profiles, recurring, dashboard, audit as audit_routes
 
 # Note: Database tables are created via Alembic migrations
 # Run: alembic upgrade head
@@ -22,9 +23,21 @@ async def lifespan(app: FastAPI):
     # Tables are created via migrations (alembic upgrade head)
     # Uncomment below only for quick development/testing
     # Base.metadata.create_all(bind=engine)
+    loop = asyncio.get_running_loop()
+    events.start(loop)
+    # Email workers only run when SMTP is configured
+    mailer.start()
+    audit.start()
+    upload.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    # Warm up in the background so the server accepts requests straight away
+    loop.run_in_executor(None, startup.warm_up)
     yield
     # Shutdown
-    pass
+    events.stop()
+    mailer.stop()
+    # Flush queued audit events before the process exits
+    audit.stop()
+    exporter.shutdown()
 
 app = FastAPI(
     title="Receipt & Invoice Generator API",
@@ -40,19 +53,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser read when a user's document lists stop (see app/archive.py)
+    expose_headers=["X-Archived-Until"],
 )
 
+# Gzip large JSON and HTML responses
+app.add_middleware(compression.CompressionMiddleware)
+
+# Opt-in request profiling (PROFILE_TOKEN / PROFILE_SAMPLE_RATE)
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(business.router, prefix="/api/business", tags=["Business"])
 app.include_router(receipts.router, prefix="/api/receipts", tags=["Receipts"])
 app.include_router(invoices.router, prefix="/api/invoices", tags=["Invoices"])
+app.include_router(recurring.router, prefix="/api/recurring-invoices", tags=["Recurring Invoices"])
 app.include_router(history.router, prefix="/api/history", tags=["History"])
+app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
 app.include_router(upload.router, prefix="/api/upload", tags=["Upload"])
+app.include_router(stream.router, prefix="/api/events", tags=["Events"])
+app.include_router(imports.router, prefix="/api/imports", tags=["Imports"])
+app.include_router(emails.router, prefix="/api/emails", tags=["Emails"])
+app.include_router(customers.router, prefix="/api/customers", tags=["Customers"])
+app.include_router(products.router, prefix="/api/products", tags=["Products"])
+app.include_router(audit_routes.router, prefix="/api/audit", tags=["Audit"])
+app.include_router(profiles.router, prefix="/api/profiles", tags=["Profiling"])
+app.include_router(exports.router, prefix="/api/exports", tags=["Exports"])
+app.include_router(share.router, prefix="/api/share", tags=["Sharing"])
+app.include_router(share.public_router, prefix="/r", tags=["Sharing"])
 
 # Serve uploaded files
-if os.path.exists("uploads"):
-    app.mount("/api/uploads", StaticFiles(directory="uploads"), name="uploads")
+# The directory is created at startup, after the app is built
+app.mount("/api/uploads", StaticFiles(directory="uploads", check_dir=False), name="uploads")
 
 @app.get("/")
 async def root():
@@ -62,6 +95,21 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+# Operational counters are for operators only: the profiling token is the admin credential
+@app.get("/api/metrics", dependencies=[Depends(profiling.require_admin)])
+async def metrics():
+    return {
+        "rate_limit": ratelimit.limiter.stats(),
+        "email": mailer.get_stats(),
+        "cache": cache.stats(),
+        "documents": document_cache.stats(),
+        "audit": audit.get_stats(),
+    }
+
+# After every route is registered: sync endpoints attach to profiles as they start
+profiling.instrument(app)
+
 if __name__ == "__main__":
+    # Single-process development server; production uses gunicorn.conf.py
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
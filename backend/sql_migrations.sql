@@ -130,6 +130,268 @@ CREATE INDEX IF NOT EXISTS ix_challenges_id ON challenges(id);
 CREATE INDEX IF NOT EXISTS ix_challenges_receipt_id ON challenges(receipt_id);
 CREATE INDEX IF NOT EXISTS ix_challenges_invoice_id ON challenges(invoice_id);
 
+-- 6. Delta sync: updated_at is set on every write and indexed per owner
+ALTER TABLE receipts ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE invoices ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP;
+UPDATE receipts SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE invoices SET updated_at = created_at WHERE updated_at IS NULL;
+
+ALTER TABLE challenges ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id) ON DELETE CASCADE;
+-- No default yet: a default would stamp every existing challenge with the migration time
+ALTER TABLE challenges ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+UPDATE challenges c SET user_id = r.user_id FROM receipts r WHERE c.receipt_id = r.id AND c.user_id IS NULL;
+UPDATE challenges c SET user_id = i.user_id FROM invoices i WHERE c.invoice_id = i.id AND c.user_id IS NULL;
+UPDATE challenges SET updated_at = COALESCE(resolved_at, created_at) WHERE updated_at IS NULL;
+ALTER TABLE challenges ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS ix_receipts_user_id_updated_at ON receipts(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS ix_invoices_user_id_updated_at ON invoices(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS ix_challenges_user_id_updated_at ON challenges(user_id, updated_at);
+
+-- 7. Cold archive for documents past the retention horizon (see app/jobs/archive.py)
+CREATE TABLE IF NOT EXISTS archived_documents (
+    id SERIAL PRIMARY KEY,
+    document_type VARCHAR NOT NULL,
+    document_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    business_id INTEGER NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    number VARCHAR NOT NULL,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    status VARCHAR,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_archived_documents_document UNIQUE (document_type, document_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_archived_documents_id ON archived_documents(id);
+CREATE INDEX IF NOT EXISTS ix_archived_documents_user_id_created_at ON archived_documents(user_id, created_at);
+
+-- Monthly partitioning of receipts and invoices is a separate, one-off
+-- conversion: see sql_partitioning.sql
+
+-- 8. Bulk import jobs (see app/importer.py)
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    business_id INTEGER NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    document_type VARCHAR NOT NULL,
+    filename VARCHAR NOT NULL,
+    status VARCHAR DEFAULT 'pending',
+    progress DOUBLE PRECISION DEFAULT 0.0,
+    rows_processed INTEGER DEFAULT 0,
+    documents_imported INTEGER DEFAULT 0,
+    documents_failed INTEGER DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_import_jobs_id ON import_jobs(id);
+CREATE INDEX IF NOT EXISTS ix_import_jobs_user_id ON import_jobs(user_id);
+
+-- 9. Email outbox (see app/mailer.py)
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    document_type VARCHAR NOT NULL,
+    document_id INTEGER NOT NULL,
+    recipient VARCHAR NOT NULL,
+    status VARCHAR DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_email_outbox_id ON email_outbox(id);
+CREATE INDEX IF NOT EXISTS ix_email_outbox_user_id ON email_outbox(user_id);
+CREATE INDEX IF NOT EXISTS ix_email_outbox_status_next_attempt_at ON email_outbox(status, next_attempt_at);
+
+-- 10. PDF export jobs (see app/exporter.py)
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    document_type VARCHAR NOT NULL,
+    start_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    status VARCHAR DEFAULT 'pending',
+    progress DOUBLE PRECISION DEFAULT 0.0,
+    documents_total INTEGER DEFAULT 0,
+    documents_exported INTEGER DEFAULT 0,
+    file_size INTEGER,
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_export_jobs_id ON export_jobs(id);
+CREATE INDEX IF NOT EXISTS ix_export_jobs_user_id ON export_jobs(user_id);
+
+-- 11. Soft delete for receipts (PATCH /api/receipts/bulk)
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS voided_at TIMESTAMP WITH TIME ZONE;
+
+-- 12. Customer directory (see app/customers.py); fill it with
+--     python -m app.jobs.backfill_customers
+CREATE TABLE IF NOT EXISTS customers (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    key VARCHAR NOT NULL,
+    name VARCHAR,
+    email VARCHAR,
+    phone VARCHAR,
+    address TEXT,
+    tax_id VARCHAR,
+    search_name VARCHAR,
+    document_count INTEGER NOT NULL DEFAULT 0,
+    last_used_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_customers_user_id_key UNIQUE (user_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_customers_id ON customers(id);
+-- text_pattern_ops lets LIKE 'prefix%' use the index whatever the database collation
+CREATE INDEX IF NOT EXISTS ix_customers_user_id_search_name ON customers(user_id, search_name text_pattern_ops);
+CREATE INDEX IF NOT EXISTS ix_customers_user_id_email ON customers(user_id, email text_pattern_ops);
+
+-- 13. Product catalog (see app/catalog.py); fill it with
+--     python -m app.jobs.backfill_products
+CREATE TABLE IF NOT EXISTS products (
+    id SERIAL PRIMARY KEY,
+    business_id INTEGER NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    key VARCHAR NOT NULL,
+    name VARCHAR NOT NULL,
+    description TEXT,
+    last_unit_price DOUBLE PRECISION,
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    last_used_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_products_business_id_key UNIQUE (business_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_products_id ON products(id);
+
+-- 14. Newest-first keyset scans for GET /api/history/timeline
+CREATE INDEX IF NOT EXISTS ix_receipts_user_id_created_at ON receipts(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_invoices_user_id_created_at ON invoices(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_challenges_user_id_created_at ON challenges(user_id, created_at, id);
+
+-- 15. Audit log (see app/audit.py)
+CREATE TABLE IF NOT EXISTS audit_events (
+    id SERIAL PRIMARY KEY,
+    business_id INTEGER NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    actor_id INTEGER,  -- no foreign key: events outlive the users who acted
+    action VARCHAR NOT NULL,
+    document_type VARCHAR,
+    document_id INTEGER,
+    changes_json TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_audit_events_business_id_id ON audit_events(business_id, id);
+CREATE INDEX IF NOT EXISTS ix_audit_events_business_id_document ON audit_events(business_id, document_type, document_id, id);
+
+-- Earlier versions nulled actor_id when a user was deleted, an UPDATE the trigger below rejects
+ALTER TABLE audit_events DROP CONSTRAINT IF EXISTS audit_events_actor_id_fkey;
+
+-- Append-only: rows can be inserted, never changed or deleted. The only
+-- deletes allowed are the cascade from deleting their business, which runs
+-- inside the foreign key's own trigger (pg_trigger_depth() > 1).
+CREATE OR REPLACE FUNCTION reject_audit_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND pg_trigger_depth() > 1 THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'audit_events is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS audit_events_append_only ON audit_events;
+DROP FUNCTION IF EXISTS reject_audit_update();
+CREATE TRIGGER audit_events_append_only
+    BEFORE UPDATE OR DELETE ON audit_events
+    FOR EACH ROW EXECUTE FUNCTION reject_audit_change();
+
+-- 16. Recurring invoice templates (see app/recurring.py); generate due invoices with
+--     python -m app.jobs.recurring_invoices
+CREATE TABLE IF NOT EXISTS recurring_invoices (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    business_id INTEGER NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    customer_name VARCHAR NOT NULL,
+    customer_email VARCHAR,
+    customer_phone VARCHAR,
+    customer_address TEXT,
+    customer_tax_id VARCHAR,
+    subtotal DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    tax_rate DOUBLE PRECISION DEFAULT 0.0,
+    tax_amount DOUBLE PRECISION DEFAULT 0.0,
+    discount DOUBLE PRECISION DEFAULT 0.0,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    payment_terms VARCHAR,
+    notes TEXT,
+    items_json TEXT NOT NULL,
+    frequency VARCHAR NOT NULL,
+    start_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_date TIMESTAMP WITH TIME ZONE,
+    due_days INTEGER NOT NULL DEFAULT 30,
+    send_email BOOLEAN NOT NULL DEFAULT FALSE,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    occurrences INTEGER NOT NULL DEFAULT 0,
+    next_run_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_generated_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_recurring_invoices_id ON recurring_invoices(id);
+CREATE INDEX IF NOT EXISTS ix_recurring_invoices_user_id ON recurring_invoices(user_id);
+CREATE INDEX IF NOT EXISTS ix_recurring_invoices_active_next_run_at ON recurring_invoices(active, next_run_at);
+
+-- 17. Dashboard counters (see app/dashboard.py); fill them with
+--     python -m app.jobs.repair_dashboard_stats
+CREATE TABLE IF NOT EXISTS dashboard_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    receipt_count INTEGER NOT NULL DEFAULT 0,
+    receipt_total DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    invoice_count INTEGER NOT NULL DEFAULT 0,
+    invoice_total DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    pending_invoice_count INTEGER NOT NULL DEFAULT 0,
+    pending_invoice_total DOUBLE PRECISION NOT NULL DEFAULT 0.0,
+    open_challenge_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 18. Business header snapshots on documents (see app/snapshots.py); fill older
+--     documents with python -m app.jobs.backfill_snapshots
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS business_snapshot TEXT;
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS business_logo_url VARCHAR;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS business_snapshot TEXT;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS business_logo_url VARCHAR;
+ALTER TABLE archived_documents ADD COLUMN IF NOT EXISTS business_logo_url VARCHAR;
+
+-- Upload cleanup keeps logos that documents still show
+CREATE INDEX IF NOT EXISTS ix_receipts_business_logo_url ON receipts(business_logo_url);
+CREATE INDEX IF NOT EXISTS ix_invoices_business_logo_url ON invoices(business_logo_url);
+CREATE INDEX IF NOT EXISTS ix_archived_documents_business_logo_url ON archived_documents(business_logo_url);
+
+-- 19. Archived documents keep their numbers (see app/numbering.py)
+CREATE INDEX IF NOT EXISTS ix_archived_documents_document_type_number ON archived_documents(document_type, number);
+
+-- 20. Per-user change counter for list and document ETags (see app/etags.py)
+ALTER TABLE dashboard_stats ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+-- 21. Export ZIPs are deleted after EXPORT_RETENTION_HOURS (see app/exporter.py)
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITH TIME ZONE;
+CREATE INDEX IF NOT EXISTS ix_export_jobs_expires_at ON export_jobs(expires_at);
+
 -- Verify tables were created
 SELECT 
     table_name,
@@ -0,0 +1,186 @@
+-- Monthly range partitioning for receipts and invoices (PostgreSQL 13+)
+-- Run once, after sql_migrations.sql, in a maintenance window: the tables are
+-- rebuilt and rows are copied into the partitioned versions.
+--
+-- Afterwards:
+--   * python -m app.jobs.partitions   creates upcoming monthly partitions and
+--                                     drops old ones that archiving has emptied;
+--                                     run it before each month starts (daily
+--                                     from cron). Rows for a month without a
+--                                     partition land in *_default, and the job
+--                                     moves them into partitions of their own
+--   * python -m app.jobs.archive      moves documents past the retention
+--                                     horizon into archived_documents
+--
+-- PostgreSQL requires the partition key in every unique constraint, so the
+-- primary keys become (id, created_at). Document numbers are instead claimed
+-- in document_numbers, a plain table that also holds the numbers of archived
+-- documents, and foreign keys from challenges to the partitioned tables are
+-- replaced by triggers that check the same things.
+
+BEGIN;
+
+-- Creates one partition per month starting at first_month
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_month DATE, months INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', first_month) + make_interval(months => i))::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_p' || to_char(month_start, 'YYYYMM'),
+            parent,
+            month_start,
+            (month_start + interval '1 month')::date
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Number of months from the oldest row through three months ahead
+CREATE OR REPLACE FUNCTION months_to_cover(oldest TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER AS $$
+    SELECT (
+        EXTRACT(YEAR FROM age(date_trunc('month', now()), date_trunc('month', oldest))) * 12
+        + EXTRACT(MONTH FROM age(date_trunc('month', now()), date_trunc('month', oldest)))
+    )::INTEGER + 4;
+$$ LANGUAGE sql;
+
+-- Every receipt and invoice number ever issued, live or archived
+CREATE TABLE IF NOT EXISTS document_numbers (
+    document_type VARCHAR NOT NULL,
+    number VARCHAR NOT NULL,
+    PRIMARY KEY (document_type, number)
+);
+
+INSERT INTO document_numbers (document_type, number)
+    SELECT document_type, number FROM archived_documents;
+
+-- Claims the new row's number; a duplicate fails the insert with a unique violation.
+-- Numbers stay claimed when the row is archived or deleted.
+CREATE OR REPLACE FUNCTION claim_document_number() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO document_numbers (document_type, number)
+        VALUES (TG_ARGV[0], to_jsonb(NEW) ->> TG_ARGV[1]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- What the dropped foreign keys checked: a challenge references an existing
+-- document, which is locked until the challenge commits so it cannot be
+-- archived meanwhile
+CREATE OR REPLACE FUNCTION check_challenge_document() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.receipt_id IS NOT NULL THEN
+        PERFORM 1 FROM receipts WHERE id = NEW.receipt_id FOR KEY SHARE;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'receipt % does not exist', NEW.receipt_id USING ERRCODE = 'foreign_key_violation';
+        END IF;
+    END IF;
+    IF NEW.invoice_id IS NOT NULL THEN
+        PERFORM 1 FROM invoices WHERE id = NEW.invoice_id FOR KEY SHARE;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'invoice % does not exist', NEW.invoice_id USING ERRCODE = 'foreign_key_violation';
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Challenged documents cannot be deleted (or archived, which deletes them)
+CREATE OR REPLACE FUNCTION reject_challenged_delete() RETURNS TRIGGER AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM challenges WHERE (CASE TG_ARGV[0] WHEN 'receipt' THEN receipt_id ELSE invoice_id END) = OLD.id) THEN
+        RAISE EXCEPTION '% % is still referenced by challenges', TG_ARGV[0], OLD.id USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE challenges DROP CONSTRAINT IF EXISTS fk_challenges_receipt_id;
+ALTER TABLE challenges DROP CONSTRAINT IF EXISTS challenges_receipt_id_fkey;
+ALTER TABLE challenges DROP CONSTRAINT IF EXISTS fk_challenges_invoice_id;
+ALTER TABLE challenges DROP CONSTRAINT IF EXISTS challenges_invoice_id_fkey;
+
+-- 1. Receipts
+ALTER TABLE receipts RENAME TO receipts_unpartitioned;
+UPDATE receipts_unpartitioned SET created_at = date WHERE created_at IS NULL;
+
+CREATE TABLE receipts (LIKE receipts_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY RANGE (created_at);
+ALTER TABLE receipts ALTER COLUMN created_at SET NOT NULL;
+-- Catches rows for months without a partition until app.jobs.partitions moves them
+CREATE TABLE receipts_default PARTITION OF receipts DEFAULT;
+SELECT create_monthly_partitions(
+    'receipts',
+    COALESCE(min(created_at), now())::date,
+    months_to_cover(COALESCE(min(created_at), now()))
+) FROM receipts_unpartitioned;
+
+INSERT INTO receipts SELECT * FROM receipts_unpartitioned;
+ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id;
+INSERT INTO document_numbers (document_type, number)
+    SELECT 'receipt', receipt_number FROM receipts_unpartitioned;
+DROP TABLE receipts_unpartitioned;
+
+ALTER TABLE receipts ADD CONSTRAINT receipts_pkey PRIMARY KEY (id, created_at);
+CREATE TRIGGER receipts_claim_number
+    AFTER INSERT ON receipts
+    FOR EACH ROW EXECUTE FUNCTION claim_document_number('receipt', 'receipt_number');
+CREATE TRIGGER receipts_challenged_delete
+    AFTER DELETE ON receipts
+    FOR EACH ROW EXECUTE FUNCTION reject_challenged_delete('receipt');
+ALTER TABLE receipts ADD CONSTRAINT fk_receipts_user_id FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE receipts ADD CONSTRAINT fk_receipts_business_id FOREIGN KEY (business_id) REFERENCES businesses(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS ix_receipts_id ON receipts(id);
+CREATE INDEX IF NOT EXISTS ix_receipts_receipt_number ON receipts(receipt_number);
+CREATE INDEX IF NOT EXISTS ix_receipts_business_id ON receipts(business_id);
+CREATE INDEX IF NOT EXISTS ix_receipts_user_id_updated_at ON receipts(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS ix_receipts_user_id_created_at ON receipts(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_receipts_business_logo_url ON receipts(business_logo_url);
+
+-- 2. Invoices
+ALTER TABLE invoices RENAME TO invoices_unpartitioned;
+UPDATE invoices_unpartitioned SET created_at = issue_date WHERE created_at IS NULL;
+
+CREATE TABLE invoices (LIKE invoices_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY RANGE (created_at);
+ALTER TABLE invoices ALTER COLUMN created_at SET NOT NULL;
+-- Catches rows for months without a partition until app.jobs.partitions moves them
+CREATE TABLE invoices_default PARTITION OF invoices DEFAULT;
+SELECT create_monthly_partitions(
+    'invoices',
+    COALESCE(min(created_at), now())::date,
+    months_to_cover(COALESCE(min(created_at), now()))
+) FROM invoices_unpartitioned;
+
+INSERT INTO invoices SELECT * FROM invoices_unpartitioned;
+ALTER SEQUENCE invoices_id_seq OWNED BY invoices.id;
+INSERT INTO document_numbers (document_type, number)
+    SELECT 'invoice', invoice_number FROM invoices_unpartitioned;
+DROP TABLE invoices_unpartitioned;
+
+ALTER TABLE invoices ADD CONSTRAINT invoices_pkey PRIMARY KEY (id, created_at);
+CREATE TRIGGER invoices_claim_number
+    AFTER INSERT ON invoices
+    FOR EACH ROW EXECUTE FUNCTION claim_document_number('invoice', 'invoice_number');
+CREATE TRIGGER invoices_challenged_delete
+    AFTER DELETE ON invoices
+    FOR EACH ROW EXECUTE FUNCTION reject_challenged_delete('invoice');
+ALTER TABLE invoices ADD CONSTRAINT fk_invoices_user_id FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE invoices ADD CONSTRAINT fk_invoices_business_id FOREIGN KEY (business_id) REFERENCES businesses(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS ix_invoices_id ON invoices(id);
+CREATE INDEX IF NOT EXISTS ix_invoices_invoice_number ON invoices(invoice_number);
+CREATE INDEX IF NOT EXISTS ix_invoices_business_id ON invoices(business_id);
+CREATE INDEX IF NOT EXISTS ix_invoices_user_id_updated_at ON invoices(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS ix_invoices_user_id_created_at ON invoices(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_invoices_business_logo_url ON invoices(business_logo_url);
+
+-- 3. Challenge references
+CREATE TRIGGER challenges_document_exists
+    BEFORE INSERT OR UPDATE OF receipt_id, invoice_id ON challenges
+    FOR EACH ROW EXECUTE FUNCTION check_challenge_document();
+
+COMMIT;
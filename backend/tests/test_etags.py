@@ -0,0 +1,63 @@
+"""
+Regression test: list, history and document ETags change with every write
+
+updated_at has second resolution on SQLite, so two updates within the same
+second used to leave count(*) + max(updated_at) unchanged and a stale copy
+was confirmed with 304. Run from the backend directory:
+
+    python -m pytest tests
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "etags.db")
+
+import pytest
+from fastapi.testclient import TestClient
+import main
+from app.database import Base, engine
+
+ITEM = {"name": "Widget", "unit_price": 2.5, "quantity": 2, "total": 5.0}
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/api/auth/register", json={"email": "etag@example.com", "password": "pw"})
+    token = client.post(
+        "/api/auth/login", data={"username": "etag@example.com", "password": "pw"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post(
+        "/api/business/",
+        json={"name": "B", "address": "A", "city": "C", "state": "S", "zip_code": "Z"},
+        headers=headers
+    )
+    return headers
+
+def create_invoice(client, headers) -> dict:
+    body = {"subtotal": 5, "total": 5, "items": [ITEM], "customer_name": "Bob"}
+    return client.post("/api/invoices/", json=body, headers=headers).json()
+
+def test_update_in_same_second_changes_etags(client, headers):
+    first, second = create_invoice(client, headers), create_invoice(client, headers)
+    client.patch(f"/api/invoices/{first['id']}", json={"status": "paid"}, headers=headers)
+
+    paths = ("/api/invoices/", "/api/history/", f"/api/invoices/{second['id']}")
+    etags = {path: client.get(path, headers=headers).headers["etag"] for path in paths}
+    client.patch(f"/api/invoices/{second['id']}", json={"status": "paid"}, headers=headers)
+
+    for path, etag in etags.items():
+        response = client.get(path, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200, path
+    invoices = client.get("/api/invoices/", headers=headers).json()
+    assert {invoice["status"] for invoice in invoices} == {"paid"}
+
+def test_unchanged_list_is_not_modified(client, headers):
+    etag = client.get("/api/invoices/", headers=headers).headers["etag"]
+    response = client.get("/api/invoices/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
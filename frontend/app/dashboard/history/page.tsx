@@ -29,6 +29,7 @@ export default function HistoryPage() {
   const [receipts, setReceipts] = useState<any[]>([])
   const [invoices, setInvoices] = useState<any[]>([])
   const [activeTab, setActiveTab] = useState<'receipts' | 'invoices'>('receipts')
+  const [archivedUntil, setArchivedUntil] = useState<string | null>(null)
 
   useEffect(() => {
     loadHistory()
@@ -39,6 +40,7 @@ export default function HistoryPage() {
       const res = await api.get('/api/history/')
       setReceipts(res.data.receipts || [])
       setInvoices(res.data.invoices || [])
+      setArchivedUntil(res.data.archived_until || null)
     } catch (err) {
       console.error('Failed to load history', err)
     } finally {
@@ -88,6 +90,12 @@ export default function HistoryPage() {
           </button>
         </div>
 
+        {archivedUntil && (
+          <p className="empty-history">
+            Documents created on or before {formatDate(archivedUntil)} have been archived and are not listed here.
+          </p>
+        )}
+
         <div className="history-list-premium">
           {activeTab === 'receipts' ? (
             receipts.length === 0 ? (
@@ -37,6 +37,7 @@ const IconInvoice = () => (
 export default function DashboardPage() {
   const [user, setUser] = useState<any>(null)
   const [business, setBusiness] = useState<any>(null)
+  const [summary, setSummary] = useState<any>(null)
   const [loading, setLoading] = useState(true)
 
   useEffect(() => {
@@ -54,6 +55,13 @@ export default function DashboardPage() {
       } catch (err) {
         setBusiness(null)
       }
+
+      try {
+        const summaryRes = await api.get('/api/dashboard/summary')
+        setSummary(summaryRes.data)
+      } catch (err) {
+        setSummary(null)
+      }
     } catch (err) {
       console.error(err)
     } finally {
@@ -122,6 +130,26 @@ export default function DashboardPage() {
             <span className="stat-label">Account Type</span>
             <span className="stat-value">Free Professional</span>
           </div>
+          {summary && (
+            <>
+              <div className="stat-card">
+                <span className="stat-label">Receipts</span>
+                <span className="stat-value">{summary.receipt_count} · ${summary.receipt_total.toFixed(2)}</span>
+              </div>
+              <div className="stat-card">
+                <span className="stat-label">Invoices</span>
+                <span className="stat-value">{summary.invoice_count} · ${summary.invoice_total.toFixed(2)}</span>
+              </div>
+              <div className="stat-card">
+                <span className="stat-label">Pending Invoices</span>
+                <span className="stat-value">{summary.pending_invoice_count} · ${summary.pending_invoice_total.toFixed(2)}</span>
+              </div>
+              <div className="stat-card">
+                <span className="stat-label">Open Challenges</span>
+                <span className="stat-value">{summary.open_challenge_count}</span>
+              </div>
+            </>
+          )}
         </div>
       </section>
     </>